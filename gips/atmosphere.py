@@ -35,19 +35,21 @@ import os
 import sys
 import datetime
 import commands
-import tempfile
-import shutil
+import time
+import subprocess
 import tarfile
 import re
 import glob
 import copy
+from multiprocessing.pool import ThreadPool
 
 import numpy
 import netCDF4
 import gippy
 
-from gips.utils import List2File, verbose_out
+from gips.utils import List2File, verbose_out, settings
 from gips import utils
+from gips import trace
 from gips.data.merra import merraData
 from gips.data.aod import aodData
 from gips.data.core import Data
@@ -97,10 +99,49 @@ def atmospheric_model(doy, lat):
     return model
 
 
+
+def run_models(runs, threads=None):
+    """Run independent radiative-transfer model runs concurrently.
+
+    runs is a list of (name, function, args) tuples, eg one per band; each
+    function should run its model in a working directory of its own.  The
+    models are external programs, so threads suffice to run them in parallel;
+    at most `threads` run at once (default: the ATMOSPHERE_THREADS setting,
+    or 4).  Returns {name: function's return value}, and reports each run's
+    time at verbosity 3.  The first run to fail raises its exception.
+    """
+    if threads is None:
+        threads = getattr(settings(), 'ATMOSPHERE_THREADS', 4)
+
+    def run(job):
+        name, function, args = job
+        start = time.time()
+        with trace.span('atmosphere-run', run=name):
+            result = function(*args)
+        return name, result, time.time() - start
+
+    results = {}
+    pool = ThreadPool(max(1, min(threads, len(runs))))
+    try:
+        for name, result, elapsed in pool.imap_unordered(run, runs):
+            verbose_out('Ran atmospheric model for {} in {:.1f}s'.format(name, elapsed), 3)
+            results[name] = result
+    finally:
+        pool.close()
+        pool.join()
+    return results
+
+
+def _run_sixs(s):
+    """Run a SixS instance, returning its outputs."""
+    s.run()
+    return s.outputs
+
 class SIXS():
     """ Class for running 6S atmospheric model """
     # TODO - genericize to move away from landsat specific
 
+    @trace.traced('atmosphere', model='6S')
     def __init__(self, bandnums, wavelengths, geometry, date_time, sensor=None):
         """ Run SixS atmospheric model using Py6S """
         start = datetime.datetime.now()
@@ -155,12 +196,14 @@ class SIXS():
             finally:
                 sys.stdout = saved_stdout
         else:
-            # Use wavelengths
-            outputs = []
-            for wv in wavelengths:
-                s.wavelength = Wavelength(wv[0], wv[1])
-                s.run()
-                outputs.append(s.outputs)
+            # Use wavelengths, running the bands in parallel
+            runs = []
+            for b, wv in zip(bandnums, wavelengths):
+                band_s = copy.deepcopy(s)
+                band_s.wavelength = Wavelength(wv[0], wv[1])
+                runs.append((b, _run_sixs, (band_s,)))
+            results = run_models(runs)
+            outputs = [results[b] for b in bandnums]
 
         self.results = {}
         verbose_out("{:>6} {:>8}{:>8}{:>8}".format('Band', 'T', 'Lu', 'Ld'), 4)
@@ -182,7 +225,9 @@ class MODTRAN():
     # hard-coded options
     filterfile = True
     _datadir = '/usr/local/modtran/DATA'
+    _executable = 'modtran'
 
+    @trace.traced('atmosphere', model='MODTRAN')
     def __init__(self, bandnum, wvlen1, wvlen2, dtime, lat, lon, profile=False):
         self.lat = lat
         self.lon = lon
@@ -196,14 +241,6 @@ class MODTRAN():
         #fout = open('atm.txt','w')
         #fout.write('{:>5}{:>20}{:>20}\n'.format('Band','%T','Radiance'))
 
-        tmpdir = tempfile.mkdtemp()
-        pwd = os.getcwd()
-        os.chdir(tmpdir)
-
-        # Create link to MODTRAN data dir
-        if not os.path.lexists('DATA'):
-            os.symlink(self._datadir, 'DATA')
-
         if profile:
             mprofile = merraData.profile(lon, lat, dtime)
             pressure = mprofile['pressure']
@@ -217,32 +254,40 @@ class MODTRAN():
         else:
             self.atmprofile = None
 
-        # Generate MODTRAN input files
+        # each run gets a directory of its own, so runs can go in parallel
+        with utils.make_temp_dir(prefix='modtran') as self.workdir:
+            # Create link to MODTRAN data dir
+            os.symlink(self._datadir, os.path.join(self.workdir, 'DATA'))
 
-        # Determine if radiance or transmittance mode
-        rootnames = self.addband(bandnum, wvlen1, wvlen2)
-        List2File(rootnames, 'mod5root.in')
+            # Generate MODTRAN input files
+
+            # Determine if radiance or transmittance mode
+            rootnames = self.addband(bandnum, wvlen1, wvlen2)
+            List2File(rootnames, os.path.join(self.workdir, 'mod5root.in'))
 
-        try:
             # run output and get results
-            modout = commands.getstatusoutput('modtran')
-            #VerboseOut("MODTRAN Output:", 4)
-            #[VerboseOut(m, 4) for m in modout]
-            self.output = self.readoutput(bandnum)
-            verbose_out('MODTRAN Output: %s' % ' '.join([str(s) for s in self.output]), 4)
-        except:
-            verbose_out(modout, 4)
-            raise
-
-        # Change back to original directory
-        os.chdir(pwd)
-
-        #print 'MODTRAN dir: ', tmpdir
-        # Remove directory
-        shutil.rmtree(tmpdir)
+            proc = subprocess.Popen([self._executable], cwd=self.workdir,
+                                    stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+            modout = proc.communicate()[0]
+            try:
+                self.output = self.readoutput(bandnum)
+                verbose_out('MODTRAN Output: %s' % ' '.join([str(s) for s in self.output]), 4)
+            except:
+                verbose_out(modout, 4)
+                raise
+
+    @classmethod
+    def run_bands(cls, bands, dtime, lat, lon, profile=False):
+        """Run MODTRAN for several bands in parallel (see run_models).
+
+        bands is a list of (bandnum, wvlen1, wvlen2) tuples; returns
+        {bandnum: MODTRAN instance}.
+        """
+        return run_models([(b[0], cls, tuple(b) + (dtime, lat, lon, profile))
+                           for b in bands])
 
     def readoutput(self, bandnum):
-        with open('band' + str(bandnum) + '.chn') as f:
+        with open(os.path.join(self.workdir, 'band' + str(bandnum) + '.chn')) as f:
             lines = f.readlines()
         data = lines[4 + bandnum]
         # Get nominal band width in microns
@@ -253,7 +298,7 @@ class MODTRAN():
         Ld = 0.0
         with utils.error_handler('Error calculating Ld, falling back to default (0.0)',
                                  continuable=True):
-            with open('band' + str(bandnum) + 'Ld.chn') as f:
+            with open(os.path.join(self.workdir, 'band' + str(bandnum) + 'Ld.chn')) as f:
                 lines = f.readlines()
             data = lines[4 + bandnum]
             # Convert channel radiance to spectral radiance
@@ -280,7 +325,7 @@ class MODTRAN():
             return (rootname1,)
 
     def tape5(self, fname, mode, wvlen1, wvlen2, fwhm, surref=0, h1=100):
-        f = open(fname + '.tp5', 'w')
+        f = open(os.path.join(self.workdir, fname + '.tp5'), 'w')
         f.write(self.card1(mode=mode, surref=surref) + '\n')
         f.write(self.card1a() + '\n')
         if self.filterfile:
@@ -85,7 +85,7 @@ class SpatialExtent(object):
 
     @classmethod
     def factory(cls, dataclass, site=None, rastermask=None,
-                key='', where='', tiles=None, pcov=0.0, ptile=0.0):
+                key='', where='', tiles=None, pcov=0.0, ptile=0.0, snapshot=False):
         """Create array of SpatialExtent instances.
 
         site is a path to a shapefile.
@@ -95,6 +95,8 @@ class SpatialExtent(object):
         where is an expression-like string used to filter the shapes in `site`.
         pcov and ptile are percentage thresholds used as filters (TODO
             specifics).
+        snapshot permits reusing tile coverage computed by an earlier run
+            with the same arguments, if the site & tiles vector are unchanged.
         """
         if tiles is not None:
             tiles = [dataclass.normalize_tile_string(t) for t in tiles]
@@ -114,21 +116,35 @@ class SpatialExtent(object):
             # both be passed from elsewhere. for now, preferentially
             # use rastermask if provided.
             if rastermask is not None:
-                vectorfile = os.path.join(os.path.dirname(rastermask), os.path.basename(rastermask)[:-4] + '.shp')
-                features = open_vector(utils.vectorize(rastermask, vectorfile), where='DN=1')
-                for f in features:
-                    extents.append(cls(dataclass, feature=f, rastermask=rastermask,
-                                        tiles=tiles, pcov=pcov, ptile=ptile))
+                features = open_vector(utils.rastermask_footprint(rastermask), where='DN=1')
             else:
                 features = open_vector(site, key, where)
-                for f in features:
-                    extents.append(cls(dataclass, feature=f, rastermask=rastermask,
-                                       tiles=tiles, pcov=pcov, ptile=ptile))
+            features = list(features)
+            coverages = [None] * len(features)
+            if snapshot:
+                # imported here to avoid a circular import
+                from gips.inventory import snapshot as inv_snapshot
+                snap_key = inv_snapshot.spatial_key(
+                    dataclass, site, rastermask, key, where, tiles, pcov, ptile)
+                snap_stamps = inv_snapshot.spatial_stamps(dataclass, site, rastermask)
+                cached = inv_snapshot.load(dataclass, 'spatial', snap_key)
+                if cached is not None and len(cached) == len(features):
+                    coverages = cached
+            for f, coverage in zip(features, coverages):
+                extents.append(cls(dataclass, feature=f, rastermask=rastermask,
+                                   tiles=tiles, pcov=pcov, ptile=ptile, coverage=coverage))
+            if snapshot and coverages != [e.coverage for e in extents]:
+                inv_snapshot.save(dataclass, 'spatial', snap_key,
+                                  [e.coverage for e in extents], snap_stamps)
         return extents
 
     def __init__(self, dataclass, tiles, pcov=None, ptile=None,
-                 feature=None, rastermask=None):
-        """ Create spatial extent with a GeoFeature instance or list of tiles """
+                 feature=None, rastermask=None, coverage=None):
+        """ Create spatial extent with a GeoFeature instance or list of tiles
+
+        coverage, if given, is the previously computed tile coverage of the
+        feature, so it needn't be intersected with the tiles vector again.
+        """
         self.repo = dataclass.Asset.Repository
 
         # TODO - try and close this and only open on demand (make site property)
@@ -136,7 +152,9 @@ class SpatialExtent(object):
         self.rastermask = rastermask
 
         if feature is not None:
-            tiles = self.repo.vector2tiles(feature, pcov, ptile, tiles)
+            if coverage is None:
+                coverage = self.repo.vector2tiles(feature, pcov, ptile, tiles)
+            tiles = coverage
             self.feature = (feature.Filename(), feature.LayerName(), feature.FID())
             self.sitename = feature.Basename()
         else:
@@ -202,11 +202,14 @@ class aodData(Data):
             # the list of asset types associated with this product
             'assets': ['MOD08'],  # , 'MYD08'],
             'composite': True,
+            'composite-source': 'aod',
+            'composite-by': 'doy',
         },
         'lta': {
             'description': 'Average AOD',
             'assets': ['MOD08'],
-            'composite': True
+            'composite': True,
+            'composite-source': 'aod',
         }
     }
 
@@ -220,95 +223,12 @@ class aodData(Data):
     #        utils.verbose_out(' -> %s: processed %s in %s' % (fout, product, datetime.datetime.now()-start))
 
     @classmethod
-    def initialize_composites(cls):
-        '''
-        This method is incomplete, but will ensure that the composites
-        directory is boostrapped for running process composites.
-
-        INCOMPLETE at this time.
-        '''
-        lta_tif = os.path.join(cls.Asset.Repository.path('composites'), 'lta.tif')
-        ltadpat = os.path.join(
-            cls.Asset.Repository.path('composites'),
-            'ltad',
-            'ltad???.tif'
-        )
-        ltad_tifs = glob.glob(ltadpat)
-        if os.path.exists(lta_tif) and len(ltad_tifs) == 366:
-            utils.verbose_out('lta composites already initialized', 2)
-            return
-        a = inv[inv.dates[0]].tiles[cls.Asset.Repository._the_tile].open('aod')
-        a[0] = a[0] * 0 + a[0].NoDataValue()
-        a.Process(ltatif)
-
-
-    @classmethod
-    def process_composites(cls, inventory, products, **kwargs):
-        '''
-        Currently inoperative do to absence of 'start_day' and 'end_day' from
-        DataInventory class.
-        '''
-        # since it is broken
-        raise NotImplementedError('Composite processing is currently broken')
-        cls.initialize_composites()
-        for product in products:
-            cpath = os.path.join(cls.Asset.Repository.path('composites'), 'ltad')
-            path = os.path.join(cpath, 'ltad')
-            # Calculate AOT long-term multi-year averages (lta) for given day
-            if product == 'ltad':
-                # tried this as a replacement for the 'for' below, but this
-                # doesn't make it work either.
-                # for day in range(
-                #         inventory.temporal.daybounds[0],
-                #         inventory.temporal.daybounds[1] + 1
-                # ):
-                for day in range(inventory.start_day, inventory.end_day + 1):
-                    dates = [d for d in inventory.dates if int(d.strftime('%j')) == day]
-                    filenames = [inventory[d].tiles[cls.Asset.Repository._the_tile].filenames['MOD', 'aod'] for d in dates]
-                    fout = path + '%s.tif' % str(day).zfill(3)
-                    cls.process_mean(filenames, fout)
-            # Calculate single average per pixel (all days and years)
-            if product == 'lta':
-                filenames = glob.glob(path + '*.tif')
-                if len(filenames) > 0:
-                    fout = os.path.join(cls.Asset.Repository.path('composites'), 'lta.tif')
-                    cls.process_mean(filenames, fout)
-                else:
-                    raise Exception('No daily LTA files exist!')
-
-    @classmethod
-    def process_mean(cls, filenames, fout):
-        """ Calculates mean of all filenames, and per pixel variances """
-        start = datetime.datetime.now()
-        if len(filenames) > 0:
-            img = gippy.GeoImage(filenames)
-            imgout = gippy.GeoImage(fout, img, gippy.GDT_Float32, 2)
-            imgout.SetNoData(-32768)
-            img.Mean(imgout[0])
-            meanimg = imgout[0].Read()
-            for band in range(0, img.NumBands()):
-                data = img[band].Read()
-                mask = img[band].DataMask()
-                var = numpy.multiply(numpy.power(data - meanimg, 2), mask)
-                if band == 0:
-                    totalvar = var
-                    counts = mask
-                else:
-                    totalvar = totalvar + var
-                    counts = counts + mask
-            inds = numpy.where(counts == 0)
-            totalvar[inds] = -32768
-            inds = numpy.where(counts != 0)
-            totalvar[inds] = numpy.divide(totalvar[inds], counts[inds])
-            imgout[1].Write(totalvar)
-            t = datetime.datetime.now() - start
-            utils.verbose_out(
-                '%s: mean/var for %s files processed in %s' %
-                (os.path.basename(fout), len(filenames), t)
-            )
-        else:
-            raise Exception('No filenames provided')
-        return imgout
+    def composite_filename(cls, product, tile, key=''):
+        """Long-term averages live at composites/ltad/ltadDDD.tif & composites/lta.tif."""
+        cpath = cls.Asset.Repository.path('composites')
+        if product == 'ltad':
+            return os.path.join(cpath, 'ltad', 'ltad{}.tif'.format(key))
+        return os.path.join(cpath, product + '.tif')
 
     @classmethod
     def _read_point(cls, filename, roi, nodata):
@@ -367,7 +287,6 @@ class aodData(Data):
         if numpy.isnan(aod):
             day = date.strftime('%j')
             repo = cls.Asset.Repository
-            cpath = repo.path('composites')
             nodata = -32768
 
             source = 'Weighted estimate using MODIS LTA values'
@@ -397,11 +316,12 @@ class aodData(Data):
                 return aod, norm
 
             # LTA-Daily
-            filename = os.path.join(cpath, 'ltad', 'ltad%s.tif' % str(day).zfill(4))
+            filename = cls.composite_filename('ltad', repo._the_tile, day)
             daily_aod, daily_norm = _calculate_estimate(filename)
 
             # LTA
-            lta_aod, lta_norm = _calculate_estimate(os.path.join(cpath, 'lta.tif'))
+            lta_aod, lta_norm = _calculate_estimate(
+                cls.composite_filename('lta', repo._the_tile))
 
             if numpy.isnan(lta_aod):
                 raise Exception("Could not retrieve AOD")
@@ -31,6 +31,10 @@ class chirpsRepository(Repository):
     name = 'CHIRPS'
     description = 'Climate Hazards Group InfraRed Precipitation with Station data'
     _tile_attribute = 'tileid'
+    default_settings = {
+        'vsi-products': 'symlink',
+        'vsi-compression': 'DEFLATE',
+    }
 
 # sort of a singleton driver:  one asset, one sensor, one product, set them here
 _tile_id = 'global'
@@ -156,9 +160,10 @@ class chirpsData(Data):
         """Produce data products and save them to files.
 
         Only one product; it's processed in the usual way, but for this
-        driver, it's extracted from the gzip file and saved (not
-        symlink/vsi).  Method signature is largely for campatibilty with
-        the rest of gips, eg kwargs is unused.
+        driver, it's a symlink to the gzipped asset (/vsigzip/), or a tiled
+        GeoTIFF extracted from it, per the 'vsi-products' setting.  Method
+        signature is largely for campatibilty with the rest of gips, eg
+        kwargs is unused.
         """
         needed_products = self.needed_products(products, overwrite)
         if len(needed_products) == 0:
@@ -176,6 +181,6 @@ class chirpsData(Data):
             temp_fp = self.temp_product_filename(_sensor, _product_type)
             # make gdal/gippy-readable path to the inner file
             vsi_inner_path = '/vsigzip/' + asset.filename
-            os.symlink(vsi_inner_path, temp_fp)
+            self.write_vsi_product(vsi_inner_path, temp_fp)
             archive_fp = self.archive_temp_path(temp_fp)
             self.AddFile(_sensor, _product_type, archive_fp)
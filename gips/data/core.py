@@ -29,10 +29,20 @@ from datetime import datetime, timedelta
 import glob
 import re
 from itertools import groupby
+from contextlib import closing, contextmanager
+from collections import OrderedDict
+from multiprocessing.pool import ThreadPool
+import Queue
 from shapely.wkt import loads
 import tarfile
 import zipfile
 import json
+import hashlib
+import base64
+import threading
+import atexit
+import time
+import socket
 import traceback
 import ftplib
 import shutil
@@ -46,6 +56,7 @@ import argparse
 from backports.functools_lru_cache import lru_cache
 import requests
 import backoff
+import numpy
 
 import gippy
 from gippy.algorithms import CookieCutter
@@ -53,6 +64,7 @@ from gips import __version__
 from gips.utils import (settings, VerboseOut, RemoveFiles, File2List, List2File, Colors,
         basename, mkdir, open_vector)
 from gips import utils
+from gips import trace
 from ..inventory import dbinv, orm
 
 
@@ -101,6 +113,354 @@ def _gs_stop_trying(e):
             and not (499 < e.response.status_code < 600))
 
 
+class BlockCache(object):
+    """Persistent, size-bounded cache of remote objects' bytes, kept on disk.
+
+    Objects are read with HTTP Range requests in blocks of block_size bytes;
+    each block is kept as a file named for its URL's hash & its block number.
+    Blocks are evicted least recently used first once they take up more than
+    max_bytes.  Hits & misses for all caches in the process are tallied in
+    stats and reported when the process exits.
+    """
+    stats = {'hits': 0, 'misses': 0, 'bytes-saved': 0, 'bytes-fetched': 0}
+    _stats_lock = threading.Lock()
+    _default = None
+
+    def __init__(self, directory, max_bytes, block_size=4 * 1024 ** 2, max_time=None):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.block_size = block_size
+        self.max_time = (GoogleStorageMixin._gs_backoff_max
+                         if max_time is None else max_time)
+
+    @classmethod
+    def default(cls):
+        """Return the cache configured by BLOCK_CACHE_SIZE, or None if it's off."""
+        max_bytes = getattr(settings(), 'BLOCK_CACHE_SIZE', 0)
+        if not max_bytes:
+            return None
+        if cls._default is None or cls._default.max_bytes != max_bytes:
+            cls._default = cls(utils.cache_path('blocks'), max_bytes)
+        return cls._default
+
+    @classmethod
+    def report(cls):
+        """Print the hit ratio & bytes saved, if the cache was used."""
+        st = cls.stats
+        reads = st['hits'] + st['misses']
+        if reads == 0:
+            return
+        utils.verbose_out(
+            'Block cache: {} of {} blocks read from cache ({:.1f}%),'
+            ' {:.1f} MB saved, {:.1f} MB fetched'.format(
+                st['hits'], reads, 100.0 * st['hits'] / reads,
+                st['bytes-saved'] / 1024.0 ** 2,
+                st['bytes-fetched'] / 1024.0 ** 2), 2)
+
+    def _path(self, url, block=None):
+        key = hashlib.sha1(url).hexdigest()
+        return os.path.join(self.directory, key + (
+            '.size' if block is None else '.{}'.format(block)))
+
+    def _tally(self, **counts):
+        with self._stats_lock:
+            for k, v in counts.items():
+                self.stats[k.replace('_', '-')] += v
+
+    def size(self, url):
+        """Return the length of the object at url, fetching its first block if needed."""
+        if not os.path.exists(self._path(url)):
+            list(self._fetch_blocks(url, 0, 0))
+        with open(self._path(url)) as f:
+            return int(f.read())
+
+    def blocks(self, url, offset=0, length=None):
+        """Generate the contents of the blocks covering the given byte range.
+
+        Runs of missing blocks are fetched one request per run.
+        """
+        end = self.size(url)
+        if length is not None:
+            end = min(offset + length, end)
+        if end <= offset:
+            return
+        first, last = offset // self.block_size, (end - 1) // self.block_size
+        block = first
+        while block <= last:
+            path = self._path(url, block)
+            try:
+                with open(path, 'rb') as f:
+                    data = f.read()
+                os.utime(path, None) # mark as recently used
+            except (IOError, OSError): # not cached, or just evicted
+                data = None
+            if data is not None:
+                self._tally(hits=1, bytes_saved=len(data))
+                yield data
+                block += 1
+                continue
+            run_end = block
+            while run_end < last and not os.path.exists(self._path(url, run_end + 1)):
+                run_end += 1
+            for data in self._fetch_blocks(url, block, run_end):
+                yield data
+            block = run_end + 1
+
+    def read(self, url, offset=0, length=None):
+        """Return the given byte range of the object at url (default: all of it)."""
+        data = ''.join(self.blocks(url, offset, length))
+        start = offset % self.block_size
+        end = None if length is None else start + length
+        return data[start:end]
+
+    def copy(self, url, dst):
+        """Write the whole object at url to dst."""
+        with open(dst, 'wb') as f:
+            for data in self.blocks(url):
+                f.write(data)
+
+    def _fetch_blocks(self, url, first, last):
+        """Generate blocks first through last, fetching them into the cache.
+
+        Blocks are stored as they stream in, so a run is never held in memory
+        whole; if the connection drops, the retry asks only for the blocks
+        that haven't arrived yet.
+        """
+        request = backoff.on_exception(backoff.expo,
+                                       requests.exceptions.RequestException,
+                                       max_time=self.max_time,
+                                       giveup=_gs_stop_trying)(self._request_range)
+        utils.mkdir(self.directory)
+        block, wait, deadline = first, 1, time.time() + self.max_time
+        while block <= last:
+            r, size, skip = request(url, block * self.block_size,
+                                    (last + 1) * self.block_size - 1)
+            self._store(self._path(url), str(size))
+            last = min(last, (size - 1) // self.block_size)
+            if r is None: # start is past the end
+                break
+            try:
+                for content in self._iter_blocks(r, skip):
+                    if len(content) != min(self.block_size, size - block * self.block_size):
+                        break # cut off; a short block is only right at the end
+                    self._store(self._path(url, block), content)
+                    self._tally(misses=1, bytes_fetched=len(content))
+                    block += 1
+                    wait, deadline = 1, time.time() + self.max_time
+                    yield content
+                    if block > last:
+                        break
+                if block <= last:
+                    raise requests.exceptions.ConnectionError(
+                        'Connection closed early while fetching {}'.format(url))
+            except requests.exceptions.RequestException:
+                if time.time() + wait > deadline:
+                    raise
+                time.sleep(wait)
+                wait *= 2
+            finally:
+                r.close()
+        self._evict()
+
+    def _request_range(self, url, start, end):
+        """Request bytes start through end of url.
+
+        Returns the streaming response (None if start is past the end), the
+        object's size, & how many bytes of the response precede start.
+        """
+        r = requests.get(url, headers={'Range': 'bytes={}-{}'.format(start, end)},
+                         stream=True)
+        if r.status_code == 416: # start is past the end
+            r.close()
+            return None, int(r.headers['Content-Range'].split('/')[-1]), 0
+        r.raise_for_status()
+        if r.status_code == 206:
+            return r, int(r.headers['Content-Range'].split('/')[-1]), 0
+        # the server is sending the whole object
+        return r, int(r.headers['Content-Length']), start
+
+    def _iter_blocks(self, r, skip=0):
+        """Generate a response's body in block_size pieces, after skip bytes."""
+        buf = ''
+        for chunk in r.iter_content(chunk_size=self.block_size):
+            buf += chunk
+            if skip:
+                n = min(skip, len(buf))
+                buf, skip = buf[n:], skip - n
+            while len(buf) >= self.block_size:
+                yield buf[:self.block_size]
+                buf = buf[self.block_size:]
+        if buf:
+            yield buf
+
+    def _store(self, path, content):
+        """Write a cache file atomically, so readers never see part of one."""
+        # unique across threads, processes, & nodes sharing the cache
+        temp_path = '{}.{}.{}.{}.tmp'.format(path, socket.gethostname(), os.getpid(),
+                                            threading.current_thread().ident)
+        with open(temp_path, 'wb') as f:
+            f.write(content)
+        os.rename(temp_path, path)
+
+    def discard(self, url):
+        """Remove url's size & blocks from the cache, eg if they proved corrupt."""
+        prefix = os.path.basename(self._path(url))[:-len('.size')] + '.'
+        for fn in os.listdir(self.directory) if os.path.isdir(self.directory) else []:
+            if fn.startswith(prefix) and not fn.endswith('.tmp'):
+                try:
+                    os.remove(os.path.join(self.directory, fn))
+                except OSError: # removed by another process
+                    pass
+
+    def _evict(self):
+        """Remove least recently used blocks until the cache fits in max_bytes."""
+        entries = []
+        for fn in os.listdir(self.directory):
+            if fn.endswith('.size') or fn.endswith('.tmp'):
+                continue
+            path = os.path.join(self.directory, fn)
+            try:
+                st = os.stat(path)
+            except OSError: # removed by another process
+                continue
+            entries.append((st.st_mtime, st.st_size, path))
+        total = sum(e[1] for e in entries)
+        for _, nbytes, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= nbytes
+
+atexit.register(BlockCache.report)
+
+
+class ResumableDownloader(object):
+    """Download files over HTTP several at a time, resuming partial files.
+
+    Each file is written to a '.part' file beside its destination, which is
+    renamed into place once its size (and md5, when known) checks out.  When a
+    transfer is interrupted, the retry asks only for the missing bytes with an
+    HTTP Range header.  A request for a URL that another thread is already
+    downloading waits for that download rather than starting another.
+    """
+    # shared by all downloaders so that, eg, concurrent processing steps
+    # needing the same band don't fetch it twice
+    _inflight = {}
+    _inflight_lock = threading.Lock()
+
+    def __init__(self, workers=1, chunk_size=512 * 1024, max_time=None, cache=None):
+        self.cache = cache # a BlockCache to download through, if any
+        self.workers = max(1, workers)
+        self.chunk_size = chunk_size
+        self.max_time = (GoogleStorageMixin._gs_backoff_max
+                         if max_time is None else max_time)
+
+    def fetch_all(self, items):
+        """Download (url, dst[, size[, md5]]) items; return the dst paths.
+
+        size is the expected length in bytes and md5 the base64-encoded digest,
+        as given in google storage listings; either may be None.  The first
+        failed download's exception is raised once the others finish.
+        """
+        items = list(items)
+        if len(items) < 2 or self.workers == 1:
+            return [self.fetch(*i) for i in items]
+        pool = ThreadPool(min(self.workers, len(items)))
+        try:
+            return pool.map(lambda i: self.fetch(*i), items)
+        finally:
+            pool.close()
+            pool.join()
+
+    @trace.traced('download')
+    def fetch(self, url, dst, size=None, md5=None):
+        """Download url to dst unless it's already there; return dst."""
+        trace.annotate(url=url)
+        with self._inflight_lock:
+            pending = self._inflight.get(url)
+            owner = pending is None
+            if owner:
+                pending = self._inflight[url] = {
+                    'dst': dst, 'done': threading.Event(), 'error': None}
+        if not owner:
+            pending['done'].wait()
+            if pending['error'] is not None:
+                raise IOError('Download of {} failed: {}'.format(
+                    url, pending['error']))
+            if os.path.abspath(pending['dst']) != os.path.abspath(dst):
+                shutil.copyfile(pending['dst'], dst)
+            return dst
+        try:
+            self._fetch(url, dst, size, md5)
+        except Exception as e:
+            pending['error'] = e
+            raise
+        finally:
+            with self._inflight_lock:
+                del self._inflight[url]
+            pending['done'].set()
+        return dst
+
+    def _fetch(self, url, dst, size, md5):
+        if os.path.exists(dst) and size in (None, os.path.getsize(dst)):
+            return
+        part = dst + '.part'
+        if self.cache is not None:
+            self.cache.copy(url, part)
+        else:
+            backoff.on_exception(backoff.expo,
+                                 requests.exceptions.RequestException,
+                                 max_time=self.max_time,
+                                 giveup=_gs_stop_trying)(self._transfer)(url, part, size)
+        problem = self.verify(part, size, md5)
+        if problem is not None:
+            os.remove(part)
+            if self.cache is not None:
+                # so the next try fetches it afresh
+                self.cache.discard(url)
+            raise IOError('Download of {} failed verification: {}'.format(url, problem))
+        os.rename(part, dst)
+
+    def _transfer(self, url, part, size):
+        """Append the rest of url to part, which may already hold some of it."""
+        offset = os.path.getsize(part) if os.path.exists(part) else 0
+        if offset and offset == size:
+            return
+        headers = {'Range': 'bytes={}-'.format(offset)} if offset else {}
+        with closing(requests.get(url, headers=headers, stream=True)) as r:
+            if offset and r.status_code == 416:
+                return # nothing past offset; verification judges what's there
+            r.raise_for_status()
+            if r.status_code != 206:
+                offset = 0 # the server sent the whole file
+            expected = r.headers.get('Content-Length')
+            with open(part, 'ab' if offset else 'wb') as f:
+                for chunk in r.iter_content(chunk_size=self.chunk_size):
+                    if chunk: # filter out keep-alive new chunks
+                        f.write(chunk)
+        if expected is not None and os.path.getsize(part) < offset + int(expected):
+            raise requests.exceptions.ConnectionError(
+                'Connection closed after {} of {} bytes of {}'.format(
+                    os.path.getsize(part), offset + int(expected), url))
+
+    def verify(self, path, size=None, md5=None):
+        """Return a description of how path fails to match, else None."""
+        actual = os.path.getsize(path)
+        if size is not None and actual != size:
+            return 'expected {} bytes, got {}'.format(size, actual)
+        if md5 is not None:
+            digest = hashlib.md5()
+            with open(path, 'rb') as f:
+                for chunk in iter(lambda: f.read(self.chunk_size), b''):
+                    digest.update(chunk)
+            if base64.b64encode(digest.digest()) != md5:
+                return 'md5 mismatch'
+        return None
+
+
 class GoogleStorageMixin(object):
     """Mix this into a class (probably Asset) to use data in google storage.
 
@@ -137,17 +497,48 @@ class GoogleStorageMixin(object):
         return vsi_magic_string + cls.gs_object_url_base()
 
     @classmethod
-    @backoff.on_exception(backoff.expo,
-                              requests.exceptions.RequestException,
-                              max_time=_gs_backoff_max,
-                              giveup=_gs_stop_trying)
     def gs_backoff_downloader(cls, src, dst, chunk_size=512 * 1024):
-        r = requests.get(src, stream=True)# NOTE the stream=True
-        r.raise_for_status()
-        with open(dst, 'wb') as f:
-            for chunk in r.iter_content(chunk_size=chunk_size):
-                if chunk: # filter out keep-alive new chunks
-                    f.write(chunk)
+        """Download src to dst, retrying & resuming as needed."""
+        ResumableDownloader(chunk_size=chunk_size, max_time=cls._gs_backoff_max,
+                            cache=BlockCache.default()).fetch(src, dst)
+
+    @classmethod
+    def gs_object_metadata(cls, urls):
+        """Return {url: (size, md5)} for the given objects' URLs.
+
+        The values come from listing the objects' directories in the bucket;
+        objects that can't be found there are left out.
+        """
+        base = cls.gs_object_url_base()
+        prefixes = set(os.path.dirname(u[len(base):]) + '/'
+                       for u in urls if u.startswith(base))
+        metadata = {}
+        for prefix in prefixes:
+            try:
+                items = cls.gs_api_search(prefix, delimiter=None).get('items', [])
+            except requests.exceptions.RequestException as e:
+                utils.verbose_out("Couldn't list {}, so downloads from it will"
+                                  " be verified only by length: {}".format(prefix, e), 3)
+                continue
+            for i in items:
+                size = int(i['size']) if 'size' in i else None
+                metadata[base + i['name']] = (size, i.get('md5Hash'))
+        return metadata
+
+    @classmethod
+    def gs_download(cls, pairs):
+        """Download (url, path) pairs of objects concurrently; return the paths.
+
+        Sizes & checksums are checked against the bucket listing.  Parallelism
+        is bounded by the DOWNLOAD_THREADS setting.
+        """
+        pairs = list(pairs)
+        metadata = cls.gs_object_metadata([u for (u, _) in pairs])
+        downloader = ResumableDownloader(
+            workers=getattr(settings(), 'DOWNLOAD_THREADS', 4),
+            max_time=cls._gs_backoff_max, cache=BlockCache.default())
+        return downloader.fetch_all(
+            [(u, p) + metadata.get(u, (None, None)) for (u, p) in pairs])
 
     @classmethod
     @backoff.on_exception(backoff.expo,
@@ -159,6 +550,17 @@ class GoogleStorageMixin(object):
         r.raise_for_status()
         return r
 
+    @classmethod
+    def gs_read(cls, src):
+        """Return the contents of the object at src.
+
+        Reads go through the block cache (see BLOCK_CACHE_SIZE) when it's on.
+        """
+        cache = BlockCache.default()
+        if cache is None:
+            return cls.gs_backoff_get(src).content
+        return cache.read(src)
+
     @classmethod
     def _cache_if_vsicurl(cls, filelist, tmpdir):
         '''Google Storage-based assets use vsicurl paths.  This method will
@@ -167,13 +569,15 @@ class GoogleStorageMixin(object):
         but it works for now.
         '''
         ofiles = []
+        downloads = []
         for i in filelist:
             if i.startswith('/vsicurl/'):
                 dest_path = os.path.join(tmpdir, os.path.basename(i))
-                cls.gs_backoff_downloader(i[9:], dest_path)
+                downloads.append((i[9:], dest_path))
                 ofiles.append(dest_path)
             else:
                 ofiles.append(i)
+        cls.gs_download(downloads)
         return ofiles
 
 
@@ -192,19 +596,95 @@ class S3Mixin(object):
         * set cls._s3_bucket_name
         * set up query & fetch methods to call the methods below
     """
+    # (bucket, prefix): (time listed, keys), shared by all drivers
+    _s3_listings = {}
+    _s3_listings_lock = threading.Lock()
+
     @classmethod
-    @lru_cache(maxsize=1)
     def s3_prefix_search(cls, prefix):
+        """Return the keys in the bucket starting with prefix.
+
+        Listings are reused for S3_LISTING_TTL seconds (default an hour),
+        both in memory and saved in CACHE_DIR so other processes can use
+        them.  With a TTL of 0 listings aren't saved, and each prefix is
+        listed once per process.  Drivers should search broad prefixes, eg a
+        whole tile, and pick out what they need.
+        """
+        ttl = getattr(settings(), 'S3_LISTING_TTL', 3600)
+        with cls._s3_listings_lock:
+            listing = cls._s3_listings.get((cls._s3_bucket_name, prefix))
+        if listing is not None and ttl and time.time() - listing[0] > ttl:
+            listing = None # stale; list it again
+        if listing is None:
+            listing = cls._s3_load_listing(prefix, ttl) if ttl else None
+            if listing is None:
+                listing = (time.time(), cls._s3_list_bucket(prefix))
+                if ttl:
+                    cls._s3_save_listing(prefix, listing)
+            with cls._s3_listings_lock:
+                cls._s3_listings[(cls._s3_bucket_name, prefix)] = listing
+        return listing[1]
+
+    @classmethod
+    def _s3_list_bucket(cls, prefix):
+        """List the keys under prefix, several sub-prefixes at a time."""
         validate_s3_env_vars()
-        # find the layer and metadata files matching the current scene
         import boto3 # import here so it only breaks if it's actually needed
-        s3 = boto3.resource('s3')
-        bucket = s3.Bucket(cls._s3_bucket_name)
-        keys = [o.key for o in bucket.objects.filter(Prefix=prefix)]
+        client = boto3.client('s3') # clients, unlike resources, are thread-safe
+
+        def pages(p, **kwargs):
+            return client.get_paginator('list_objects_v2').paginate(
+                Bucket=cls._s3_bucket_name, Prefix=p, **kwargs)
+
+        def list_prefix(p):
+            return [o['Key'] for page in pages(p) for o in page.get('Contents', [])]
+
+        # list the first level below the prefix, then list each of its
+        # sub-prefixes (eg each scene's directory) concurrently
+        keys, sub_prefixes = [], []
+        for page in pages(prefix, Delimiter='/'):
+            keys.extend(o['Key'] for o in page.get('Contents', []))
+            sub_prefixes.extend(p['Prefix'] for p in page.get('CommonPrefixes', []))
+        if sub_prefixes:
+            pool = ThreadPool(min(len(sub_prefixes),
+                                  getattr(settings(), 'S3_LIST_THREADS', 8)))
+            try:
+                for sub_keys in pool.map(list_prefix, sub_prefixes):
+                    keys.extend(sub_keys)
+            finally:
+                pool.close()
+                pool.join()
         utils.verbose_out("Found {} S3 keys while searching for for key fragment"
                     " '{}'".format(len(keys), prefix), 5)
         return keys
 
+    @classmethod
+    def _s3_listing_path(cls, prefix):
+        return os.path.join(utils.cache_path('s3-listings', cls._s3_bucket_name),
+                            hashlib.sha1(prefix).hexdigest() + '.json')
+
+    @classmethod
+    def _s3_load_listing(cls, prefix, ttl):
+        """Return the saved (time, keys) listing of prefix, if it's fresh."""
+        try:
+            with open(cls._s3_listing_path(prefix)) as f:
+                saved = json.load(f)
+        except (IOError, ValueError):
+            return None
+        if saved.get('prefix') != prefix or time.time() - saved['time'] > ttl:
+            return None
+        return saved['time'], [str(k) for k in saved['keys']]
+
+    @classmethod
+    def _s3_save_listing(cls, prefix, listing):
+        """Save a listing atomically, as other processes may be reading it."""
+        path = cls._s3_listing_path(prefix)
+        temp_path = '{}.{}.tmp'.format(path, os.getpid())
+        with open(temp_path, 'w') as f:
+            json.dump({'prefix': prefix, 'time': listing[0],
+                       'keys': listing[1]}, f)
+        os.rename(temp_path, path)
+
     @classmethod
     def s3_vsi_prefix(cls, key):
         """Add a vsi3 prefix to the given S3 key"""
@@ -252,6 +732,18 @@ class Repository(object):
             path = os.path.join(path, str(date.strftime(cls._datedir)))
         return path
 
+    @classmethod
+    def lock(cls, tile, date):
+        """Return a context manager holding the repository's lock on a tile & date.
+
+        Processes making or archiving files for the same tile & date,
+        on any node, take turns; see utils.file_lock.  Lock files are kept
+        in a directory per tile, as locks/<tile>/<date>.lock, so no one
+        directory grows with the whole archive.
+        """
+        return utils.file_lock(os.path.join(
+            cls.path('locks'), tile, date.strftime(cls._datedir) + '.lock'))
+
     @classmethod
     def find_tiles(cls):
         """Get list of all available tiles for the current driver."""
@@ -277,6 +769,10 @@ class Repository(object):
         Validation, for this purpose, includes transformations,
         such as changing types.
         """
+        if key == 'vsi-products' and value not in ('materialize', 'symlink'):
+            raise ValueError("{}'s 'vsi-products' setting is '{}', but valid"
+                             " values are 'materialize' or 'symlink'".format(
+                                 cls.name, value))
         return value
 
     ##########################################################################
@@ -409,6 +905,93 @@ class Repository(object):
             tiles.pop(t, None)
         return tiles
 
+    @classmethod
+    @lru_cache(maxsize=None) # one entry per driver
+    def tile_geometries(cls):
+        """Return the tiles vector's SRS (as WKT) and {tile: shapely geometry}.
+
+        Read once per process, for callers that look up many locations.
+        """
+        from osgeo import ogr
+
+        v = open_vector(cls.get_setting('tiles'))
+        shp = ogr.Open(v.Filename())
+        layer = shp.GetLayer(v.LayerName()) if v.LayerName() else shp.GetLayer(0)
+        geometries = OrderedDict()
+        layer.ResetReading()
+        feat = layer.GetNextFeature()
+        while feat is not None:
+            geometries[cls.feature2tile(feat)] = loads(feat.GetGeometryRef().ExportToWkt())
+            feat = layer.GetNextFeature()
+        return layer.GetSpatialRef().ExportToWkt(), geometries
+
+
+_sidecar_format = 1
+
+
+def _sidecar_default(o):
+    """json.dump() hook for the types JSON lacks."""
+    if isinstance(o, datetime):
+        return {'__datetime__': o.strftime('%Y-%m-%dT%H:%M:%S.%f')}
+    if hasattr(o, 'toordinal'):
+        return {'__date__': o.strftime('%Y-%m-%d')}
+    raise TypeError(repr(o) + ' is not JSON serializable')
+
+
+def _sidecar_decode(o):
+    """Undo _sidecar_default; also make strings str, since gippy rejects unicode."""
+    if isinstance(o, dict):
+        if '__datetime__' in o:
+            return datetime.strptime(o['__datetime__'], '%Y-%m-%dT%H:%M:%S.%f')
+        if '__date__' in o:
+            return datetime.strptime(o['__date__'], '%Y-%m-%d').date()
+        return {_sidecar_decode(k): _sidecar_decode(v) for k, v in o.items()}
+    if isinstance(o, list):
+        return [_sidecar_decode(v) for v in o]
+    if isinstance(o, unicode):
+        return o.encode('utf-8')
+    return o
+
+
+def _sidecar_stamp(filename, version):
+    st = os.stat(filename)
+    return [_sidecar_format, version, st.st_size, st.st_mtime]
+
+
+def _sidecar_checksum(entries):
+    return hashlib.sha1(json.dumps(entries, sort_keys=True)).hexdigest()
+
+
+def _read_sidecar(sidecar_fn, asset_fn, version):
+    """Return the entries in a metadata sidecar, or {} if it isn't valid."""
+    if not os.path.exists(sidecar_fn):
+        return {}
+    try:
+        with open(sidecar_fn) as fo:
+            content = json.load(fo)
+        valid = (content['stamp'] == _sidecar_stamp(asset_fn, version)
+                 and content['sha1'] == _sidecar_checksum(content['entries']))
+    except Exception as e:
+        utils.verbose_out('Unreadable metadata sidecar {}: {}'.format(sidecar_fn, e), 3)
+        return {}
+    if not valid:
+        utils.verbose_out('Ignoring out-of-date metadata sidecar ' + sidecar_fn, 4)
+        return {}
+    return _sidecar_decode(content['entries'])
+
+
+def _write_sidecar(sidecar_fn, asset_fn, version, entries):
+    """Atomically (re)write a metadata sidecar."""
+    # round trip to get the checksum of what readers will see
+    entries = json.loads(json.dumps(entries, default=_sidecar_default))
+    content = {'stamp': _sidecar_stamp(asset_fn, version),
+               'sha1': _sidecar_checksum(entries),
+               'entries': entries}
+    tmp_fn = '{}.{}.tmp'.format(sidecar_fn, os.getpid())
+    with open(tmp_fn, 'w') as fo:
+        json.dump(content, fo)
+    os.rename(tmp_fn, sidecar_fn)
+
 
 class Asset(object):
     """ Class for a single file asset (usually an original raw file or archive) """
@@ -577,6 +1160,68 @@ class Asset(object):
             return [self.filename]
 
 
+    # quality metadata recorded in the inventory DB; each is also the name of
+    # the method that computes it, eg cloud_cover
+    db_metadata_fields = ()
+
+    def db_metadata(self, fields=None):
+        """Return {field: value} for the inventory DB's quality metadata columns.
+
+        Values are computed from the archived copy of the asset if there is
+        one, and only from local files; missing or unreadable values are
+        left out rather than looked up remotely.  So nothing is recorded
+        for assets in cloud storage (see in_cloud_storage), whose metadata
+        is read over the network.
+        """
+        fields = self.db_metadata_fields if fields is None else fields
+        if not fields:
+            return {}
+        asset = self
+        archived_fn = getattr(self, 'archived_filename', None)
+        if archived_fn not in (None, self.filename):
+            asset = self.__class__(archived_fn)
+        if not os.path.exists(asset.filename) or asset.in_cloud_storage():
+            return {}
+        values = {}
+        for f in fields:
+            with utils.error_handler('Unable to determine {} for {}'.format(
+                    f, asset.filename), continuable=True):
+                values[f] = getattr(asset, f)()
+        return values
+
+    # increment to invalidate metadata sidecars after changing how metadata is parsed
+    _metadata_version = 1
+
+    @property
+    def metadata_filename(self):
+        """Path to the JSON sidecar holding this asset's parsed metadata."""
+        return self.filename + '.meta.json'
+
+    def cached_metadata(self, key, compute):
+        """Return compute()'s result, caching it in the asset's sidecar file.
+
+        Metadata is often buried in an archive, so the sidecar saves
+        decompressing & parsing it again on each use.  The sidecar is ignored
+        if the asset's size or mtime changes, if _metadata_version changes,
+        or if its checksum doesn't match.  Values must be JSON-serializable,
+        but may contain dates & datetimes.  Only archived assets get sidecars,
+        so nothing is left behind in the stage directory.
+        """
+        if getattr(self, '_sidecar', None) is None:
+            self._sidecar = _read_sidecar(self.metadata_filename, self.filename,
+                                          self._metadata_version)
+        if key in self._sidecar:
+            return self._sidecar[key]
+        value = compute()
+        self._sidecar[key] = value
+        if os.path.abspath(self.filename).startswith(self.Repository.data_path()):
+            with utils.error_handler('Unable to write ' + self.metadata_filename,
+                                     continuable=True):
+                _write_sidecar(self.metadata_filename, self.filename,
+                               self._metadata_version, self._sidecar)
+        return value
+
+    @trace.traced('extract')
     def extract(self, filenames=tuple(), path=None):
         """Extract given files from asset (if it's a tar or zip).
 
@@ -584,6 +1229,7 @@ class Asset(object):
         a list of extracted files, plus any files that were not extracted due
         to prior existence.
         """
+        trace.annotate(asset=os.path.basename(self.filename), files=len(filenames))
         if tarfile.is_tarfile(self.filename):
             try:
                 open_file = tarfile.open(self.filename)
@@ -806,7 +1452,8 @@ class Asset(object):
         are archived directly.  Once issue 365 is fixed it should be
         removed.
         """
-        qs_rv = cls.query_service(a_type, tile, date, **fetch_kwargs)
+        with trace.span('query', asset=a_type, tile=tile, date=date):
+            qs_rv = cls.query_service(a_type, tile, date, **fetch_kwargs)
         if qs_rv is None:
             return []
         if cls.Repository.in_stage(qs_rv['basename']): # skip if there already
@@ -815,7 +1462,9 @@ class Asset(object):
                                  dir=cls.Repository.path('stage')) as td_fp:
             qs_rv['download_fp'] = os.path.join(td_fp, qs_rv['basename'])
             fetch_kwargs.update(**qs_rv)
-            if cls.download(**fetch_kwargs):
+            with trace.span('download', asset=a_type, tile=tile, date=date):
+                downloaded = cls.download(**fetch_kwargs)
+            if downloaded:
                 if archive:
                     ao, _, _ = cls._archivefile(qs_rv['download_fp'], update)
                     return [ao]
@@ -837,6 +1486,7 @@ class Asset(object):
         return conn
 
     @classmethod
+    @trace.traced('archive')
     def archive(cls, path, recursive=False, keep=False, update=False):
         """Move asset files into the archive.
 
@@ -852,6 +1502,7 @@ class Asset(object):
         and a list of asset objects whose files have been overwritten (by the
         update flag).
         """
+        trace.annotate(path=path)
         start = datetime.now()
 
         fnames = []
@@ -880,7 +1531,7 @@ class Asset(object):
             if link_count >= 0:
                 if not keep:
                     # user wants to remove the original hardlink to the file
-                    RemoveFiles([f], ['.index', '.aux.xml'])
+                    RemoveFiles([f], ['.index', '.aux.xml', '.meta.json'])
             if link_count > 0:
                 numfiles = numfiles + 1
                 numlinks = numlinks + link_count
@@ -918,62 +1569,64 @@ class Asset(object):
         numlinks = 0
         otherversions = False
         for d in dates:
-            tpath = cls.Repository.data_path(asset.tile, d)
-            newfilename = os.path.join(tpath, bname)
-            if not os.path.exists(newfilename):
-                # check if another asset exists
-                # QUESTION: Can it be that len(existing) > 1?
-                # Not changing much now, but adding an immediate assert to
-                # verify that there can only be one-or-none of an asset in the
-                # archive (2017-09-29).  Assuming it isn't a problem, we could
-                # drop some of these for-loops.
-                existing = cls.discover(asset.tile, d, asset.asset)
-                assert len(existing) in (0, 1), (
-                    'Apparently there can be more than one asset file for a'
-                    ' given ({}, {}, {}).'.format(asset.tile, d, asset.asset)
-                )
-                if len(existing) > 0 and (not update or not existing[0].updated(asset)):
-                    # gatekeeper case:  No action taken because other assets exist
-                    VerboseOut('%s: other version(s) already exists:' % bname, 1)
-                    for ef in existing:
-                        VerboseOut('\t%s' % os.path.basename(ef.filename), 1)
-                    otherversions = True
-                elif len(existing) > 0 and update:
-                    # update case:  Remove existing outdated assets
-                    #               and install the new one
-                    VerboseOut('%s: removing other version(s):' % bname, 1)
-                    for ef in existing:
-                        if not ef.updated(asset):
-                            utils.verbose_out(
-                                'Asset {} is not updated version of {}.'
-                                .format(ef.filename, asset.filename) +
-                                ' Remove existing asset to replace.', 2
-                            )
-                            # NOTE: This return makes sense iff len(existing)
-                            # cannot be greater than 1
-                            return (None, 0, None)
-                        overwritten_ao = cls(ef.filename)
-                        VerboseOut('\t%s' % os.path.basename(ef.filename), 1)
-                        errmsg = 'Unable to remove existing version: ' + ef.filename
-                        with utils.error_handler(errmsg):
-                            RemoveFiles([ef.filename], ['.index', '.aux.xml'])
-                    with utils.error_handler('Problem adding {} to archive'.format(filename)):
-                        os.link(os.path.abspath(filename), newfilename)
-                        asset.archived_filename = newfilename
-                        VerboseOut(bname + ' -> ' + newfilename, 2)
-                        numlinks = numlinks + 1
+            # discover & link under the lock, so concurrent archivers can't both add
+            with cls.Repository.lock(asset.tile, d):
+                tpath = cls.Repository.data_path(asset.tile, d)
+                newfilename = os.path.join(tpath, bname)
+                if not os.path.exists(newfilename):
+                    # check if another asset exists
+                    # QUESTION: Can it be that len(existing) > 1?
+                    # Not changing much now, but adding an immediate assert to
+                    # verify that there can only be one-or-none of an asset in the
+                    # archive (2017-09-29).  Assuming it isn't a problem, we could
+                    # drop some of these for-loops.
+                    existing = cls.discover(asset.tile, d, asset.asset)
+                    assert len(existing) in (0, 1), (
+                        'Apparently there can be more than one asset file for a'
+                        ' given ({}, {}, {}).'.format(asset.tile, d, asset.asset)
+                    )
+                    if len(existing) > 0 and (not update or not existing[0].updated(asset)):
+                        # gatekeeper case:  No action taken because other assets exist
+                        VerboseOut('%s: other version(s) already exists:' % bname, 1)
+                        for ef in existing:
+                            VerboseOut('\t%s' % os.path.basename(ef.filename), 1)
+                        otherversions = True
+                    elif len(existing) > 0 and update:
+                        # update case:  Remove existing outdated assets
+                        #               and install the new one
+                        VerboseOut('%s: removing other version(s):' % bname, 1)
+                        for ef in existing:
+                            if not ef.updated(asset):
+                                utils.verbose_out(
+                                    'Asset {} is not updated version of {}.'
+                                    .format(ef.filename, asset.filename) +
+                                    ' Remove existing asset to replace.', 2
+                                )
+                                # NOTE: This return makes sense iff len(existing)
+                                # cannot be greater than 1
+                                return (None, 0, None)
+                            overwritten_ao = cls(ef.filename)
+                            VerboseOut('\t%s' % os.path.basename(ef.filename), 1)
+                            errmsg = 'Unable to remove existing version: ' + ef.filename
+                            with utils.error_handler(errmsg):
+                                RemoveFiles([ef.filename], ['.index', '.aux.xml', '.meta.json'])
+                        with utils.error_handler('Problem adding {} to archive'.format(filename)):
+                            os.link(os.path.abspath(filename), newfilename)
+                            asset.archived_filename = newfilename
+                            VerboseOut(bname + ' -> ' + newfilename, 2)
+                            numlinks = numlinks + 1
 
+                    else:
+                        # 'normal' case:  Just add the asset to the archive; no other work needed
+                        with utils.error_handler('Unable to make data directory ' + tpath):
+                            utils.mkdir(tpath)
+                        with utils.error_handler('Problem adding {} to archive'.format(filename)):
+                            os.link(os.path.abspath(filename), newfilename)
+                            asset.archived_filename = newfilename
+                            VerboseOut(bname + ' -> ' + newfilename, 2)
+                            numlinks = numlinks + 1
                 else:
-                    # 'normal' case:  Just add the asset to the archive; no other work needed
-                    with utils.error_handler('Unable to make data directory ' + tpath):
-                        utils.mkdir(tpath)
-                    with utils.error_handler('Problem adding {} to archive'.format(filename)):
-                        os.link(os.path.abspath(filename), newfilename)
-                        asset.archived_filename = newfilename
-                        VerboseOut(bname + ' -> ' + newfilename, 2)
-                        numlinks = numlinks + 1
-            else:
-                VerboseOut('%s already in archive' % filename, 2)
+                    VerboseOut('%s already in archive' % filename, 2)
 
         # newly created asset should have only automagical products, and those
         # would have paths in stage with the existing asset.  Re-instantiation
@@ -1045,6 +1698,22 @@ class FtpAsset(Asset):
         return True
 
 
+class ProductStep(object):
+    """One step in a driver's product graph; see Data.plan_steps.
+
+    The step's output is made by calling the Data method named by method,
+    with args; it should return the output, typically a GeoImage.  The
+    outputs of the steps named in inputs are made first and are available
+    to the method via Data.step_result.  A step without a method makes
+    nothing itself; it's useful for gathering the inputs of a group of
+    products, such as indices, that are made together.
+    """
+    def __init__(self, method=None, inputs=(), args=()):
+        self.method = method
+        self.inputs = tuple(inputs)
+        self.args = tuple(args)
+
+
 class Data(object):
     """Collection of assets/products for single date and tile.
 
@@ -1062,12 +1731,187 @@ class Data(object):
     _pattern = '*.tif'
     _products = {}
     _productgroups = {}
+    # product graph for plan_steps & run_steps; {output name: ProductStep}
+    _product_steps = {}
 
     @classmethod
     def get_setting(cls, key):
         """Convenience method to acces Repository's get_setting."""
         return cls.Asset.Repository.get_setting(key)
 
+    def plan_steps(self, targets, overwrite=False):
+        """Return the steps needed to make targets, in an order they can run.
+
+        Steps are named as in self._product_steps.  A step whose output is
+        already in the inventory is left out, along with any inputs only it
+        needs, unless overwrite is True; steps using its output read the
+        product file instead (see step_result).
+        """
+        order, seen = [], set()
+
+        def visit(name, path):
+            if name in path:
+                raise ValueError('Cycle in product steps: '
+                                 + ' -> '.join(path + (name,)))
+            if name in seen:
+                return
+            if name not in self._product_steps:
+                raise ValueError('Could not find dependency listing for ' + name)
+            seen.add(name)
+            if name in self.products and not overwrite:
+                return
+            for i in self._product_steps[name].inputs:
+                visit(i, path + (name,))
+            order.append(name)
+
+        for t in targets:
+            visit(t, ())
+        return order
+
+    def step_result(self, name):
+        """Return the output of the named step.
+
+        If the step wasn't run, its product is read from the inventory.
+        """
+        if name in self._step_results:
+            return self._step_results[name]
+        return gippy.GeoImage(self.filenames[(self.sensors[name], name)])
+
+    def run_steps(self, steps, keep=()):
+        """Run the given steps, as planned by plan_steps.
+
+        Each step runs as soon as its inputs are ready, using up to
+        settings().STEP_THREADS threads (1 by default).  Steps sharing an
+        input that isn't numpy arrays, eg a GeoImage, which isn't safe to
+        read from several threads at once, take turns with it instead.
+        Outputs are kept in memory only until the steps using them are
+        done, unless named in keep (naming a step without a method keeps
+        its inputs).  If the outputs held in memory outgrow
+        settings().STEP_MEMORY_BUDGET (in bytes; unlimited by default), the
+        largest ones still needed are spilled to the processing temp dir;
+        see _spill_step_result.  Each step's run time is recorded in
+        self.step_timings.
+        """
+        threads = getattr(settings(), 'STEP_THREADS', 1)
+        budget = getattr(settings(), 'STEP_MEMORY_BUDGET', None)
+        steps = list(steps)
+        waiting = {s: set(self._product_steps[s].inputs) & set(steps)
+                   for s in steps}
+        users = {s: len([t for t in steps if s in waiting[t]]) for s in steps}
+        keep = set(keep)
+        for s in reversed(steps):
+            if s in keep and self._product_steps[s].method is None:
+                keep.update(self._product_steps[s].inputs)
+        results = self._step_results
+        finished = Queue.Queue()
+        in_use = {} # running step: its inputs that only one step may use at a time
+
+        def exclusive_inputs(name):
+            return set(i for i in self._product_steps[name].inputs
+                       if i in results and not self._step_result_shareable(results[i]))
+
+        def run(name):
+            step = self._product_steps[name]
+            start = datetime.now()
+            try:
+                with trace.span('step', product=name, tile=self.id, date=self.date):
+                    value = (None if step.method is None
+                             else getattr(self, step.method)(*step.args))
+                finished.put((name, value, datetime.now() - start, None))
+            except Exception:
+                finished.put((name, None, datetime.now() - start, sys.exc_info()))
+
+        pool = ThreadPool(threads) if threads > 1 else None
+        running, error = set(), None
+        try:
+            while waiting or running:
+                ready = [s for s in steps if s in waiting and not waiting[s]]
+                if error is None:
+                    for s in ready[:None if pool else 1]:
+                        exclusive = exclusive_inputs(s)
+                        if any(exclusive & used for used in in_use.values()):
+                            continue # wait for the running step to finish with them
+                        in_use[s] = exclusive
+                        del waiting[s]
+                        running.add(s)
+                        if pool:
+                            pool.apply_async(run, (s,))
+                        else:
+                            run(s)
+                if not running:
+                    break
+                name, value, elapsed, exc_info = finished.get()
+                running.remove(name)
+                del in_use[name]
+                self.step_timings[name] = elapsed
+                self._time_report('Finished step {} in {}'.format(name, elapsed))
+                if exc_info is not None:
+                    error = error or exc_info
+                    continue
+                results[name] = value
+                for s in waiting:
+                    if name in waiting[s]:
+                        waiting[s].remove(name)
+                for i in self._product_steps[name].inputs:
+                    if i in users:
+                        users[i] -= 1
+                        if users[i] == 0 and i not in keep:
+                            results.pop(i, None)
+                if users[name] == 0 and name not in keep:
+                    results.pop(name, None)
+                if budget is not None:
+                    self._enforce_step_budget(budget, users)
+        finally:
+            if pool:
+                pool.close()
+                pool.join()
+        if error is not None:
+            raise error[0], error[1], error[2]
+
+    @classmethod
+    def _step_result_shareable(cls, value):
+        """Whether steps in several threads may use a step output at once."""
+        if isinstance(value, dict):
+            return all(cls._step_result_shareable(v) for v in value.values())
+        return value is None or isinstance(value, numpy.ndarray)
+
+    @classmethod
+    def _step_result_nbytes(cls, value):
+        """Memory held by a step output; only numpy arrays are counted."""
+        if isinstance(value, dict):
+            return sum(cls._step_result_nbytes(v) for v in value.values())
+        if isinstance(value, numpy.ndarray) and not isinstance(value, numpy.memmap):
+            return value.nbytes
+        return 0
+
+    def _spill_step_result(self, name, value):
+        """Move a step output out of memory, returning its replacement.
+
+        numpy arrays are saved in the temp dir & memory-mapped; anything
+        else is returned unchanged.
+        """
+        if isinstance(value, dict):
+            return {k: self._spill_step_result('{}-{}'.format(name, k), v)
+                    for k, v in value.items()}
+        if not isinstance(value, numpy.ndarray) or isinstance(value, numpy.memmap):
+            return value
+        fn = self.generate_temp_path('step-{}.npy'.format(name))
+        numpy.save(fn, value)
+        return numpy.load(fn, mmap_mode='r')
+
+    def _enforce_step_budget(self, budget, users):
+        """Spill the largest step outputs still needed until under budget."""
+        results = self._step_results
+        sizes = {k: self._step_result_nbytes(v) for k, v in results.items()}
+        for name in sorted(sizes, key=sizes.get, reverse=True):
+            if sum(sizes.values()) <= budget or sizes[name] == 0:
+                break
+            if users.get(name, 0) > 0:
+                self._time_report('Spilling step {} ({} bytes) to disk'.format(
+                                  name, sizes[name]))
+                results[name] = self._spill_step_result(name, results[name])
+                sizes[name] = self._step_result_nbytes(results[name])
+
     def needed_products(self, products, overwrite):
         """ Make sure all products exist and return those that need processing """
         # TODO calling RequestedProducts twice is strange; rework into something clean
@@ -1082,10 +1926,123 @@ class Data(object):
         # TODO replace all calls to this method by subclasses with needed_products, then delete.
         return self.needed_products(products, overwrite)
 
+    _composite_nodata = -32768
+
     @classmethod
-    def process_composites(cls, inventory, products, **kwargs):
-        """ Process composite products using provided inventory """
-        pass
+    def process_composites(cls, inventory, products, overwrite=False, **kwargs):
+        """Process composite products using provided inventory.
+
+        A composite product is marked 'composite' in cls._products, and names
+        the product it summarizes with 'composite-source'.  Optionally,
+        'composite-by' groups the inventory's dates into one composite each:
+        'doy' makes one per day of year; by default there is one composite
+        for all dates.  Each composite holds the per-pixel mean, variance,
+        count, min, and max of its source product (see
+        gips.temporal.StreamingStats), and is updated with only new dates
+        on subsequent runs unless overwrite is set.
+        """
+        for p, val in products.items():
+            p_info = cls._products[val[0]]
+            src = p_info.get('composite-source')
+            if src is None:
+                utils.verbose_out('{} has no composite-source; not processing'
+                                  .format(p), 2)
+                continue
+            sources = {} # {tile: {date: source filename}}
+            for date in inventory.dates:
+                for tile, data_obj in inventory[date].tiles.items():
+                    if src not in data_obj.sensors:
+                        with utils.error_handler('Error processing {} for {}'
+                                .format(src, data_obj.basename), continuable=True), \
+                                data_obj.lock():
+                            data_obj.process([src])
+                    if src in data_obj.sensors:
+                        fn = data_obj.filenames[(data_obj.sensors[src], src)]
+                        sources.setdefault(tile, {})[date] = fn
+            for tile, filenames in sources.items():
+                groups = cls.composite_groups(val[0], sorted(filenames))
+                for key, dates in sorted(groups.items()):
+                    fout = cls.composite_filename(p, tile, key)
+                    with utils.error_handler('Error creating ' + fout,
+                                             continuable=True):
+                        cls.composite_stats(
+                            {d: filenames[d] for d in dates}, fout, overwrite)
+
+    @classmethod
+    def composite_groups(cls, product, dates):
+        """Group dates according to the product's 'composite-by' value.
+
+        Returns a dict mapping a key, which is passed to
+        composite_filename(), to a list of dates.
+        """
+        by = cls._products[product].get('composite-by')
+        if by is None:
+            return {'': list(dates)}
+        if by == 'doy':
+            groups = {}
+            for d in dates:
+                groups.setdefault(d.strftime('%j'), []).append(d)
+            return groups
+        raise ValueError("Unknown composite-by value '{}' for {}".format(
+            by, product))
+
+    @classmethod
+    def composite_filename(cls, product, tile, key=''):
+        """Return the full path to a composite product file."""
+        return os.path.join(cls.Asset.Repository.path('composites'), product,
+                            '{}_{}{}.tif'.format(tile, product, key))
+
+    @classmethod
+    def composite_stats(cls, filenames, fout, overwrite=False):
+        """Accumulate per-pixel stats of the given files into fout.
+
+        filenames maps dates to single-band image files.  If fout exists,
+        its stats are updated with any dates not already included in it.
+        The images are processed chunk by chunk, each being read once.
+        """
+        from gips.temporal import StreamingStats
+        start = datetime.now()
+        nodata = cls._composite_nodata
+        datestr = lambda d: d.strftime('%Y%j')
+        old_img, done = None, set()
+        if os.path.exists(fout) and not overwrite:
+            old_img = gippy.GeoImage(fout)
+            done = set(d for d in old_img.Meta('GIPS_Composite_Dates').split(',') if d)
+        new_dates = sorted(d for d in filenames if datestr(d) not in done)
+        if len(new_dates) == 0:
+            utils.verbose_out('{} is up to date'.format(fout), 3)
+            return fout
+        imgs = [gippy.GeoImage(filenames[d]) for d in new_dates]
+        template = imgs[0] if old_img is None else old_img
+        mkdir(os.path.dirname(fout))
+        with utils.make_temp_dir(prefix='composite', dir=os.path.dirname(fout)) as tmp_dir:
+            tmp_fp = os.path.join(tmp_dir, os.path.basename(fout))
+            nbands = len(StreamingStats.band_names)
+            imgout = gippy.GeoImage(tmp_fp, template, gippy.GDT_Float32, nbands)
+            imgout.SetNoData(nodata)
+            for chunk in imgout.Chunks():
+                if old_img is None:
+                    stats = StreamingStats()
+                else:
+                    stats = StreamingStats.from_bands(
+                        [old_img[b].Read(chunk) for b in range(nbands)], nodata)
+                for img in imgs:
+                    arr = img[0].Read(chunk)
+                    stats.update(arr, arr != img[0].NoDataValue())
+                for b, arr in enumerate(stats.bands(nodata)):
+                    imgout[b].Write(arr.astype('float32'), chunk)
+            for b, name in enumerate(StreamingStats.band_names):
+                imgout.SetBandName(name, b + 1)
+            all_dates = sorted(done.union(datestr(d) for d in new_dates))
+            imgout.SetMeta('GIPS_Composite_Dates', ','.join(all_dates))
+            imgout = None
+            old_img = None
+            imgs = None
+            os.rename(tmp_fp, fout)
+        utils.verbose_out('{}: stats for {} new dates ({} total) processed in {}'.format(
+            os.path.basename(fout), len(new_dates), len(all_dates),
+            datetime.now() - start), 2)
+        return fout
 
     def copy(self, dout, products, site=None, res=None, interpolation=0, crop=False,
              overwrite=False, tree=False):
@@ -1127,6 +2084,8 @@ class Data(object):
                     else:
                         gippy.GeoImage(fin).Process(fout)
                         #shutil.copyfile(fin, fout)
+                        utils.apply_output_profile(
+                            fout, utils.output_profile(self.name, p))
         procstr = 'copied' if site is None else 'warped'
         VerboseOut('%s tile %s: %s files %s' % (self.date, self.id, len(products.requested), procstr))
 
@@ -1159,6 +2118,27 @@ class Data(object):
         """
         return True
 
+    @classmethod
+    def inventory_rejects(cls, criteria, **kwargs):
+        """Return (date, tile) pairs the inventory DB shows filter() would reject.
+
+        criteria are the dbinv.asset_search() criteria for the inventory
+        being built.  Lets DataInventory turn filtering into a DB query
+        rather than a look at each Data object; anything not rejected here
+        is still checked with filter().
+        """
+        return []
+
+    @classmethod
+    def filter_is_trivial(cls, **kwargs):
+        """Return True if filter() would pass every Data object given kwargs.
+
+        Lets DataInventory skip instantiating Data objects just to filter
+        them.  Child classes overriding filter() should override this too;
+        the default is only True for classes that don't.
+        """
+        return cls.filter.__func__ is Data.filter.__func__
+
     def meta_dict(self, src_afns=None, additional=None):
         """Returns assembled metadata dict.
 
@@ -1191,11 +2171,11 @@ class Data(object):
         """Search path for non-asset files, usually product files.
 
         These must match the shell glob in self._pattern, and must not
-        be assets, index files, nor xml files.
+        be assets, index files, nor xml or json files.
         """
         filenames = glob.glob(os.path.join(self.path, self._pattern))
         assetnames = [a.filename for a in self.assets.values()]
-        badexts = ['.index', '.xml']
+        badexts = ['.index', '.xml', '.json']
         test = lambda x: x not in assetnames and os.path.splitext(f)[1] not in badexts
         filenames[:] = [f for f in filenames if test(f)]
         return filenames
@@ -1229,6 +2209,8 @@ class Data(object):
         self.assets = {}      # dict of <asset type string>: <Asset instance>
         self.filenames = {}   # dict of (sensor, product): product filename
         self.sensors = {}     # dict of asset/product: sensor
+        self._step_results = {}          # outputs of product steps; see run_steps
+        self.step_timings = OrderedDict() # step name: run time
         if tile is not None and date is not None:
             self.path = self.Repository.data_path(tile, date)
             self.basename = self.id + '_' + self.date.strftime(self.Repository._datedir)
@@ -1302,6 +2284,17 @@ class Data(object):
         """ Return list of products available """
         return list(set(self.products))
 
+    @contextmanager
+    def lock(self):
+        """Hold the repository's lock on this tile & date while processing.
+
+        Once the lock is held, products made meanwhile by other processes
+        are picked up from disk, so needed_products won't make them again.
+        """
+        with self.Repository.lock(self.id, self.date):
+            self.ParseAndAddFiles()
+            yield
+
     def ParseAndAddFiles(self, filenames=None):
         """Parse and Add filenames to existing filenames.
 
@@ -1428,6 +2421,7 @@ class Data(object):
             raise ValueError('Changing verbosity is only permitted when resetting the clock')
         utils.verbose_out('{}:  {}'.format(datetime.now() - start, msg),
                 self._time_report_verbosity)
+        trace.event(msg, tile=self.id, date=self.date)
 
     ##########################################################################
     # Class methods
@@ -1533,7 +2527,8 @@ class Data(object):
         for a, t, d in atd_pile:
             err_msg = 'Problem fetching asset for {}, {}, {}'.format(
                 a, t, d.strftime("%y-%m-%d"))
-            with utils.error_handler(err_msg, continuable=True):
+            with utils.error_handler(err_msg, continuable=True), \
+                    trace.span('fetch', asset=a, tile=t, date=d):
                 if not cls.need_to_fetch(a, t, d, update, **fetch_kwargs):
                     continue
                 # check feature toggle to know how to call fetch():
@@ -1598,6 +2593,33 @@ class Data(object):
             print "  Specify by appending '-option' to product (e.g., ref-toa)"
         sys.stdout.write(txt)
 
+    # shared among all Data objects so windows persist from one date to the next
+    _rolling_windows = OrderedDict()
+    _max_rolling_windows = 8
+
+    def rolling_window(self, key, width, reader, stamp=None, **kwargs):
+        """Return a gips.temporal.RollingWindow advanced to self.date.
+
+        Windows are kept between Data objects, keyed on driver, tile, key,
+        and width, so when dates are processed in order (as
+        DataInventory.process does) each day's asset is read only once.
+        Since windows outlive inventories, `stamp` should identify each
+        day's asset as it is now, eg by its path & mtime, so days whose
+        assets have changed are read again.  `reader`, `stamp`, and kwargs are
+        passed to RollingWindow; `reader` & `stamp` are replaced on each
+        call so they may be bound to self.
+        """
+        from gips.temporal import RollingWindow
+        wkey = (self.name, self.id, key, width)
+        window = Data._rolling_windows.pop(wkey, None)
+        if window is None:
+            window = RollingWindow(width, reader, **kwargs)
+        window.reader, window.stamp = reader, stamp
+        Data._rolling_windows[wkey] = window # most recently used goes last
+        while len(Data._rolling_windows) > self._max_rolling_windows:
+            Data._rolling_windows.popitem(last=False)
+        return window.advance(self.date)
+
     def make_temp_proc_dir(self):
         """Make a temporary directory in which to perform gips processing.
 
@@ -1625,16 +2647,40 @@ class Data(object):
                     del self._temp_proc_dir
         return wrapper
 
-    def archive_temp_path(self, temp_fp):
+    def archive_temp_path(self, temp_fp, product=None):
         """Move the product file from the managed temp dir to the archive.
 
         The archival full path is returned; an appropriate spot in the
-        archive is chosen automatically.
+        archive is chosen automatically.  The file is first rewritten to
+        the configured output profile (see utils.output_profile), so it's
+        never seen in the archive otherwise; product defaults to the last
+        part of the standard product filename.  Callers must release every
+        GeoImage/GDAL handle on temp_fp first, else the rewrite races a
+        writer that flushes into the moved file later.
         """
-        archive_fp = os.path.join(self.path, os.path.basename(temp_fp))
+        bname = os.path.basename(temp_fp)
+        if product is None:
+            product = os.path.splitext(bname)[0].split('_')[-1]
+        utils.apply_output_profile(temp_fp, utils.output_profile(self.name, product))
+        archive_fp = os.path.join(self.path, bname)
         os.rename(temp_fp, archive_fp)
         return archive_fp
 
+    def write_vsi_product(self, vsi_path, temp_fp):
+        """Write a product that is a file within an asset, eg '/vsigzip/...'.
+
+        Per the driver's 'vsi-products' setting, temp_fp becomes either a
+        tiled GeoTIFF copy compressed per 'vsi-compression' ('materialize'),
+        or a symlink to vsi_path ('symlink'), which takes no disk space but
+        makes every windowed read inflate the asset from its start.
+        """
+        if self.get_setting('vsi-products') == 'symlink':
+            os.symlink(vsi_path, temp_fp)
+        else:
+            utils.write_tiled_geotiff(
+                vsi_path, temp_fp, self.get_setting('vsi-compression'))
+        return temp_fp
+
     def generate_temp_path(self, filename):
         """Return a full path to the filename within the managed temp dir.
 
@@ -1697,10 +2743,16 @@ class CloudCoverAsset(Asset):
     together to filter by cloud cover. It needs Asset.cloud_cover() to
     be implemented.
     """
+    db_metadata_fields = ('cloud_cover',)
+    # cloud cover as recorded in the inventory DB, if known
+    db_cloud_cover = None
+
     def filter(self, pclouds=100.0, **kwargs):
         if pclouds >= 100.0:
             return True
-        cc = self.cloud_cover()
+        cc = self.db_cloud_cover
+        if cc is None:
+            cc = self.cloud_cover()
         asset_passes_filter = cc <= pclouds
         msg = ('Asset cloud cover is {}%, meets pclouds threshold of {}%'
                if asset_passes_filter else
@@ -1730,3 +2782,14 @@ class CloudCoverData(Data):
         if not super(CloudCoverData, self).filter(**kwargs):
             return False
         return all([a.filter(pclouds, **kwargs) for a in self.assets.values()])
+
+    @classmethod
+    def filter_is_trivial(cls, pclouds=100.0, **kwargs):
+        return pclouds >= 100.0
+
+    @classmethod
+    def inventory_rejects(cls, criteria, pclouds=100.0, **kwargs):
+        if pclouds >= 100.0:
+            return []
+        return [(d, str(t)) for (d, t) in dbinv.asset_search(
+            cloud_cover__gt=pclouds, **criteria).values_list('date', 'tile').distinct()]
@@ -373,6 +373,7 @@ class gpmData(Data):
             imgout.SetAffine(np.array(self._products[prod_type]
                                       ['_geotransform']))
             imgout[0].Write(imgdata)
+            imgout = None
             # add product to inventory
             archive_fp = self.archive_temp_path(fname)
             self.AddFile(sensor, key, archive_fp)
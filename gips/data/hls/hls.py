@@ -228,6 +228,7 @@ class hlsData(gips.data.core.CloudCoverData):
             imgout.SetMeta(self.prep_meta(
                 a_obj.filename, {'Mask_params': 'union of bits 0 to 3'}))
             # imgout.Process() # TODO needed?
+            imgout = None
             archived_fp = self.archive_temp_path(temp_fp)
             self.AddFile(a_obj.sensor, 'cloudmask', archived_fp)
 
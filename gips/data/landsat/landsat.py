@@ -44,6 +44,7 @@ import numpy
 # once gippy==1.0, switch to GeoRaster.erode
 from scipy.ndimage import binary_dilation
 
+from osgeo import gdal
 import osr
 import gippy
 from gips import __version__ as __gips_version__
@@ -91,8 +92,18 @@ class landsatRepository(Repository):
     default_settings = {
         'source': 'usgs',
         'asset-preference': ('C1', 'C1S3', 'C1GS', 'DN'),
+        'toa-intermediate': 'auto',
     }
 
+    @classmethod
+    def validate_setting(cls, key, value):
+        if key == 'toa-intermediate' and value not in (
+                'auto', 'disk', 'memory', 'recompute'):
+            raise ValueError("Landsat's 'toa-intermediate' setting is '{}', but"
+                             " valid values are 'auto', 'disk', 'memory', or"
+                             " 'recompute'".format(value))
+        return value
+
     @classmethod
     def feature2tile(cls, feature):
         tile = super(landsatRepository, cls).feature2tile(feature)
@@ -332,28 +343,13 @@ class landsatAsset(gips.data.core.CloudCoverAsset,
                 cc_pattern))
         return float(cloud_cover.group(1))
 
-    def cloud_cover(self):
-        """Returns the cloud cover for the current asset.
-
-        Caches and returns the value found in self.meta['cloud-cover']."""
-        if 'cloud-cover' in self.meta:
-            return self.meta['cloud-cover']
-        # first attempt to find or download an MTL file and get the CC value
-        text = None
+    def _mtl_cloud_cover(self):
+        """Returns the cloud cover found in the asset's MTL file."""
         if self.in_cloud_storage():
-            if os.path.exists(self.filename):
-                c1json_content = self.load_c1_json()
-                utils.verbose_out('requesting ' + c1json_content['mtl'], 4)
-                text = self.gs_backoff_get(c1json_content['mtl']).text
-            else:
-                query_results = self.query_gs(self.tile, self.date)
-                if query_results is None:
-                    raise IOError('Could not locate metadata for'
-                                  ' ({}, {})'.format(self.tile, self.date))
-                url = self.gs_object_url_base() + query_results['keys']['mtl']
-                utils.verbose_out('requesting ' + url, 4)
-                text = self.gs_backoff_get(url).text
-        elif os.path.exists(self.filename):
+            c1json_content = self.load_c1_json()
+            utils.verbose_out('requesting ' + c1json_content['mtl'], 4)
+            text = self.gs_read(c1json_content['mtl'])
+        else:
             mtlfilename = self.extract(
                 [f for f in self.datafiles() if f.endswith('MTL.txt')]
             )[0]
@@ -361,8 +357,28 @@ class landsatAsset(gips.data.core.CloudCoverAsset,
             with utils.error_handler(err_msg):
                 with open(mtlfilename, 'r') as mtlfile:
                     text = mtlfile.read()
+        return self.cloud_cover_from_mtl_text(text)
 
-        if text is not None:
+    def cloud_cover(self):
+        """Returns the cloud cover for the current asset.
+
+        Caches and returns the value found in self.meta['cloud-cover'], and
+        for local assets, in the metadata sidecar."""
+        if 'cloud-cover' in self.meta:
+            return self.meta['cloud-cover']
+        # first attempt to find or download an MTL file and get the CC value
+        if os.path.exists(self.filename):
+            self.meta['cloud-cover'] = self.cached_metadata(
+                'cloud-cover', self._mtl_cloud_cover)
+            return self.meta['cloud-cover']
+        if self.in_cloud_storage():
+            query_results = self.query_gs(self.tile, self.date)
+            if query_results is None:
+                raise IOError('Could not locate metadata for'
+                              ' ({}, {})'.format(self.tile, self.date))
+            url = self.gs_object_url_base() + query_results['keys']['mtl']
+            utils.verbose_out('requesting ' + url, 4)
+            text = self.gs_read(url)
             self.meta['cloud-cover'] = self.cloud_cover_from_mtl_text(text)
             return self.meta['cloud-cover']
 
@@ -556,8 +572,8 @@ class landsatAsset(gips.data.core.CloudCoverAsset,
 
         # handle pclouds
         if pclouds < 100:
-            r = cls.gs_backoff_get(cls.gs_object_url_base() + keys['mtl'])
-            cc = cls.cloud_cover_from_mtl_text(r.text)
+            cc = cls.cloud_cover_from_mtl_text(
+                cls.gs_read(cls.gs_object_url_base() + keys['mtl']))
             if cc > pclouds:
                 cc_msg = ('C1GS asset found for ({}, {}), but cloud cover'
                           ' percentage ({}%) fails to meet threshold ({}%)')
@@ -988,6 +1004,54 @@ class landsatData(gips.data.core.CloudCoverData):
         else:
             product_info['latency'] = float("inf")
 
+    # standard products that read the TOA reflectance & temperature image
+    _toa_consumers = ('acca', 'fmask', 'tcap', 'temp', 'volref')
+
+    def _materialize_toa(self, groups):
+        """Decide whether to compute the TOA image once, ahead of the products.
+
+        Governed by the 'toa-intermediate' setting:
+        'recompute' never writes it, so each product recomputes it from the
+        raw bands; 'disk' & 'memory' always write it, to the temp dir or to
+        GDAL's in-memory filesystem respectively; 'auto' (the default)
+        writes it to disk when more than one pass over it is requested.
+        """
+        policy = self.get_setting('toa-intermediate')
+        if policy != 'auto':
+            return policy != 'recompute'
+        passes = len([val for val in groups['Standard'].values()
+                      if val[0] in self._toa_consumers
+                      or (val[0] == 'ref' and 'toa' in val)])
+        # indices are all made in one pass
+        indices = dict(groups['Index'], **groups['Tillage'])
+        passes += any('toa' in val for val in indices.values())
+        passes += bool(groups['ACOLITE'])
+        return passes > 1
+
+    def _toa_intermediate(self, reflimg):
+        """Compute the lazy TOA image once and return it opened from file.
+
+        The float32 copy goes in the temp dir, or under /vsimem/ if so
+        configured; see _materialize_toa.
+        """
+        start = datetime.now()
+        fn = self.basename + '_toa-intermediate.tif'
+        if self.get_setting('toa-intermediate') == 'memory':
+            fn = '/vsimem/' + fn
+        else:
+            fn = self.generate_temp_path(fn)
+        bands = reflimg.BandNames()
+        imgout = gippy.GeoImage(fn, reflimg, gippy.GDT_Float32, len(bands))
+        for i, band in enumerate(bands):
+            imgout.SetBandName(band, i + 1)
+        imgout.SetNoData(-32768)
+        for band in bands:
+            reflimg[band].Process(imgout[band])
+        imgout = None
+        verbose_out(' -> {}: TOA intermediate written in {}'.format(
+                    fn, datetime.now() - start), 3)
+        return gippy.GeoImage(fn)
+
     def _process_indices(self, image, asset_fn, metadata, sensor, indices,
                          coreg_shift=None):
         """Process the given indices and add their files to the inventory.
@@ -1045,17 +1109,15 @@ class landsatData(gips.data.core.CloudCoverData):
                 self.id, self.date
             ))
 
-        band_files = []
-
+        downloads = []
         for path in self.assets['C1GS'].band_paths():
             match = re.match("/[\w_]+/(.+)", path)
             url = match.group(1)
             output_path = os.path.join(
                 output_dir, os.path.basename(url)
             )
-            self.Asset.gs_backoff_downloader(url, output_path)
-            band_files.append(output_path)
-        return band_files
+            downloads.append((url, output_path))
+        return self.Asset.gs_download(downloads)
 
     @property
     def preferred_asset(self):
@@ -1168,6 +1230,7 @@ class landsatData(gips.data.core.CloudCoverData):
                     imgout.SetBandName('Land mask', 1)
                     imgout[0].Write(cfmask)
 
+                imgout = img = None
                 archive_fp = self.archive_temp_path(fname)
                 self.AddFile(sensor, key, archive_fp)
 
@@ -1279,6 +1342,8 @@ class landsatData(gips.data.core.CloudCoverData):
             for col in self.assets[asset].lwbands:
                 reflimg[col] = (((img[col].pow(-1)) * meta[col]['K1'] + 1).log().pow(-1)
                         ) * meta[col]['K2'] - 273.15
+            if self._materialize_toa(groups):
+                reflimg = self._toa_intermediate(reflimg)
 
             # Process standard products (this is in the 'DN' block)
             for key, val in groups['Standard'].items():
@@ -1465,13 +1530,15 @@ class landsatData(gips.data.core.CloudCoverData):
                         imgout.SetNoData(-32768)
                         imgout.SetGain(0.1)
                         tmpimg = gippy.GeoImage(img)
+                        lat = self.metadata['geometry']['lat']
+                        lon = self.metadata['geometry']['lon']
+                        dt = self.metadata['datetime']
+                        runs = MODTRAN.run_bands(
+                            [(meta[col]['bandnum'], meta[col]['wvlen1'], meta[col]['wvlen2'])
+                             for col in lwbands], dt, lat, lon, True)
                         for col in lwbands:
                             band = tmpimg[col]
-                            m = meta[col]
-                            lat = self.metadata['geometry']['lat']
-                            lon = self.metadata['geometry']['lon']
-                            dt = self.metadata['datetime']
-                            atmos = MODTRAN(m['bandnum'], m['wvlen1'], m['wvlen2'], dt, lat, lon, True)
+                            atmos = runs[meta[col]['bandnum']]
                             e = 0.95
                             band = (tmpimg[col] - (atmos.output[1] + (1 - e) * atmos.output[2])
                                     ) / (atmos.output[0] * e)
@@ -1602,7 +1669,10 @@ class landsatData(gips.data.core.CloudCoverData):
                     verbose_out(' -> {}: processed {} in {}'.format(
                             self.basename, prodout.keys(), endtime - start), 1)
                 ## end ACOLITE
+            toa_fn = reflimg.Filename()
             reflimg = None
+            if toa_fn.startswith('/vsimem/'):
+                gdal.Unlink(toa_fn)
 
     def filter(self, pclouds=100, sensors=None, **kwargs):
         """Check if Data object passes filter.
@@ -1621,6 +1691,10 @@ class landsatData(gips.data.core.CloudCoverData):
                 return False
         return True
 
+    @classmethod
+    def filter_is_trivial(cls, pclouds=100, sensors=None, **kwargs):
+        return not sensors and super(landsatData, cls).filter_is_trivial(pclouds, **kwargs)
+
     def meta(self, asset_type):
         """Read in Landsat metadata file and return it as a dict.
 
@@ -1631,11 +1705,18 @@ class landsatData(gips.data.core.CloudCoverData):
             return self.metadata
 
         asset_obj = self.assets[asset_type]
+        self.metadata = asset_obj.cached_metadata(
+            'mtl', lambda: self._parse_mtl(asset_obj))
+        return self.metadata
+
+    def _parse_mtl(self, asset_obj):
+        """Read the asset's MTL file and return its useful contents in a dict.
+
+        See meta(), which caches the result in the asset's metadata sidecar.
+        """
         c1_json = asset_obj.load_c1_json()
         if c1_json:
-            r = self.Asset.gs_backoff_get(c1_json['mtl'])
-            r.raise_for_status()
-            text = r.text
+            text = self.Asset.gs_read(c1_json['mtl'])
             qafn = c1_json['qa-band'].encode('ascii', 'ignore')
         else:
             datafiles = asset_obj.datafiles()
@@ -1720,7 +1801,7 @@ class landsatData(gips.data.core.CloudCoverData):
             'lon': lon,
         }
 
-        self.metadata = {
+        metadata = {
             'filenames': filenames,
             'gain': gain,
             'offset': offset,
@@ -1730,9 +1811,8 @@ class landsatData(gips.data.core.CloudCoverData):
             'clouds': clouds,
         }
         if qafn is not None:
-            self.metadata['qafilename'] = qafn
-        #self.metadata.update(smeta)
-        return self.metadata
+            metadata['qafilename'] = qafn
+        return metadata
 
     def _readqa(self, asset_type):
         """Returns a gippy GeoImage containing a QA band.
@@ -2074,7 +2154,7 @@ class landsatData(gips.data.core.CloudCoverData):
             if os.path.exists(asset.filename):
                 c1json_content = asset.load_c1_json()
                 utils.verbose_out('requesting ' + c1json_content['mtl'], 4)
-                text = self.Asset.gs_backoff_get(c1json_content['mtl']).text
+                text = self.Asset.gs_read(c1json_content['mtl'])
             else:
                 query_results = asset.query_gs(asset.tile, asset.date)
                 if query_results is None:
@@ -2082,7 +2162,7 @@ class landsatData(gips.data.core.CloudCoverData):
                                   ' ({}, {})'.format(self.tile, self.date))
                 url = cls.gs_object_url_base() + query_results['keys']['mtl']
                 utils.verbose_out('requesting ' + url, 4)
-                text = self.Asset.gs_backoff_get(url).text
+                text = self.Asset.gs_read(url)
         else:
             print('asset is "{}"'.format(asset.asset))
             mtl = asset.extract([f for f in asset.datafiles() if f.endswith("MTL.txt")])[0]
@@ -614,6 +614,7 @@ class merraData(Data):
             elif val[0] == 'profile':
                 pass
             """
+            imgout = None
 
             # add product to inventory
             archive_fp = self.archive_temp_path(fout)
@@ -266,8 +266,10 @@ class modisAsset(Asset, gips.data.core.S3Mixin):
     def query_s3(cls, tile, date):
         """Look in S3 for modis asset components and assemble links to same."""
         h, v = cls.parse_tile(tile)
+        # list the tile's whole year at once; other dates will need it too
+        year_prefix = 'MCD43A4.006/{}/{}/{}'.format(h, v, date.year)
         prefix = 'MCD43A4.006/{}/{}/{}/'.format(h, v, date.strftime('%Y%j'))
-        keys = cls.s3_prefix_search(prefix)
+        keys = [k for k in cls.s3_prefix_search(year_prefix) if k.startswith(prefix)]
         tifs = []
         qa_tifs = []
         json_md = None
@@ -1025,11 +1027,11 @@ class modisData(Data):
 
             # set metadata
             imgout.SetMeta(self.prep_meta(a_fnames, meta))
+            imgout = None  # to cover for GDAL's internal problems
 
             # add product to inventory
             archive_fp = self.archive_temp_path(fname)
             self.AddFile(sensor, key, archive_fp)
-            del imgout  # to cover for GDAL's internal problems
             utils.verbose_out(' -> {}: processed in {}'.format(
                 os.path.basename(fname), datetime.datetime.now() - start), level=1)
 
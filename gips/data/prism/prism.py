@@ -52,6 +52,10 @@ class prismRepository(Repository):
     description = 'PRISM Gridded Climate Data'
     _datedir = '%Y%m%d'
     _tile_attribute = 'id'
+    default_settings = {
+        'vsi-products': 'symlink',
+        'vsi-compression': 'DEFLATE',
+    }
 
 
 class prismAsset(gips.data.core.FtpAsset):
@@ -178,6 +182,22 @@ class prismData(Data):
         """'conus' is invalid, but 'CONUS' is valid, so help the user out."""
         return tile_string.upper()
 
+    def _read_ppt(self, date):
+        """Read a day's precipitation grid for pptsum; None if not found."""
+        assets = self.Asset.discover(self.id, date, '_ppt')
+        if len(assets) == 0:
+            return None
+        bil = os.path.join('/vsizip/' + assets[0].filename,
+                           assets[0].datafiles()[0])
+        return GeoImage(bil)[0].Read()
+
+    def _ppt_stamp(self, date):
+        """Identify a day's precipitation asset as it is now, for pptsum."""
+        assets = self.Asset.discover(self.id, date, '_ppt')
+        if len(assets) == 0:
+            return None
+        return (assets[0].filename, os.path.getmtime(assets[0].filename))
+
     def process(self, *args, **kwargs):
         """Deduce which products need producing, then produce them."""
         products = super(prismData, self).process(*args, **kwargs)
@@ -230,59 +250,45 @@ class prismData(Data):
             if val[0] in ['ppt', 'tmin', 'tmax']:
                 with self.make_temp_proc_dir() as tmp_dir:
                     tmp_fp = os.path.join(tmp_dir, prod_fn)
-                    os.symlink(vsinames[self._products[key]['assets'][0]], tmp_fp)
-                    os.rename(tmp_fp, archived_fp)
+                    self.write_vsi_product(
+                        vsinames[self._products[key]['assets'][0]], tmp_fp)
+                    archived_fp = self.archive_temp_path(tmp_fp, key)
             elif val[0] == 'pptsum':
                 if len(val) < 2:
                     lag = 3 # no argument provided, use default lag of 3 days SB configurable.
                     prod_fn = re.sub(r'\.tif$', '-{}.tif'.format(lag), prod_fn)
-                    archived_fp = os.path.join(self.path, prod_fn) # have to regenerate, sigh
                     utils.verbose_out('Using default lag of {} days.'.format(lag), 2)
                 else:
                     with utils.error_handler("Error for pptsum lag value '{}').".format(val[1])):
                         lag = int(val[1])
 
-                date_spec = '{},{}'.format(
-                    datetime.strftime(
-                        self.date - timedelta(days=lag), '%Y-%m-%d',
-                    ),
-                    datetime.strftime(self.date, '%Y-%m-%d'),
-                )
-                inv = self.inventory(dates=date_spec, products=['ppt'],)
-                inv.process()
-                # because DataInventory object doesn't update
-                inv = self.inventory(dates=date_spec, products=['ppt'],)
-                if len(inv.data) < lag:
+                window = self.rolling_window(
+                    'pptsum', lag + 1, self._read_ppt, self._ppt_stamp, min_count=lag)
+                if not window.complete():
                     utils.verbose_out(
                         '{}: requires {} preceding days ppt ({} found).'
-                        .format(key, lag, len(inv.data)),
+                        .format(key, lag, window.count),
                         3,
                     )
                     continue  # go to next product to process
-                imgs = []
-                asset_fns = [] # have to grab filenames for multiple days
-                for tileobj in inv.data.values():
-                    datobj = tileobj.tiles.values()[0]
-                    asset_fns.append(
-                        os.path.basename(datobj.assets['_ppt'].filename))
-                    imgs.append(GeoImage(get_bil_vsifile(datobj, '_ppt')))
+                # have to grab filenames for multiple days
+                asset_fns = [os.path.basename(a.filename)
+                             for d in window.dates
+                             for a in self.Asset.discover(self.id, d, '_ppt')]
 
                 with self.make_temp_proc_dir() as tmp_dir:
                     tmp_fp = os.path.join(tmp_dir, prod_fn)
-                    oimg = GeoImage(tmp_fp, imgs[0])
+                    imgin = GeoImage(vsinames['_ppt'])
+                    oimg = GeoImage(tmp_fp, imgin)
+                    imgin = None
                     oimg.SetNoData(-9999)
                     oimg.SetBandName(
                         description + '({} day window)'.format(lag), 1
                     )
                     oimg.SetMeta(self.prep_meta(sorted(asset_fns)))
-                    for chunk in oimg.Chunks():
-                        oarr = oimg[0].Read(chunk) * 0.0 # wat
-                        for img in imgs:
-                            oarr += img[0].Read(chunk)
-                        oimg[0].Write(oarr, chunk)
-                    oimg.Process()
-                    os.rename(tmp_fp, archived_fp)
-                oimg = None  # help swig+gdal with GC
+                    oimg[0].Write(window.sum().astype('float32'))
+                    oimg = None
+                    archived_fp = self.archive_temp_path(tmp_fp, key)
                 products.requested.pop(key)
             self.AddFile(sensor, key, archived_fp)  # add product to inventory
         return products
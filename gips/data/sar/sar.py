@@ -236,7 +236,12 @@ class sarAsset(Asset):
 
     def get_meta_dict(self):
         if not self._meta_dict:
-            self._proc_meta()
+            def proc_meta():
+                self._proc_meta()
+                return dict(self._meta_dict, rootname=self.rootname)
+            meta = dict(self.cached_metadata('meta', proc_meta))
+            self.rootname = meta.pop('rootname')
+            self._meta_dict = meta
         assert self._meta_dict
         return copy.deepcopy(self._meta_dict)
 
@@ -445,6 +450,7 @@ class sarData(Data):
             # True = r/w mode, otherwise SetMeta silently does nothing
             smi = gippy.GeoImage(fname, True)
             smi.SetMeta(self.prep_meta(self.assets[asset].filename))
+            smi = img = None
             archive_fp = self.archive_temp_path(fname)
             self.AddFile(sensor, key, archive_fp)
         # Remove unused files
@@ -34,6 +34,7 @@ import zipfile
 import copy
 import glob
 from itertools import izip_longest
+from collections import OrderedDict
 from xml.etree import ElementTree
 import StringIO
 
@@ -48,7 +49,7 @@ from shapely.wkt import loads as wkt_loads
 import gippy
 import gippy.algorithms
 
-from gips.data.core import Repository, Asset, Data
+from gips.data.core import Repository, Asset, Data, ProductStep
 import gips.data.core
 from gips import utils
 from gips import atmosphere
@@ -440,9 +441,8 @@ class sentinel2Asset(gips.data.core.CloudCoverAsset,
             return None
 
         # handle cloud cover
-        r = cls.gs_backoff_get(cls.gs_object_url_base() + keys['tile-md'])
-        cc = cls.cloud_cover_from_et(
-                ElementTree.parse(StringIO.StringIO(r.text)))
+        text = cls.gs_read(cls.gs_object_url_base() + keys['tile-md'])
+        cc = cls.cloud_cover_from_et(ElementTree.parse(StringIO.StringIO(text)))
         if cc > pclouds:
             cc_msg = ('C1GS asset found for {}, but cloud cover'
                       ' percentage ({}%) fails to meet threshold ({}%)')
@@ -564,7 +564,7 @@ class sentinel2Asset(gips.data.core.CloudCoverAsset,
                 assets += orig_aol
                 overwritten_assets += orig_overwritten_aol
             if not keep:
-                utils.RemoveFiles([fn], ['.index', '.aux.xml'])
+                utils.RemoveFiles([fn], ['.index', '.aux.xml', '.meta.json'])
 
         return assets, overwritten_assets
 
@@ -605,16 +605,20 @@ class sentinel2Asset(gips.data.core.CloudCoverAsset,
     def cloud_cover(self):
         """Returns cloud cover for the current asset.
 
-        Caches and returns the value found in self.meta['cloud-cover']."""
+        Caches and returns the value found in self.meta['cloud-cover'], and
+        for local assets, in the metadata sidecar."""
         if 'cloud-cover' in self.meta:
             return self.meta['cloud-cover']
         if os.path.exists(self.filename):
-            with utils.make_temp_dir() as tmpdir:
-                metadata_file = next(f for f in self.datafiles()
-                    if re.match(self.style_res['tile-md-re'], f))
-                self.extract([metadata_file], path=tmpdir)
-                tree = ElementTree.parse(tmpdir + '/' + metadata_file)
-            self.meta['cloud-cover'] = self.cloud_cover_from_et(tree)
+            def tile_md_cloud_cover():
+                with utils.make_temp_dir() as tmpdir:
+                    metadata_file = next(f for f in self.datafiles()
+                        if re.match(self.style_res['tile-md-re'], f))
+                    self.extract([metadata_file], path=tmpdir)
+                    tree = ElementTree.parse(tmpdir + '/' + metadata_file)
+                return self.cloud_cover_from_et(tree)
+            self.meta['cloud-cover'] = self.cached_metadata(
+                'cloud-cover', tile_md_cloud_cover)
             return self.meta['cloud-cover']
 
         results = self.query_scihub(
@@ -656,8 +660,8 @@ class sentinel2Asset(gips.data.core.CloudCoverAsset,
                 return ElementTree.parse(metadata_zf)
 
     def xml_subtree_gs(self, md_file_type):
-        r = self.gs_backoff_get(self.json_content[md_file_type + '-md'])
-        return ElementTree.fromstring(r.content)
+        return ElementTree.fromstring(
+            self.gs_read(self.json_content[md_file_type + '-md']))
 
     def xml_subtree(self, md_file_type, *tags):
         tree = {'L1C': self.xml_subtree_esa,
@@ -675,11 +679,15 @@ class sentinel2Asset(gips.data.core.CloudCoverAsset,
         """Read the tile metadata xml file and extract values of interest.
 
         Return values are in degrees.  Mainly exists to avoid reading
-        the file more than once.
+        the file more than once; values are also kept in the metadata sidecar.
         """
 
-        if self.tile_meta is not None:
-            return self.tile_meta
+        if self.tile_meta is None:
+            self.tile_meta = tuple(self.cached_metadata(
+                'tile-angles', self._read_tile_angles))
+        return self.tile_meta
+
+    def _read_tile_angles(self):
         mva_elem, msa_elem = self.xml_subtree(
             'tile', 'Mean_Viewing_Incidence_Angle_List', 'Mean_Sun_Angle')
         # set viewing angle metadata (should only be one list, with 13 elems,
@@ -690,8 +698,7 @@ class sentinel2Asset(gips.data.core.CloudCoverAsset,
         # set solar angle metadata
         msza = float(msa_elem.find('ZENITH_ANGLE').text)
         msaa = float(msa_elem.find('AZIMUTH_ANGLE').text)
-        self.tile_meta = mvza, mvaa, msza, msaa
-        return self.tile_meta
+        return [float(mvza), float(mvaa), msza, msaa]
 
     @lru_cache(maxsize=1)
     def raster_full_paths(self):
@@ -712,6 +719,9 @@ class sentinel2Asset(gips.data.core.CloudCoverAsset,
         a surface per unit wavelength:
         https://en.wikipedia.org/wiki/Spectral_flux_density
         """
+        return self.cached_metadata('solar-irradiances', self._read_solar_irradiances)
+
+    def _read_solar_irradiances(self):
         sil_elem = self.xml_subtree('datastrip', 'Solar_Irradiance_List')
         values_tags = sil_elem.findall('SOLAR_IRRADIANCE')
         # sanity check that the bands are in the right order
@@ -858,55 +868,46 @@ class sentinel2Data(gips.data.core.CloudCoverData):
     # acolite doesn't (yet?) support google storage sentinel-2 data
     atmosphere.add_acolite_product_dicts(_products, 'L1C', s2=True)
 
-    _product_dependencies = {
-        'indices':      'ref',
-        'indices-toa':  'ref-toa',
-        'ref':          'rad-toa',
-        'rad':          'rad-toa',
-        'rad-toa':      'ref-toa',
-        'ref-toa':      None, # has no deps but the asset
-        'cfmask':       None,
-        'mtci-toa':     'ref-toa',
-        's2rep-toa':    'ref-toa',
-        'mtci':         'ref',
-        's2rep':        'ref',
-        'cloudmask':	'cfmask',
+    _product_steps = {
+        'ref-toa':      ProductStep('ref_toa_geoimage'),
+        'rad-toa':      ProductStep('rad_toa_geoimage', ['ref-toa']),
+        'rad':          ProductStep('rad_geoimage', ['rad-toa']),
+        'ref':          ProductStep('ref_geoimage', ['rad-toa']),
+        'cfmask':       ProductStep('fmask_geoimage'),
+        'cloudmask':    ProductStep('cloudmask_geoimage', ['cfmask']),
+        'indices':      ProductStep(inputs=['ref']),
+        'indices-toa':  ProductStep(inputs=['ref-toa']),
+        # red & red edge bands, read once for both mtci & s2rep
+        'rededge-toa':  ProductStep('rededge_arrays', ['ref-toa'], ['toa']),
+        'rededge':      ProductStep('rededge_arrays', ['ref'], ['surf']),
+        'mtci-toa':     ProductStep('mtci_geoimage', ['ref-toa', 'rededge-toa'], ['toa']),
+        's2rep-toa':    ProductStep('s2rep_geoimage', ['ref-toa', 'rededge-toa'], ['toa']),
+        'mtci':         ProductStep('mtci_geoimage', ['ref', 'rededge'], ['surf']),
+        's2rep':        ProductStep('s2rep_geoimage', ['ref', 'rededge'], ['surf']),
     }
 
     def plan_work(self, requested_products, overwrite):
         """Plan processing run using requested products & their dependencies.
 
-        Returns a set of processing steps needed to generate
-        requested_products.  For instance, 'rad-toa' depends on
-        'ref-toa', so if the user requests 'rad-toa', set(['rad-toa',
-        'ref-toa']) is returned.  But if 'ref-toa' is already in the
-        inventory, it is omitted, unless overwrite is True.
-        requested_products should contain strings matching
-        _product_dependencies above.
+        Returns the steps (see _product_steps) needed to generate
+        requested_products, in an order they can be run.  For instance,
+        'rad-toa' depends on 'ref-toa', so if the user requests 'rad-toa',
+        ['ref-toa', 'rad-toa'] is returned.  But if 'ref-toa' is already in
+        the inventory, it is omitted, unless overwrite is True.
         """
         surf_indices = self._productgroups['Index']
         toa_indices  = [i + '-toa' for i in self._productgroups['Index']]
         acolite_products = self._productgroups['ACOLITE']
-        _pd = self._product_dependencies
-        work = set()
+        targets = []
         for rp in requested_products:
             # handle indices specially
             if rp in surf_indices:
-                prereq = 'indices'
+                targets.append('indices')
             elif rp in toa_indices:
-                prereq = 'indices-toa'
-            elif rp in acolite_products:
-                prereq = None
-            else:
-                if rp not in _pd:
-                    raise ValueError(
-                            'Could not find dependency listing for ' + rp)
-                prereq = rp
-            # go thru each prereq and add it in if it's not already present, respecting overwrite.
-            while prereq in _pd and (overwrite or prereq not in self.products):
-                work.add(prereq)
-                prereq = _pd[prereq]
-        return work
+                targets.append('indices-toa')
+            elif rp not in acolite_products:
+                targets.append(rp)
+        return self.plan_steps(targets, overwrite)
 
     def current_asset(self):
         return next(self.assets[at]
@@ -915,26 +916,6 @@ class sentinel2Data(gips.data.core.CloudCoverData):
     def current_sensor(self):
         return self.current_asset().sensor
 
-    def load_image(self, product):
-        """Load a product file into a GeoImage and return it
-
-        The GeoImage is instead fetched from a cache if possible.
-        (sensor, product) should match an entry from self.filenames.
-        """
-        if product in self._product_images:
-            return self._product_images[product]
-        image = gippy.GeoImage(self.filenames[(self.current_sensor(), product)])
-        self._product_images[product] = image
-        return image
-
-    def _drop_geoimage_cache(self):
-        """GeoImage objects hold a file handle.  Dropping them to avoid
-        filesystme complications.
-        """
-        for k in self._product_images:
-            v = self._product_images.pop(k)
-            del v
-
     @classmethod
     def normalize_tile_string(cls, tile_string):
         """Sentinel-2 customized tile-string normalizer.
@@ -971,16 +952,15 @@ class sentinel2Data(gips.data.core.CloudCoverData):
             raise
 
         self._time_report('Start download from GCS')
-        band_files = []
+        downloads = []
         for path in self.raster_paths():
             match = re.match("/[\w_]+/(.+)", path)
             url = match.group(1)
             output_path = os.path.join(
                 output_dir, os.path.basename(url)
             )
-            if not os.path.exists(output_path):
-                self.Asset.gs_backoff_downloader(url, output_path)
-            band_files.append(output_path)
+            downloads.append((url, output_path))
+        band_files = self.Asset.gs_download(downloads)
         self._time_report('Finished download from GCS ({} bands)'.format(len(band_files)))
         return band_files
 
@@ -997,19 +977,13 @@ class sentinel2Data(gips.data.core.CloudCoverData):
             'indices-bands', 'band-strings', 'colors')
         vrt_filename = os.path.join(self._temp_proc_dir,
                                     self.basename + '_ref-toa.vrt')
-        cmd_args = ('gdalbuildvrt -tr 20 20 -separate'
-                    ' -srcnodata 0 -vrtnodata 0').split(' ')
         if ao.asset == 'L1CGS':
             raster_paths = self._download_gcs_bands(self._temp_proc_dir)
         else:
             raster_paths = self.raster_paths()
-        cmd_args += [vrt_filename] + [
-            f for f in raster_paths if f[-6:-4] in indices_bands]
-        p = subprocess.Popen(cmd_args)
-        p.communicate()
-        if p.returncode != 0:
-            raise IOError("Expected gdalbuildvrt exit status 0,"
-                          " got {}".format(p.returncode))
+        utils.build_vrt(vrt_filename,
+                        [f for f in raster_paths if f[-6:-4] in indices_bands],
+                        resolution=(20, 20), separate=True, nodata=0)
 
         vrt_img = gippy.GeoImage(vrt_filename)
         vrt_img.SetNoData(0)
@@ -1017,8 +991,8 @@ class sentinel2Data(gips.data.core.CloudCoverData):
         # eg:   1        '02', which yields color_name 'BLUE'
         for band_num, band_string in enumerate(indices_bands, 1): # starts at 0
             vrt_img.SetBandName(colors[b_strings.index(band_string)], band_num)
-        self._product_images['ref-toa'] = vrt_img
         self._time_report('Finished VRT for ref-toa image')
+        return vrt_img
 
     def rad_toa_geoimage(self):
         """Reverse-engineer TOA ref data back into a TOA radiance product.
@@ -1027,7 +1001,7 @@ class sentinel2Data(gips.data.core.CloudCoverData):
         product.
         """
         self._time_report('Starting reversion to TOA radiance.')
-        reftoa_img = self.load_image('ref-toa')
+        reftoa_img = self.step_result('ref-toa')
         asset_instance = self.current_asset()
         colors = asset_instance.sensor_spec('colors')
         radiance_factors = asset_instance.radiance_factors()
@@ -1040,12 +1014,12 @@ class sentinel2Data(gips.data.core.CloudCoverData):
                 'TOA radiance reversion factor for {} (band {}): {}'.format(color, i + 1, rf))
             rad_image[i] = rad_image[i] * rf
         rad_image.SetNoData(0)
-        self._product_images['rad-toa'] = rad_image
+        return rad_image
 
     def rad_geoimage(self):
         """Transmute TOA radiance product into a surface radiance product."""
         self._time_report('Setting up for converting radiance from TOA to surface')
-        rad_toa_img = self.load_image('rad-toa')
+        rad_toa_img = self.step_result('rad-toa')
         ca = self.current_asset()
         atm6s = ca.generate_atmo_corrector()
 
@@ -1066,7 +1040,7 @@ class sentinel2Data(gips.data.core.CloudCoverData):
             # inherent radiance, to get a reasonable difference.
             lu = 0.0001 * Lu
             rad_image[c] = (rad_toa_img[c] - lu) / T
-        self._product_images['rad'] = rad_image
+        return rad_image
 
 
     def process_indices(self, mode, sensor, indices):
@@ -1082,12 +1056,12 @@ class sentinel2Data(gips.data.core.CloudCoverData):
 
         metadata = self.prep_meta()
         if mode != 'toa':
-            image = self.load_image('ref')
+            image = self.step_result('ref')
             # this faff is needed because gippy shares metadata across images behind your back
             metadata['AOD Source'] = getattr(image, '_aod_source', image.Meta('AOD Source'))
             metadata['AOD Value']  = getattr(image, '_aod_value',  image.Meta('AOD Value'))
         else:
-            image = self.load_image('ref-toa')
+            image = self.step_result('ref-toa')
 
         # reminder - indices' values are the keys, split by hyphen, eg {ndvi-toa': ['ndvi', 'toa']}
         gippy_input = {} # map prod types to temp output filenames for feeding to gippy
@@ -1154,7 +1128,7 @@ class sentinel2Data(gips.data.core.CloudCoverData):
         self._time_report('Computing atmospheric corrections for surface reflectance')
         atm6s = ao.generate_atmo_corrector()
         scaling_factor = 0.001 # to prevent chunky small ints
-        rad_toa_image = self.load_image('rad-toa')
+        rad_toa_image = self.step_result('rad-toa')
         sr_image = gippy.GeoImage(rad_toa_image)
         # set meta to pass along to indices
         sr_image._aod_source = str(atm6s.aod[0])
@@ -1164,7 +1138,7 @@ class sentinel2Data(gips.data.core.CloudCoverData):
             lu = 0.0001 * Lu # see rad_geoimage for reason for this
             TLdS = T * Ld * scaling_factor
             sr_image[c] = (rad_toa_image[c] - lu) / TLdS
-        self._product_images['ref'] = sr_image
+        return sr_image
 
     def fmask_geoimage(self):
         """Generate cloud mask.
@@ -1177,21 +1151,13 @@ class sentinel2Data(gips.data.core.CloudCoverData):
 
         ao = self.current_asset()
 
-        DEVNULL = open(os.devnull, 'w')
-
         print("ASSET", ao.asset)
         if ao.asset == 'L1CGS':
             band_files = self._download_gcs_bands(self._temp_proc_dir)
         else:
             band_files = self.raster_paths()
-        gdalbuildvrt_args = [
-            "gdalbuildvrt",
-            "-resolution", "user",
-            "-tr", "20", "20",
-            "-separate",
-            "%s/allbands.vrt" % self._temp_proc_dir,
-        ] + band_files
-        subprocess.check_call(gdalbuildvrt_args, stderr=DEVNULL)
+        utils.build_vrt("%s/allbands.vrt" % self._temp_proc_dir, band_files,
+                        resolution=(20, 20), separate=True)
 
         # set up commands
         angles_cmd_list = [
@@ -1220,13 +1186,11 @@ class sentinel2Data(gips.data.core.CloudCoverData):
             finally:
                 os.chdir(prev_wd)
 
-        DEVNULL.close()
-        fmask_image = gippy.GeoImage("%s/cloudmask.tif" % self._temp_proc_dir)
-        self._product_images['cfmask'] = fmask_image
+        return gippy.GeoImage("%s/cloudmask.tif" % self._temp_proc_dir)
 
 
     def cloudmask_geoimage(self):
-        fmask_image = self.load_image('cfmask')
+        fmask_image = self.step_result('cfmask')
         npfm = fmask_image.Read()
         # cfmask values:
         # 0 = NoData
@@ -1248,8 +1212,18 @@ class sentinel2Data(gips.data.core.CloudCoverData):
             1
         )
         cloudmask_img[0].Write(np_cloudmask)
-        self._product_images['cloudmask'] = cloudmask_img
+        return cloudmask_img
+
 
+    def rededge_arrays(self, mode):
+        """Read the red & red edge bands needed by mtci & s2rep.
+
+        Returns a dict of band name to numpy array, for the toa or surface
+        reflectance image according to mode.
+        """
+        ref_img = self.step_result('ref-toa' if mode == 'toa' else 'ref')
+        return {b: ref_img[b].Read()
+                for b in ('RED', 'REDEDGE1', 'REDEDGE2', 'REDEDGE3')}
 
     def mtci_geoimage(self, mode):
         """Generate Python implementation of MTCI."""
@@ -1257,12 +1231,9 @@ class sentinel2Data(gips.data.core.CloudCoverData):
         # gips_process sentinel2 -t 16TDP -d 2017-10-01 -v5 -p mtci --overwrite
         self._time_report('Generating MTCI')
 
-        # change this to 'ref'
-        ref_img = self.load_image('ref-toa' if mode == 'toa' else 'ref')
-
-        b4 = ref_img['RED'].Read()
-        b5 = ref_img['REDEDGE1'].Read()
-        b6 = ref_img['REDEDGE2'].Read()
+        ref_img = self.step_result('ref-toa' if mode == 'toa' else 'ref')
+        bands = self.step_result('rededge-toa' if mode == 'toa' else 'rededge')
+        b4, b5, b6 = [bands[b] for b in ('RED', 'REDEDGE1', 'REDEDGE2')]
 
         gain = 0.0002
         missing = -32768
@@ -1274,27 +1245,22 @@ class sentinel2Data(gips.data.core.CloudCoverData):
         mtci[mtci != missing] = mtci[mtci != missing]/gain
         mtci = mtci.astype('int16')
 
-        mtci_filename = "%s/mtci.tif" % self._temp_proc_dir
+        mtci_filename = "%s/mtci-%s.tif" % (self._temp_proc_dir, mode)
         mtci_img = gippy.GeoImage(mtci_filename, ref_img, gippy.GDT_Int16, 1)
 
         mtci_img[0].Write(mtci)
         mtci_img[0].SetGain(gain)
         mtci_img[0].SetNoData(missing)
-
-        self._product_images[
-                'mtci-toa' if mode == 'toa' else 'mtci'] = mtci_img
+        return mtci_img
 
     def s2rep_geoimage(self, mode):
         """Generate Python implementation of S2REP."""
         self._time_report('Generating S2REP')
 
-        # change this to 'ref'
-        ref_img = self.load_image('ref-toa' if mode == 'toa' else 'ref')
-
-        b4 = ref_img['RED'].Read()
-        b5 = ref_img['REDEDGE1'].Read()
-        b6 = ref_img['REDEDGE2'].Read()
-        b7 = ref_img['REDEDGE3'].Read()
+        ref_img = self.step_result('ref-toa' if mode == 'toa' else 'ref')
+        bands = self.step_result('rededge-toa' if mode == 'toa' else 'rededge')
+        b4, b5, b6, b7 = [bands[b] for b in
+                          ('RED', 'REDEDGE1', 'REDEDGE2', 'REDEDGE3')]
 
         gain = 0.04
         offset = 400.
@@ -1308,16 +1274,14 @@ class sentinel2Data(gips.data.core.CloudCoverData):
         s2rep[s2rep != missing] = (s2rep[s2rep != missing] - offset)/gain
         s2rep = s2rep.astype('int16')
 
-        s2rep_filename = "%s/s2rep.tif" % self._temp_proc_dir
+        s2rep_filename = "%s/s2rep-%s.tif" % (self._temp_proc_dir, mode)
         s2rep_img = gippy.GeoImage(s2rep_filename, ref_img, gippy.GDT_Int16, 1)
 
         s2rep_img[0].Write(s2rep)
         s2rep_img[0].SetGain(gain)
         s2rep_img[0].SetOffset(offset)
         s2rep_img[0].SetNoData(missing)
-
-        self._product_images[
-                's2rep-toa' if mode == 'toa' else 's2rep'] = s2rep_img
+        return s2rep_img
 
     @Data.proc_temp_dir_manager
     def process(self, products=None, overwrite=False, **kwargs):
@@ -1336,50 +1300,33 @@ class sentinel2Data(gips.data.core.CloudCoverData):
         if len(products) == 0:
             utils.verbose_out('No new processing required.')
             return
-        self._product_images = {}
+        self._step_results = {}
 
         work = self.plan_work(products.requested.keys(), overwrite) # see if we can save any work
 
         if (a_obj.asset == 'L1C' and a_obj.style == a_obj.ds_style and
-                work & set(self._productgroups['ACOLITE'])):
+                set(work) & set(self._productgroups['ACOLITE'])):
             raise NotImplementedError(
                 "Datastrip assets aren't compatible with acolite")
 
         # only do the bits that need doing
-        if 'ref-toa' in work:
-            self.ref_toa_geoimage()
-        if 'rad-toa' in work:
-            self.rad_toa_geoimage()
-        if 'rad' in work:
-            self.rad_geoimage()
-        if 'ref' in work:
-            self.ref_geoimage()
-        if 'cfmask' in work:
-            self.fmask_geoimage()
-        if 'cloudmask' in work:
-            self.cloudmask_geoimage()
-        if 'mtci-toa' in work:
-            self.mtci_geoimage('toa')
-        if 's2rep-toa' in work:
-            self.s2rep_geoimage('toa')
-        if 'mtci' in work:
-            self.mtci_geoimage('surf')
-        if 's2rep' in work:
-            self.s2rep_geoimage('surf')
+        self.run_steps(work, keep=list(products.groups()['Standard'])
+                                  + ['indices', 'indices-toa'])
 
         self._time_report('Starting on standard product processing')
 
         sensor = self.current_sensor()
-        # Process standard products
+        # Process standard products:  set up each output, then write them all
+        # in a single pass over the source images
+        outputs = OrderedDict() # prod_type: (temp_fp, source_image, output_image)
         for prod_type in products.groups()['Standard']:
             err_msg = 'Error creating product {} for {}'.format(
                     prod_type, a_obj.basename)
             with utils.error_handler(err_msg, continuable=True):
-                self._time_report('Starting {} processing'.format(prod_type))
                 temp_fp = self.temp_product_filename(sensor, prod_type)
                 # have to reproduce the whole object because gippy refuses to write metadata when
                 # you do image.Process(filename).
-                source_image = self._product_images[prod_type]
+                source_image = self.step_result(prod_type)
                 output_image = gippy.GeoImage(temp_fp, source_image)
                 output_image.SetNoData(0)
                 output_image.SetMeta(self.prep_meta())
@@ -1404,14 +1351,40 @@ class sentinel2Data(gips.data.core.CloudCoverData):
                     output_image.SetNoData(-32768)
                 for b_num, b_name in enumerate(source_image.BandNames(), 1):
                     output_image.SetBandName(b_name, b_num)
-                # process bandwise because gippy had an error doing it all at once
-                for i in range(len(source_image)):
-                    source_image[i].Process(output_image[i])
+                outputs[prod_type] = (temp_fp, source_image, output_image)
+
+        self._time_report('Writing {}'.format(outputs.keys()))
+        try:
+            utils.process_images([(src, out) for (_, src, out) in outputs.values()])
+        except Exception as e:
+            # fall back to writing the products one by one, so a bad one
+            # doesn't cost the others
+            utils.verbose_out('Writing products in one pass failed ({}); writing'
+                              ' them one at a time'.format(e), 2)
+            for prod_type, (_, source_image, output_image) in outputs.items():
+                written = False
+                err_msg = 'Error creating product {} for {}'.format(
+                        prod_type, a_obj.basename)
+                with utils.error_handler(err_msg, continuable=True):
+                    # process bandwise because gippy had an error doing it all at once
+                    for i in range(len(source_image)):
+                        source_image[i].Process(output_image[i])
+                    written = True
+                if not written:
+                    del outputs[prod_type]
+        # python 2 leaks loop & comprehension variables; they'd keep the last
+        # product's images (and so its temp file) open past archiving
+        src = out = source_image = output_image = None
+        for prod_type in outputs.keys():
+            # drop the images to close the file; gc hint due to C++/swig weirdness
+            temp_fp = outputs.pop(prod_type)[0]
+            err_msg = 'Error archiving product {} for {}'.format(
+                    prod_type, a_obj.basename)
+            with utils.error_handler(err_msg, continuable=True):
                 archive_fp = self.archive_temp_path(temp_fp)
                 self.AddFile(sensor, prod_type, archive_fp)
-
-            self._time_report('Finished {} processing'.format(prod_type))
-            (source_image, output_image) = (None, None) # gc hint due to C++/swig weirdness
+                self._time_report('Finished {} processing'.format(prod_type))
+        outputs = None
         self._time_report('Completed standard product processing')
 
         # process indices in two groups:  toa and surf
@@ -1425,8 +1398,7 @@ class sentinel2Data(gips.data.core.CloudCoverData):
         if len(products.groups()['ACOLITE']) > 0:
             self.process_acolite(products.groups()['ACOLITE'])
 
-        self._product_images = {} # hint for gc; may be needed due to C++/swig weirdness
+        # GeoImage objects hold file handles; drop them to avoid filesystem
+        # complications (& as a hint for gc due to C++/swig weirdness)
+        self._step_results = {}
         self._time_report('Processing complete for this spatial-temporal unit')
-
-        ## Drop GeoImage cache
-        self._drop_geoimage_cache()
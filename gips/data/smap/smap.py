@@ -266,6 +266,7 @@ class smapData(Data):
             del img
 
             imgout[0].Write(imgdata)
+            imgout = None
             # add product to inventory
             archive_fp = self.archive_temp_path(fname)
             self.AddFile(sensor, key, archive_fp)
@@ -0,0 +1,222 @@
+#!/usr/bin/env python
+################################################################################
+#    GIPS: Geospatial Image Processing System
+#
+#    AUTHOR: Matthew Hanson
+#    EMAIL:  matt.a.hanson@gmail.com
+#
+#    Copyright (C) 2014-2018 Applied Geosolutions
+#
+#    This program is free software; you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation; either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program. If not, see <http://www.gnu.org/licenses/>
+################################################################################
+
+"""Time series of product values at points, read straight from the archive.
+
+Points are grouped by the driver's tiles, and each group is transformed
+once into the SRS of its tile's product files.  Each product file is then
+read only in the blocks that hold points, and files are read in parallel.
+"""
+
+import threading
+from multiprocessing.pool import ThreadPool
+
+import numpy
+from osgeo import gdal, ogr, osr
+from shapely import vectorized
+
+from gips import utils
+from gips import trace
+from gips.core import SpatialExtent, TemporalExtent
+from gips.inventory import DataInventory
+
+COLUMNS = ('id', 'date', 'product', 'band', 'value')
+
+
+def read_points(fname, key='', where=''):
+    """Read a point layer; return (ids, xs, ys, SRS as WKT).
+
+    ids are the values of the key attribute, or the feature IDs if key
+    is empty.  Multipoints contribute each of their points.
+    """
+    v = utils.open_vector(fname)
+    shp = ogr.Open(v.Filename())
+    layer = shp.GetLayer(v.LayerName()) if v.LayerName() else shp.GetLayer(0)
+    if where:
+        layer.SetAttributeFilter(where)
+    ids, xs, ys = [], [], []
+    layer.ResetReading()
+    feat = layer.GetNextFeature()
+    while feat is not None:
+        fid = feat.GetField(key) if key else feat.GetFID()
+        geom = feat.GetGeometryRef()
+        parts = ([geom.GetGeometryRef(i) for i in range(geom.GetGeometryCount())]
+                 or [geom])
+        for part in parts:
+            ids.append(fid)
+            xs.append(part.GetX())
+            ys.append(part.GetY())
+        feat = layer.GetNextFeature()
+    return (numpy.array(ids), numpy.array(xs, dtype='float64'),
+            numpy.array(ys, dtype='float64'), layer.GetSpatialRef().ExportToWkt())
+
+
+def transform_points(xs, ys, src_wkt, dst_wkt):
+    """Transform arrays of coordinates from one SRS to another, in one call."""
+    if len(xs) == 0 or osr.SpatialReference(src_wkt).IsSame(osr.SpatialReference(dst_wkt)):
+        return xs, ys
+    trans = osr.CoordinateTransformation(osr.SpatialReference(src_wkt),
+                                         osr.SpatialReference(dst_wkt))
+    out = numpy.array(trans.TransformPoints(numpy.column_stack((xs, ys)).tolist()))
+    return out[:, 0], out[:, 1]
+
+
+def points_by_tile(repository, xs, ys, srs):
+    """Return {tile: indices of the points within it} for the driver's tiles.
+
+    Points in more than one tile (where tiles overlap) are in each group.
+    """
+    tiles_srs, geometries = repository.tile_geometries()
+    txs, tys = transform_points(xs, ys, srs, tiles_srs)
+    groups = {}
+    for tile, geom in geometries.items():
+        xmin, ymin, xmax, ymax = geom.bounds
+        candidates = numpy.flatnonzero(
+            (txs >= xmin) & (txs <= xmax) & (tys >= ymin) & (tys <= ymax))
+        if len(candidates) == 0:
+            continue
+        inside = candidates[vectorized.contains(geom, txs[candidates], tys[candidates])]
+        if len(inside):
+            groups[tile] = inside
+    return groups
+
+
+def world_to_pixel(geotransform, xs, ys):
+    """Return (columns, rows) of the pixels holding the given coordinates."""
+    x0, dx, rx, y0, ry, dy = geotransform
+    det = dx * dy - rx * ry
+    u, v = xs - x0, ys - y0
+    cols = numpy.floor((dy * u - rx * v) / det).astype('int64')
+    rows = numpy.floor((dx * v - ry * u) / det).astype('int64')
+    return cols, rows
+
+
+def sample_dataset(ds, cols, rows):
+    """Read the values of the given pixels from every band of a GDAL dataset.
+
+    Only the blocks holding the pixels are read, one block at a time.
+    Returns (band names, values), with values a (bands, pixels) float64
+    array that's NaN for nodata.
+    """
+    names = []
+    values = numpy.empty((ds.RasterCount, len(cols)), dtype='float64')
+    for b in range(ds.RasterCount):
+        band = ds.GetRasterBand(b + 1)
+        names.append(band.GetDescription() or str(b + 1))
+        bx, by = band.GetBlockSize()
+        nbx = (ds.RasterXSize + bx - 1) // bx
+        block_ids = (rows // by) * nbx + cols // bx
+        order = numpy.argsort(block_ids, kind='mergesort')
+        blocks, starts = numpy.unique(block_ids[order], return_index=True)
+        for block, sel in zip(blocks, numpy.split(order, starts[1:])):
+            xoff, yoff = (block % nbx) * bx, (block // nbx) * by
+            arr = band.ReadAsArray(int(xoff), int(yoff),
+                                   int(min(bx, ds.RasterXSize - xoff)),
+                                   int(min(by, ds.RasterYSize - yoff)))
+            values[b, sel] = arr[rows[sel] - yoff, cols[sel] - xoff]
+        nodata = band.GetNoDataValue()
+        if nodata is not None:
+            values[b, values[b] == nodata] = numpy.nan
+    return names, values
+
+
+def sample_raster(ds, xs, ys):
+    """Sample a GDAL dataset at points given in its own SRS.
+
+    Returns (indices of the points within the raster, band names, values
+    as from sample_dataset).
+    """
+    cols, rows = world_to_pixel(ds.GetGeoTransform(), xs, ys)
+    inside = numpy.flatnonzero((cols >= 0) & (cols < ds.RasterXSize)
+                               & (rows >= 0) & (rows < ds.RasterYSize))
+    names, values = sample_dataset(ds, cols[inside], rows[inside])
+    return inside, names, values
+
+
+def extract(dataclass, points, products=None, dates=None, days=None,
+            key='', where='', tiles=None, numprocs=1):
+    """Extract product values at points over a date range.
+
+    points is a point layer (file or db, as for --site), with key naming
+    its ID attribute and where filtering its features; dates & days are
+    as for TemporalExtent; tiles optionally limits which tiles are read.
+    Products must already be processed.  Returns a list of (id, date,
+    product, band, value) tuples, the long format of COLUMNS, sorted and
+    without nodata values.  Points in overlapping tiles may have a value
+    from each tile.
+    """
+    ids, xs, ys, srs = read_points(points, key, where)
+    groups = points_by_tile(dataclass.Asset.Repository, xs, ys, srs)
+    if tiles is not None:
+        tiles = [dataclass.normalize_tile_string(t) for t in tiles]
+        groups = {t: g for t, g in groups.items() if t in tiles}
+    utils.verbose_out('{} of {} points are within {} tiles'.format(
+        len(set(i for g in groups.values() for i in g)), len(ids), len(groups)), 2)
+    if not groups:
+        return []
+    inv = DataInventory(dataclass, SpatialExtent(dataclass, tiles=groups.keys()),
+                        TemporalExtent(dates, days), products)
+    wanted = set(inv.products.products)
+
+    tasks = [(date, tile, product, fn)
+             for date in inv.dates
+             for tile, data in inv[date].tiles.items() if tile in groups
+             for (sensor, product), fn in data.filenames.items() if product in wanted]
+
+    # each tile's points are transformed once per SRS its files are in
+    projected = {}
+    lock = threading.Lock()
+    def project(tile, wkt):
+        with lock:
+            if (tile, wkt) not in projected:
+                idx = groups[tile]
+                projected[tile, wkt] = transform_points(xs[idx], ys[idx], srs, wkt)
+            return projected[tile, wkt]
+
+    def sample(task):
+        date, tile, product, fn = task
+        with utils.error_handler('Error extracting points from ' + fn, continuable=True), \
+                trace.span('extract', date=date, tile=tile, product=product):
+            ds = gdal.Open(fn)
+            if ds is None:
+                raise IOError('Could not open ' + fn)
+            return task, sample_raster(ds, *project(tile, ds.GetProjection()))
+        return task, None
+
+    rows = []
+    pool = ThreadPool(max(numprocs, 1))
+    try:
+        for (date, tile, product, _), result in pool.imap_unordered(sample, tasks):
+            if result is None:
+                continue
+            inside, names, values = result
+            point_ids = ids[groups[tile][inside]]
+            for name, band_values in zip(names, values):
+                valid = ~numpy.isnan(band_values)
+                rows.extend((pid, date, product, name, v) for pid, v in
+                            zip(point_ids[valid].tolist(), band_values[valid].tolist()))
+    finally:
+        pool.close()
+        pool.join()
+    rows.sort()
+    return rows
@@ -26,15 +26,19 @@ import os
 from datetime import datetime as dt
 import traceback
 import numpy
-from copy import deepcopy
-from collections import defaultdict
+import itertools
+from copy import copy, deepcopy
+from collections import OrderedDict
 
 import gippy
 from gips.tiles import Tiles
 from gips.utils import VerboseOut, Colors
 from gips import utils
+from gips import trace
 from gips.mapreduce import MapReduce
 from . import dbinv, orm
+from . import snapshot as inv_snapshot
+from .columnar import InventoryTable, InventoryData
 
 
 class Inventory(object):
@@ -146,6 +150,14 @@ class ProjectInventory(Inventory):
             self.requested_products = products
             self.sensors = sensor_set
 
+        self.datacube = None
+        self._datacube_checked = {}
+        cube_fp = os.path.join(self.projdir, 'datacube.nc')
+        if os.path.exists(cube_fp):
+            from gips.inventory import datacube # only import netCDF4 if needed
+            with utils.error_handler('Error opening datacube ' + cube_fp):
+                self.datacube = datacube.Datacube(cube_fp)
+
     def products(self, date=None):
         """ Intersection of available products and requested products for this date """
         if date is not None:
@@ -183,6 +195,9 @@ class ProjectInventory(Inventory):
         if products is None:
             products = self.requested_products
 
+        if self._datacube_current(products, dates):
+            return self.datacube.read(products, dates, chunk)
+
         for p in products:
             gimg = self.get_timeseries(p, dates=dates)
             # TODO - move numpy.squeeze into swig interface file?
@@ -196,6 +211,46 @@ class ProjectInventory(Inventory):
         data = numpy.vstack(tuple(imgarr))
         return data
 
+    def _product_filenames(self, product, dates):
+        """ The product's file for each date, or None where there isn't one """
+        return [self.data[d][product] if d in self.data and product in self.data[d].products
+                else None for d in dates]
+
+    def _datacube_current(self, products, dates):
+        """ Whether the datacube holds products for dates, made from the files as they are now """
+        cube = self.datacube
+        if (cube is None or not set(products).issubset(cube.products)
+                or not set(dates).issubset(cube.dates)):
+            return False
+        # files are checked once per product; get_data is called for each chunk
+        for p in products:
+            if p not in self._datacube_checked:
+                current = cube.is_current(p, self._product_filenames(p, cube.dates))
+                if not current:
+                    VerboseOut('%s has changed since %s was written; reading the files'
+                               ' instead (write_datacube to update it)' % (p, cube.path), 2)
+                self._datacube_checked[p] = current
+        return all(self._datacube_checked[p] for p in products)
+
+    def write_datacube(self, products=None, chunks=(128, 128)):
+        """Write products to a datacube in the project dir, for get_data to read.
+
+        See gips.inventory.datacube; chunks are (rows, columns) and span
+        all dates.  Replaces any existing datacube.
+        """
+        from gips.inventory import datacube
+        if products is None:
+            products = self.requested_products
+        filenames = OrderedDict((p, self._product_filenames(p, self.dates)) for p in products)
+        cube_fp = os.path.join(self.projdir, datacube.FILENAME)
+        with utils.make_temp_dir(dir=self.projdir, prefix='datacube') as tmp_dir:
+            tmp_fp = os.path.join(tmp_dir, datacube.FILENAME)
+            datacube.from_files(tmp_fp, self.dates, filenames, chunks).close()
+            os.rename(tmp_fp, cube_fp)
+        self.datacube = datacube.Datacube(cube_fp)
+        self._datacube_checked = {}
+        return self.datacube
+
     def get_location(self):
         # this is a terrible hack to get the name of the feature associated with the inventory
         data = self.data[self.dates[0]]
@@ -228,13 +283,15 @@ class DataInventory(Inventory):
     """ Manager class for data inventories (collection of Tiles class) """
 
     def __init__(self, dataclass, spatial, temporal, products=None,
-                 fetch=False, update=False, **kwargs):
+                 fetch=False, update=False, snapshot=False, **kwargs):
         """ Create a new inventory
         :dataclass: The Data class to use (e.g., LandsatData, ModisData)
         :spatial: The SpatialExtent requested
         :temporal: The temporal extent requested
         :products: List of requested products of interest
         :fetch: bool indicated if missing data should be downloaded
+        :snapshot: bool indicating if a snapshot of the search results may be
+            reused, and saved for reuse by later runs
         """
         VerboseOut('Retrieving inventory for site %s for date range %s' % (spatial.sitename, temporal) , 2)
 
@@ -245,90 +302,134 @@ class DataInventory(Inventory):
         self.products = dataclass.RequestedProducts(products)
 
         self.update = update
+        self._kwargs = kwargs
 
         if fetch:
-            # command-line arguments could have lists, which lru_cache chokes
-            # one due to being unhashable.  Also tiles is passed in, which
-            # conflicts with the explicit tiles argument.
-            fetch_kwargs = {k: v for (k, v) in
-                utils.prune_unhashable(kwargs).items() if k != 'tiles'}
-            archived_assets = dataclass.fetch(self.products.base,
-                self.spatial.tiles, self.temporal, self.update, **fetch_kwargs)
-
+            with trace.span('fetch', driver=dataclass.name.lower()):
+                # command-line arguments could have lists, which lru_cache chokes
+                # one due to being unhashable.  Also tiles is passed in, which
+                # conflicts with the explicit tiles argument.
+                fetch_kwargs = {k: v for (k, v) in
+                    utils.prune_unhashable(kwargs).items() if k != 'tiles'}
+                archived_assets = dataclass.fetch(self.products.base,
+                    self.spatial.tiles, self.temporal, self.update, **fetch_kwargs)
+
+                if orm.use_orm():
+                    # save metadata about the fetched assets in the database
+                    driver = dataclass.name.lower()
+                    for a in archived_assets:
+                        dbinv.update_or_add_asset(
+                                asset=a.asset, sensor=a.sensor, tile=a.tile, date=a.date,
+                                name=a.archived_filename, driver=driver, **a.db_metadata())
+                        # if the new asset comes with any "free" products, save that info:
+                        for (prod_type, fp) in a.products.items():
+                            dbinv.update_or_add_product(
+                                    product=prod_type, sensor=a.sensor, tile=a.tile, date=a.date,
+                                    name=fp, driver=driver)
+
+        with trace.span('inventory', driver=dataclass.name.lower(),
+                        site=spatial.sitename):
+            # Build up the inventory:  A flat table of files, from which one Tiles object per date is
+            # made when that date is first accessed.  Each contains one Data object per tile.  Each
+            # of those contain one or more Asset objects.
+            if snapshot:
+                snap_key = inv_snapshot.inventory_key(dataclass, spatial, temporal, kwargs)
+                table = inv_snapshot.load(dataclass, 'inventory', snap_key)
+                if table is not None:
+                    self.data = InventoryData(table, self._materialize)
+                    return
+            dates = self.temporal.prune_dates(spatial.available_dates)
+            if snapshot:
+                # gathered before searching so changes made meanwhile invalidate it
+                snap_stamps = inv_snapshot.inventory_stamps(dataclass, spatial.tiles, dates)
             if orm.use_orm():
-                # save metadata about the fetched assets in the database
-                driver = dataclass.name.lower()
-                for a in archived_assets:
-                    dbinv.update_or_add_asset(
-                            asset=a.asset, sensor=a.sensor, tile=a.tile, date=a.date,
-                            name=a.archived_filename, driver=driver)
-                    # if the new asset comes with any "free" products, save that info:
-                    for (prod_type, fp) in a.products.items():
-                        dbinv.update_or_add_product(
-                                product=prod_type, sensor=a.sensor, tile=a.tile, date=a.date,
-                                name=fp, driver=driver)
-
-        # Build up the inventory:  One Tiles object per date.  Each contains one Data object.  Each
-        # of those contain one or more Asset objects.
-        self.data = {}
-        dates = self.temporal.prune_dates(spatial.available_dates)
-        if orm.use_orm():
-            # populate the object tree under the DataInventory (Tiles, Data, Asset) by querying the
-            # DB quick-like then assigning things we iterate:  The DB is a flat table of data; we
-            # have to hierarchy-ize it.  Do this by setting up a temporary collection of objects
-            # for populating Data instances: the collection is basically a simple version of the
-            # complicated hierarchy that GIPS constructs on its own:
-            #   collection = {
-            #       (tile, date): {'a': [asset, asset, asset],
-            #                      'p': [product, product, product]},
-            #       (tile, date): {'a': [asset, asset, asset],
-            #                      'p': [product, product, product]},
-            #   }
-            collection = defaultdict(lambda: {'a': [], 'p': []})
-            def add_to_collection(date, tile, kind, item):
-                key = (date, str(tile)) # str() to avoid possible unicode trouble
-                collection[key][kind].append(item)
-
-            search_criteria = { # same for both Assets and Products
-                'driver': Repository.name.lower(),
-                'tile__in': spatial.tiles,
-                'date__in': dates,
-            }
-            for p in dbinv.product_search(**search_criteria).order_by('date', 'tile'):
-                add_to_collection(p.date, p.tile, 'p', str(p.name))
-            for a in dbinv.asset_search(**search_criteria).order_by('date', 'tile'):
-                add_to_collection(a.date, a.tile, 'a', str(a.name))
-
-            # the collection is now complete so use it to populate the GIPS object hierarchy
-            for k, v in collection.items():
-                (date, tile) = k
-                # find or else make a Tiles object
-                if date not in self.data:
-                    self.data[date] = Tiles(dataclass, spatial, date, self.products, **kwargs)
-                tiles_obj = self.data[date]
-                # add a Data object (should not be in tiles_obj.tiles already)
-                assert tile not in tiles_obj.tiles # sanity check
-                data_obj = dataclass(tile, date, search=False)
-                # add assets and products
-                [data_obj.add_asset(dataclass.Asset(a)) for a in v['a']]
-                data_obj.ParseAndAddFiles(v['p'])
-                # add the new Data object to the Tiles object if it checks out
-                if data_obj.valid and data_obj.filter(**kwargs):
-                    tiles_obj.tiles[tile] = data_obj
-            return
+                # The DB is a flat table of data already, so read it straight into the inventory's
+                # table without instantiating anything; Data & Asset objects are made on demand.
+                search_criteria = { # same for both Assets and Products
+                    'driver': Repository.name.lower(),
+                    'tile__in': spatial.tiles,
+                    'date__in': dates,
+                }
+                fields = ('date', 'tile', 'sensor', 'name')
+                rows = itertools.chain(
+                    ((d, t, InventoryTable.ASSET, s, a, n, cc) for (d, t, s, n, a, cc) in
+                     dbinv.asset_search(**search_criteria).values_list(
+                         *(fields + ('asset', 'cloud_cover')))),
+                    ((d, t, InventoryTable.PRODUCT, s, p, n) for (d, t, s, n, p) in
+                     dbinv.product_search(**search_criteria).values_list(*(fields + ('product',)))),
+                )
+                table = InventoryTable.from_rows(rows)
+                # let the DB do as much of the filtering as it can
+                rejects = dataclass.inventory_rejects(search_criteria, **kwargs)
+                if rejects:
+                    table = table.drop(rejects)
+                self.data = InventoryData(table, self._materialize)
+                if not dataclass.filter_is_trivial(**kwargs):
+                    # the rest of filtering needs Data objects; only keep the ones that pass
+                    rejects = [(date, tile) for (date, tiles_obj) in self.data.items()
+                               for (tile, data_obj) in tiles_obj.tiles.items()
+                               if not data_obj.filter(**kwargs)]
+                    # keeps the Tiles built for filtering, so they aren't built again
+                    self.data.drop(rejects)
+            else:
+                # Perform filesystem search since user wants that.  Data object instantiation results
+                # in filesystem search (thanks to search=True).  The Data objects are kept to seed
+                # the inventory rather than being made again from the table.
+                found = OrderedDict()
+                for date in dates:
+                    for t in spatial.tiles:
+                        data_obj = dataclass(t, date, search=True)
+                        if data_obj.valid and data_obj.filter(**kwargs):
+                            found.setdefault(date, []).append(data_obj)
+                table = InventoryTable.from_data(itertools.chain.from_iterable(found.values()))
+                self.data = InventoryData(table, self._materialize, {
+                    date: self._make_tiles(date, data_objs) for date, data_objs in found.items()})
+
+            if snapshot:
+                inv_snapshot.save(dataclass, 'inventory', snap_key,
+                                  self.data.table, snap_stamps)
+
+    def _make_tiles(self, date, data_objs):
+        """ Make the Tiles object for a date from its Data objects """
+        tiles_obj = Tiles(self.dataclass, self.spatial, date, self.products, **self._kwargs)
+        for data_obj in data_objs:
+            tiles_obj.tiles[data_obj.id] = data_obj
+        return tiles_obj
+
+    def _materialize(self, date, rows):
+        """ Make the Tiles object for a date from its rows in the inventory table """
+        dataclass = self.dataclass
+        data_objs = []
+        for tile, files in rows.items():
+            data_obj = dataclass(tile, date, search=False)
+            # add assets then products, since adding an asset adds its "free" products too
+            for (kind, sensor, type_, path, cloud_cover) in files:
+                if kind == InventoryTable.ASSET:
+                    asset_obj = dataclass.Asset(path)
+                    if cloud_cover is not None:
+                        asset_obj.db_cloud_cover = cloud_cover
+                    data_obj.add_asset(asset_obj)
+            for (kind, sensor, type_, path, cloud_cover) in files:
+                if kind == InventoryTable.PRODUCT:
+                    data_obj.AddFile(sensor, type_, path, add_to_db=False)
+            data_objs.append(data_obj)
+        return self._make_tiles(date, data_objs)
 
-        # Perform filesystem search since user wants that.  Data object instantiation results
-        # in filesystem search (thanks to search=True).
-        self.data = {} # clear out data dict in case it has partial results
-        for date in dates:
-            tiles_obj = Tiles(dataclass, spatial, date, self.products, **kwargs)
-            for t in spatial.tiles:
-                data_obj = dataclass(t, date, search=True)
-                if data_obj.valid and data_obj.filter(**kwargs):
-                    tiles_obj.tiles[t] = data_obj
-            if len(tiles_obj) > 0:
-                self.data[date] = tiles_obj
+    def get_subset(self, dates):
+        """ Return subset of inventory, sharing its table & any Tiles already made """
+        inv = copy(self)
+        inv.data = self.data.subset(dates)
+        return inv
+
+    @property
+    def dates(self):
+        """ Get sorted list of dates """
+        return self.data.keys()
 
+    @property
+    def numfiles(self):
+        """ Total number of files in inventory """
+        return self.data.table.numfiles
 
     @property
     def sensor_set(self):
@@ -345,7 +446,8 @@ class DataInventory(Inventory):
                 with utils.error_handler(continuable=True):
                     self.data[date].process(*args, **kwargs)
         if len(self.products.composite) > 0:
-            self.dataclass.process_composites(self, self.products.composite, **kwargs)
+            with trace.span('composites', products=' '.join(self.products.composite)):
+                self.dataclass.process_composites(self, self.products.composite, **kwargs)
         VerboseOut('Processing completed in %s' % (dt.now() - start), 2)
 
     def mosaic(self, datadir='./', tree=False, **kwargs):
@@ -0,0 +1,249 @@
+#!/usr/bin/env python
+################################################################################
+#    GIPS: Geospatial Image Processing System
+#
+#    AUTHOR: Matthew Hanson
+#    EMAIL:  matt.a.hanson@gmail.com
+#
+#    Copyright (C) 2014-2018 Applied Geosolutions
+#
+#    This program is free software; you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation; either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program. If not, see <http://www.gnu.org/licenses/>
+################################################################################
+
+"""Array-backed storage for large inventories."""
+
+from datetime import date as Date
+
+import numpy
+
+
+class InventoryTable(object):
+    """Flat table of the files in an inventory, one row per file.
+
+    Tiles, sensors, and asset & product types repeat heavily, so they are
+    stored as integer codes into short lists of their distinct values
+    (`levels`), and dates are stored as ordinals.  Cloud cover is stored
+    for assets when the inventory DB knows it, and is NaN otherwise.
+    Selecting rows produces a new table sharing the lists of levels, without
+    constructing any Data or Asset objects.
+    """
+    ASSET = 0
+    PRODUCT = 1
+    _coded = ('tile', 'sensor', 'type')
+
+    def __init__(self, dates, kinds, paths, clouds, codes, levels):
+        self.date = dates    # int32 ordinals
+        self.kind = kinds    # int8, ASSET or PRODUCT
+        self.path = paths    # object array of filenames
+        self.cloud = clouds  # float32 cloud cover percentage, or NaN
+        self.codes = codes   # column name: int32 codes
+        self.levels = levels # column name: list of distinct values
+        self._index = None
+
+    @classmethod
+    def from_rows(cls, rows):
+        """Build a table from (date, tile, kind, sensor, type, path) tuples.
+
+        For assets, type is the asset type; for products it's the product.
+        Tuples may have cloud cover appended; None means unknown.
+        """
+        levels = {c: [] for c in cls._coded}
+        lookup = {c: {} for c in cls._coded}
+        codes = {c: [] for c in cls._coded}
+        dates, kinds, paths, clouds = [], [], [], []
+        for row in rows:
+            (date, tile, kind, sensor, type_, path) = row[:6]
+            dates.append(date.toordinal())
+            kinds.append(kind)
+            paths.append(str(path)) # str() to avoid possible unicode trouble
+            clouds.append(row[6] if len(row) > 6 and row[6] is not None else numpy.nan)
+            for c, value in zip(cls._coded, (tile, sensor, type_)):
+                value = str(value)
+                code = lookup[c].get(value)
+                if code is None:
+                    code = lookup[c][value] = len(levels[c])
+                    levels[c].append(value)
+                codes[c].append(code)
+        return cls(numpy.array(dates, dtype='int32'),
+                   numpy.array(kinds, dtype='int8'),
+                   numpy.array(paths, dtype=object),
+                   numpy.array(clouds, dtype='float32'),
+                   {c: numpy.array(codes[c], dtype='int32') for c in cls._coded},
+                   levels)
+
+    @classmethod
+    def from_data(cls, data_objs):
+        """Build a table from the assets & product files of Data objects.
+
+        Products that come along with an asset aren't stored as files of
+        their own, since adding the asset adds them back.
+        """
+        def rows():
+            for d in data_objs:
+                free = set()
+                for a in d.assets.values():
+                    free.update(a.products.values())
+                    yield (d.date, d.id, cls.ASSET, a.sensor, a.asset, a.filename)
+                for (sensor, product), fn in d.filenames.items():
+                    if fn not in free:
+                        yield (d.date, d.id, cls.PRODUCT, sensor, product, fn)
+        return cls.from_rows(rows())
+
+    def __len__(self):
+        return len(self.date)
+
+    def take(self, mask):
+        """Return a table of the rows selected by an index or boolean array."""
+        return self.__class__(self.date[mask], self.kind[mask], self.path[mask],
+                              self.cloud[mask], {c: v[mask] for c, v in self.codes.items()},
+                              self.levels)
+
+    def select(self, dates):
+        """Return a table of the rows for the given dates."""
+        ordinals = numpy.array([d.toordinal() for d in dates], dtype='int32')
+        return self.take(numpy.in1d(self.date, ordinals))
+
+    def _keys(self):
+        """One integer per row identifying its (date, tile)."""
+        return (self.date.astype('int64') * max(len(self.levels['tile']), 1)
+                + self.codes['tile'])
+
+    def drop(self, pairs):
+        """Return a table without the rows for the given (date, tile) pairs."""
+        ntiles = max(len(self.levels['tile']), 1)
+        tile_code = {t: i for i, t in enumerate(self.levels['tile'])}
+        dropped = numpy.array([d.toordinal() * ntiles + tile_code[t] for d, t in pairs
+                               if t in tile_code], dtype='int64')
+        return self.take(~numpy.in1d(self._keys(), dropped))
+
+    @property
+    def dates(self):
+        """Sorted list of distinct dates."""
+        return [Date.fromordinal(int(o)) for o in numpy.unique(self.date)]
+
+    @property
+    def numfiles(self):
+        """Number of distinct (date, tile) pairs, ie Data objects."""
+        return len(numpy.unique(self._keys()))
+
+    @property
+    def sensor_set(self):
+        """Sorted list of distinct sensors."""
+        return sorted(self.levels['sensor'][c] for c in numpy.unique(self.codes['sensor']))
+
+    def rows(self, date):
+        """Return the rows for the given date, grouped by tile:
+
+            {tile: [(kind, sensor, type, path, cloud cover or None), ...], ...}
+        """
+        if self._index is None:
+            order = numpy.argsort(self.date, kind='mergesort')
+            self._index = (order, self.date[order])
+        order, sorted_dates = self._index
+        o = date.toordinal()
+        idx = order[numpy.searchsorted(sorted_dates, o, 'left'):
+                    numpy.searchsorted(sorted_dates, o, 'right')]
+        tiles, sensors, types = [self.levels[c] for c in self._coded]
+        by_tile = {}
+        for i in idx:
+            by_tile.setdefault(tiles[self.codes['tile'][i]], []).append(
+                (self.kind[i], sensors[self.codes['sensor'][i]],
+                 types[self.codes['type'][i]], self.path[i],
+                 None if numpy.isnan(self.cloud[i]) else float(self.cloud[i])))
+        return by_tile
+
+    def __getstate__(self):
+        # the sort index is cheap to rebuild; no need to pickle it
+        state = self.__dict__.copy()
+        state['_index'] = None
+        return state
+
+
+class InventoryData(object):
+    """Mapping of date to Tiles, backed by an InventoryTable.
+
+    A date's Tiles (and its Data & Asset objects) are built by
+    materialize(date, rows) the first time that date is accessed, then kept,
+    so changes made to them (eg products added by processing) persist.
+    Tiles already built when the table was made may be passed in as a dict
+    of date: Tiles to save building them again.
+    """
+    def __init__(self, table, materialize, tiles=None):
+        self.table = table
+        self.materialize = materialize
+        self._tiles = dict(tiles or {})
+        self._dates = None
+
+    def keys(self):
+        if self._dates is None:
+            self._dates = self.table.dates
+            self._dateset = set(self._dates)
+        return list(self._dates)
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.keys())
+
+    def __contains__(self, date):
+        self.keys()
+        return date in self._dateset
+
+    def __getitem__(self, date):
+        if date not in self._tiles:
+            if date not in self:
+                raise KeyError(date)
+            self._tiles[date] = self.materialize(date, self.table.rows(date))
+        return self._tiles[date]
+
+    def __delitem__(self, date):
+        self.restrict([d for d in self.keys() if d != date])
+
+    def values(self):
+        return [self[d] for d in self.keys()]
+
+    def items(self):
+        return [(d, self[d]) for d in self.keys()]
+
+    def restrict(self, dates):
+        """Restrict the mapping to the given dates, in place."""
+        dates = set(dates)
+        self.table = self.table.select(dates)
+        self._tiles = {d: t for d, t in self._tiles.items() if d in dates}
+        self._dates = None
+
+    def drop(self, pairs):
+        """Drop the given (date, tile) pairs from the mapping, in place.
+
+        Tiles already built are kept, less the Data objects of dropped tiles.
+        """
+        pairs = list(pairs)
+        self.table = self.table.drop(pairs)
+        for date, tile in pairs:
+            if date in self._tiles:
+                self._tiles[date].tiles.pop(tile, None)
+        dates = set(self.table.dates)
+        self._tiles = {d: t for d, t in self._tiles.items() if d in dates}
+        self._dates = None
+
+    def subset(self, dates):
+        """Return a new mapping restricted to the given dates.
+
+        Tiles already built are shared with the new mapping.
+        """
+        sub = self.__class__(self.table, self.materialize)
+        sub._tiles = dict(self._tiles)
+        sub.restrict(dates)
+        return sub
@@ -0,0 +1,237 @@
+#!/usr/bin/env python
+################################################################################
+#    GIPS: Geospatial Image Processing System
+#
+#    AUTHOR: Matthew Hanson
+#    EMAIL:  matt.a.hanson@gmail.com
+#
+#    Copyright (C) 2014-2018 Applied Geosolutions
+#
+#    This program is free software; you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation; either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program. If not, see <http://www.gnu.org/licenses/>
+################################################################################
+
+"""Chunked (time, y, x) NetCDF4 storage for project directories.
+
+A project's product files hold one date each, so reading a pixel's time
+series means opening and seeking in every file.  A datacube holds each
+band of each product as a single (time, y, x) variable, chunked so that
+a chunk covers every date of a block of pixels; reading the full series
+of a block is then one contiguous, compressed read.  Alongside are `time`
+(days since 1970-01-01), `x` & `y` (pixel centers), and `crs` variables,
+the latter per the CF grid mapping conventions so GDAL can georeference
+the product variables too.  Each product's variables also record the
+name, size, & modification time of the file it came from for each date,
+so a datacube that's fallen out of date with its files can be detected.
+"""
+
+import os
+import datetime
+from collections import OrderedDict
+
+import numpy
+import netCDF4
+
+FILENAME = 'datacube.nc'
+EPOCH = datetime.date(1970, 1, 1)
+
+
+def file_stamp(filename):
+    """Return (name, size, mtime) identifying a version of a file, or None for no file."""
+    if filename is None:
+        return None
+    st = os.stat(filename)
+    return (os.path.basename(filename), st.st_size, st.st_mtime)
+
+
+class Datacube(object):
+    """A datacube file; read with read(), or write with create() & write().
+
+    Products are made of one variable per band, named for the product if
+    it has one band, or else <product>_<band name>; each variable has
+    `product` and `band_name` attributes.
+    """
+    def __init__(self, path, mode='r'):
+        self.path = path
+        self.mode = mode
+        self._pid = None
+        ds = self.dataset
+        self.dates = [EPOCH + datetime.timedelta(int(t)) for t in ds.variables['time'][:]]
+        self._date_index = {d: i for i, d in enumerate(self.dates)}
+        self.shape = (len(ds.dimensions['y']), len(ds.dimensions['x']))
+        self.bands = OrderedDict()
+        self.sources = {}
+        for name, var in ds.variables.items():
+            if 'product' in var.ncattrs():
+                self.bands.setdefault(var.product, []).append(name)
+                if 'source_files' in var.ncattrs():
+                    self.sources[var.product] = [
+                        None if size < 0 else (fn, int(size), float(mtime))
+                        for fn, size, mtime in zip(var.source_files.split('\n'),
+                                                   numpy.atleast_1d(var.source_sizes),
+                                                   numpy.atleast_1d(var.source_mtimes))]
+
+    @property
+    def dataset(self):
+        """The open netCDF4.Dataset; reopened in forked processes, eg map_reduce's."""
+        if self._pid != os.getpid():
+            self._dataset = netCDF4.Dataset(self.path, self.mode)
+            self._pid = os.getpid()
+        return self._dataset
+
+    @property
+    def products(self):
+        return self.bands.keys()
+
+    def is_current(self, product, filenames):
+        """Whether product was made from filenames, one per date (None if
+        missing), as they are now."""
+        recorded = self.sources.get(product)
+        return recorded is not None and recorded == [file_stamp(fn) for fn in filenames]
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state.pop('_dataset', None)
+        state['_pid'] = None
+        return state
+
+    @classmethod
+    def create(cls, path, dates, products, shape, geotransform=None,
+               projection=None, chunks=(128, 128), sources=None):
+        """Create a datacube and return it open for writing.
+
+        products is an ordered mapping of product name to a list of
+        (band name, numpy dtype, nodata value) for each band; shape is
+        (rows, columns), and chunks is the (rows, columns) of each chunk,
+        which spans all dates.  geotransform is as in GDAL.  sources maps
+        products to the file_stamp() of their file for each date.
+        """
+        ds = netCDF4.Dataset(path, 'w', format='NETCDF4')
+        ds.Conventions = 'CF-1.6'
+        ds.createDimension('time', len(dates))
+        ds.createDimension('y', shape[0])
+        ds.createDimension('x', shape[1])
+        time = ds.createVariable('time', 'i4', ('time',))
+        time.units = 'days since ' + EPOCH.isoformat()
+        time.calendar = 'standard'
+        time[:] = [(d - EPOCH).days for d in dates]
+        if geotransform is not None:
+            x0, dx, _, y0, _, dy = geotransform
+            ds.createVariable('x', 'f8', ('x',))[:] = x0 + dx * (numpy.arange(shape[1]) + 0.5)
+            ds.createVariable('y', 'f8', ('y',))[:] = y0 + dy * (numpy.arange(shape[0]) + 0.5)
+            crs = ds.createVariable('crs', 'i4')
+            crs.spatial_ref = projection or ''
+            crs.GeoTransform = ' '.join(repr(v) for v in geotransform)
+        chunksizes = (max(len(dates), 1), min(chunks[0], shape[0]), min(chunks[1], shape[1]))
+        for product, bands in products.items():
+            for band_name, dtype, nodata in bands:
+                name = product if len(bands) == 1 else '{}_{}'.format(product, band_name)
+                var = ds.createVariable(name, numpy.dtype(dtype), ('time', 'y', 'x'),
+                                        zlib=True, chunksizes=chunksizes,
+                                        fill_value=nodata)
+                var.product = product
+                var.band_name = band_name
+                if sources is not None and product in sources:
+                    stamps = [st or ('', -1, -1) for st in sources[product]]
+                    var.source_files = '\n'.join(st[0] for st in stamps)
+                    var.source_sizes = numpy.array([st[1] for st in stamps], dtype='int64')
+                    var.source_mtimes = numpy.array([st[2] for st in stamps], dtype='float64')
+                if geotransform is not None:
+                    var.grid_mapping = 'crs'
+        ds.close()
+        return cls(path, 'a')
+
+    def write(self, name, rows, array):
+        """Write (time, rows, x) array to variable name, starting at the given row."""
+        self.dataset.variables[name][:, rows:rows + array.shape[1], :] = array
+
+    def close(self):
+        if self._pid == os.getpid():
+            self._dataset.close()
+        self._pid = None
+
+    def read(self, products, dates=None, chunk=None):
+        """Read products' time series, stacked as ProjectInventory.get_data does.
+
+        chunk is (x, y, columns, rows) as for gippy.Recti; dates default
+        to all of them.  Returns a float32 array of (bands * dates, rows,
+        columns), with nodata replaced by NaN.
+        """
+        x, y, xsize, ysize = chunk or (0, 0, self.shape[1], self.shape[0])
+        index = None
+        if dates is not None:
+            index = [self._date_index[d] for d in dates]
+            if index == range(len(self.dates)):
+                index = None
+        arrays = []
+        for p in products:
+            for name in self.bands[p]:
+                var = self.dataset.variables[name]
+                var.set_auto_mask(False)
+                # all dates at once, so each chunk is read & inflated once
+                arr = var[:, y:y + ysize, x:x + xsize]
+                if index is not None:
+                    arr = arr[index]
+                arr = arr.astype('float32')
+                if '_FillValue' in var.ncattrs():
+                    arr[arr == var._FillValue] = numpy.nan
+                arrays.append(arr)
+        return numpy.vstack(arrays)
+
+
+def from_files(path, dates, filenames, chunks=(128, 128)):
+    """Write a datacube of the given product files and return it.
+
+    filenames is an ordered mapping of product name to a list of files,
+    one per date, with None for missing dates; each product's first file
+    gives its bands' names, types, & nodata values, and every file must be
+    on the same grid.
+    """
+    from osgeo import gdal # not needed for reading
+    gdal_dtypes = {gdal.GDT_Byte: 'uint8', gdal.GDT_UInt16: 'uint16',
+                   gdal.GDT_Int16: 'int16', gdal.GDT_UInt32: 'uint32',
+                   gdal.GDT_Int32: 'int32', gdal.GDT_Float32: 'float32',
+                   gdal.GDT_Float64: 'float64'}
+    datasets = OrderedDict()
+    products = OrderedDict()
+    # stamped before reading, so changes made meanwhile make the cube out of date
+    sources = {product: [file_stamp(fn) for fn in fns] for product, fns in filenames.items()}
+    for product, fns in filenames.items():
+        datasets[product] = [None if fn is None else gdal.Open(fn) for fn in fns]
+        first = next(ds for ds in datasets[product] if ds is not None)
+        products[product] = []
+        for b in range(1, first.RasterCount + 1):
+            band = first.GetRasterBand(b)
+            nodata = band.GetNoDataValue()
+            products[product].append((band.GetDescription() or 'b{}'.format(b),
+                                      gdal_dtypes[band.DataType],
+                                      nodata))
+    shape = (first.RasterYSize, first.RasterXSize)
+    cube = Datacube.create(path, dates, products, shape,
+                           first.GetGeoTransform(), first.GetProjection(), chunks,
+                           sources)
+    # a row of chunks at a time; each chunk is then written out just once
+    for y in range(0, shape[0], chunks[0]):
+        rows = min(chunks[0], shape[0] - y)
+        for product, bands in products.items():
+            for b, name in enumerate(cube.bands[product]):
+                dtype, nodata = bands[b][1:]
+                arr = numpy.empty((len(dates), rows, shape[1]), dtype=dtype)
+                for t, ds in enumerate(datasets[product]):
+                    if ds is None:
+                        arr[t] = nodata if nodata is not None else 0
+                    else:
+                        arr[t] = ds.GetRasterBand(b + 1).ReadAsArray(0, y, shape[1], rows)
+                cube.write(name, y, arr)
+    cube.close()
+    return Datacube(path)
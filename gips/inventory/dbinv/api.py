@@ -64,6 +64,10 @@ def rectify_assets(asset_class):
         (asset, created) = mao.update_or_create(
                 asset=a.asset, sensor=a.sensor, tile=a.tile, date=a.date,
                 name=f_name, driver=driver)
+        # fill in quality metadata for new records & ones that predate it
+        missing = [f for f in a.db_metadata_fields if getattr(asset, f) is None]
+        for (field, value) in a.db_metadata(missing).items():
+            setattr(asset, field, value)
         asset.save()
         touched_rows.add(asset.pk)
         if created:
@@ -217,11 +221,12 @@ def delete_product(**values):
     from .models import Product
     Product.objects.get(**values).delete()
 
-def update_or_add_asset(driver, asset, tile, date, sensor, name):
+def update_or_add_asset(driver, asset, tile, date, sensor, name, **fields):
     """Update an existing model or create it if it's not found.
 
     Convenience method that wraps update_or_create.  The first four
     arguments are used to make a unique key to search for a matching model.
+    Additional fields, such as cloud_cover, may be given as keywords.
     """
     from . import models
     query_vals = {
@@ -230,7 +235,7 @@ def update_or_add_asset(driver, asset, tile, date, sensor, name):
         'tile':   tile,
         'date':   date,
     }
-    update_vals = {'sensor': sensor, 'name': name}
+    update_vals = dict(fields, sensor=sensor, name=name)
     (asset, created) = models.Asset.objects.update_or_create(defaults=update_vals, **query_vals)
     return asset # in case the user needs it
 
@@ -272,3 +277,14 @@ def asset_search(**criteria):
     """
     from gips.inventory.dbinv import models
     return models.Asset.objects.filter(**criteria)
+
+
+def change_count(driver):
+    """Return the number of changes made to the driver's inventory.
+
+    Only useful for comparison with earlier values, eg to learn whether the
+    inventory has changed since a cached copy of it was made.
+    """
+    from .models import Status
+    counts = Status.objects.filter(driver=driver).values_list('changes', flat=True)
+    return counts[0] if len(counts) > 0 else 0
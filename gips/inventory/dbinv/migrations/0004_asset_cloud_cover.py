@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dbinv', '0003_status'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='asset',
+            name='cloud_cover',
+            field=models.FloatField(db_index=True, null=True),
+        ),
+    ]
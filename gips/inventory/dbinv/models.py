@@ -1,6 +1,9 @@
 from __future__ import unicode_literals
 
 from django.db import models
+from django.db.models import F
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
 
 
 class Asset(models.Model):
@@ -17,6 +20,8 @@ class Asset(models.Model):
     tile   = models.TextField(db_index=True)   # 'h12v04'
     date   = models.DateField(db_index=True)   # of observation, not production
     name   = models.TextField()                # file name including full path
+    # quality metadata, for filtering in queries; null if unknown or not applicable
+    cloud_cover = models.FloatField(null=True, db_index=True) # percent
 
     class Meta:
         # These four columns uniquely identify an asset file
@@ -41,3 +46,22 @@ class Product(models.Model):
     class Meta:
         # These four columns uniquely identify an asset file
         unique_together = ('driver', 'product', 'sensor', 'tile', 'date')
+
+
+class Status(models.Model):
+    """Per-driver inventory change counter.
+
+    Incremented whenever an Asset or Product for the driver is saved or
+    deleted, so callers can cheaply learn whether the inventory has changed
+    since they last looked, eg to validate cached inventories.
+    """
+    driver  = models.TextField(unique=True)     # eg 'modis' or 'landsat'
+    changes = models.BigIntegerField(default=0)
+
+
+@receiver([post_save, post_delete], sender=Asset)
+@receiver([post_save, post_delete], sender=Product)
+def _count_change(sender, instance, **kwargs):
+    """Bump the Status counter for the changed record's driver."""
+    status, _ = Status.objects.get_or_create(driver=instance.driver)
+    Status.objects.filter(pk=status.pk).update(changes=F('changes') + 1)
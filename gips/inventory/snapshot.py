@@ -0,0 +1,152 @@
+#!/usr/bin/env python
+################################################################################
+#    GIPS: Geospatial Image Processing System
+#
+#    AUTHOR: Matthew Hanson
+#    EMAIL:  matt.a.hanson@gmail.com
+#
+#    Copyright (C) 2014-2018 Applied Geosolutions
+#
+#    This program is free software; you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation; either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program. If not, see <http://www.gnu.org/licenses/>
+################################################################################
+
+"""On-disk snapshots of inventory search results.
+
+Snapshots let back-to-back runs over the same site & dates (eg gips_inventory,
+then gips_process, then gips_export) skip repeating tile intersection and
+inventory searches.  Each snapshot is stored with a set of stamps describing
+the state of the things it was derived from:  Modification times of files &
+directories, and the inventory DB's change counter.  A snapshot is only used if
+its stamps all still match.
+"""
+
+import os
+import hashlib
+import argparse
+import cPickle as pickle
+
+from gips import __version__
+from gips import utils
+from . import dbinv, orm
+
+# increment when the format of snapshots changes
+_snapshot_version = 3
+
+
+def _mtime(path):
+    try:
+        return os.stat(path).st_mtime
+    except OSError:
+        return None
+
+
+def stamps(paths=(), driver=None):
+    """Return stamps for the given paths and, if using the ORM, the driver."""
+    rv = {('mtime', p): _mtime(p) for p in paths}
+    if driver is not None and orm.use_orm():
+        rv[('orm', driver)] = dbinv.change_count(driver)
+    return rv
+
+
+def _current(stamp_key):
+    kind, value = stamp_key
+    if kind == 'mtime':
+        return _mtime(value)
+    return dbinv.change_count(value)
+
+
+def _filename(dataclass, kind, key):
+    digest = hashlib.sha1(repr((_snapshot_version, __version__, dataclass.version,
+                                kind, key))).hexdigest()
+    return os.path.join(utils.cache_path('snapshots', dataclass.name.lower()),
+                        '{}-{}.pickle'.format(kind, digest))
+
+
+def load(dataclass, kind, key):
+    """Return the snapshotted value for the key, or None if none is valid."""
+    fn = _filename(dataclass, kind, key)
+    if not os.path.exists(fn):
+        return None
+    try:
+        with open(fn, 'rb') as fo:
+            snap = pickle.load(fo)
+    except Exception as e:
+        utils.verbose_out('Ignoring unreadable snapshot {}: {}'.format(fn, e), 3)
+        return None
+    if snap['key'] != key:
+        return None
+    stale = [k for k, v in snap['stamps'].items() if _current(k) != v]
+    if stale:
+        utils.verbose_out('{} snapshot is stale ({} changes)'.format(kind, len(stale)), 4)
+        return None
+    utils.verbose_out('Using {} snapshot {}'.format(kind, fn), 4)
+    return snap['value']
+
+
+def save(dataclass, kind, key, value, snap_stamps):
+    """Save a value in a snapshot, atomically replacing any prior snapshot.
+
+    snap_stamps should be collected before deriving the value, so changes
+    that occur while the value is being derived invalidate the snapshot.
+    """
+    fn = _filename(dataclass, kind, key)
+    snap = {'key': key, 'stamps': snap_stamps, 'value': value}
+    with utils.error_handler('Error saving snapshot ' + fn, continuable=True):
+        tmp_fn = '{}.{}.tmp'.format(fn, os.getpid())
+        with open(tmp_fn, 'wb') as fo:
+            pickle.dump(snap, fo, pickle.HIGHEST_PROTOCOL)
+        os.rename(tmp_fn, fn)
+
+
+def _filter_args(dataclass, kwargs):
+    """Return the subset of kwargs that the driver's filter() depends on."""
+    parser = argparse.ArgumentParser(add_help=False)
+    dataclass.add_filter_args(parser)
+    names = sorted(a.dest for a in parser._actions)
+    return tuple((n, repr(kwargs.get(n))) for n in names)
+
+
+def inventory_key(dataclass, spatial, temporal, kwargs):
+    """Key for a DataInventory snapshot.
+
+    The site only matters through the tiles it selects; the requested
+    products don't matter, since the inventory holds all of them.
+    """
+    return (sorted(spatial.tiles), temporal.datebounds, temporal.daybounds,
+            _filter_args(dataclass, kwargs))
+
+
+def inventory_stamps(dataclass, tiles, dates):
+    """Stamps for the part of the repository covered by an inventory."""
+    repo = dataclass.Asset.Repository
+    paths = [repo.data_path(t) for t in tiles]
+    paths += [repo.data_path(t, d) for t in tiles for d in dates]
+    return stamps(paths, dataclass.name.lower())
+
+
+def spatial_key(dataclass, site, rastermask, key, where, tiles, pcov, ptile):
+    """Key for a SpatialExtent.factory snapshot."""
+    return (site, rastermask, key, where,
+            None if tiles is None else sorted(tiles), pcov, ptile)
+
+
+def spatial_stamps(dataclass, site, rastermask):
+    """Stamps for the vectors & rasters that tile intersection depends on."""
+    paths = [dataclass.Asset.Repository.get_setting('tiles')]
+    for fn in (site, rastermask):
+        if fn is not None and os.path.exists(fn):
+            stem = os.path.splitext(fn)[0]
+            paths += [fn] + [stem + ext for ext in ('.dbf', '.prj', '.shx')
+                             if os.path.exists(stem + ext)]
+    return stamps(paths)
@@ -26,6 +26,7 @@ import argparse
 
 from gips.utils import data_sources, verbose_out
 from gips import utils
+from gips import trace
 import gippy
 
 
@@ -42,9 +43,11 @@ class GIPSParser(argparse.ArgumentParser):
 
     def parse_args(self, **kwargs):
         if self.datasources:
-            self.add_data_sources()
+            self.add_data_sources(kwargs.get('args'))
         args = super(GIPSParser, self).parse_args(**kwargs)
         set_gippy_options(args)
+        if getattr(args, 'profile', None):
+            trace.enable(args.profile)
         return args
 
     def error(self, message):
@@ -65,6 +68,9 @@ class GIPSParser(argparse.ArgumentParser):
                             default=1, type=int)
         parser.add_argument('--stop-on-error', default=False, action='store_true',
                             help='Do not attempt to continue execution after errors')
+        h = ('Record where time is spent to this file, in Chrome trace format'
+             ' (or JSON lines if its name ends in .jsonl)')
+        parser.add_argument('--profile', metavar='FILE', default=None, help=h)
         self.parent_parsers.append(parser)
         return parser
 
@@ -98,6 +104,8 @@ class GIPSParser(argparse.ArgumentParser):
         group.add_argument('--size', help='Compute size of data specified (MiB)',
                            default=False, action='store_true')
         group.add_argument('--update', help='Force fetch and/ or update data (if supported)', default=False, action='store_true')
+        h = 'Reuse search results saved by an earlier run with the same options, if still valid'
+        group.add_argument('--snapshot', help=h, default=False, action='store_true')
         parser.add_argument(
             '--chunksize', help='Chunk size in MB', default=128.0, type=float
         )
@@ -124,6 +132,10 @@ class GIPSParser(argparse.ArgumentParser):
              '\'chunksize\', and `\format\' are passed through.  '
              '\'numprocs\' is set to 1.')
         group.add_argument('--batchout', help=h, default=None)
+        h = ('Don\'t process.  Instead, add a unit of work per tile & date to '
+             'the given queue file (created if need be) for gips_worker.  '
+             '\'overwrite\' and products are passed through.')
+        group.add_argument('--enqueue', help=h, default=None, metavar='QUEUE')
         self.parent_parsers.append(parser)
         return parser
 
@@ -175,8 +187,14 @@ class GIPSParser(argparse.ArgumentParser):
         self.parent_parsers.append(parser)
         return parser
 
-    def add_data_sources(self):
-        """ Adds data sources to parser """
+    def add_data_sources(self, args=None):
+        """Adds data sources to parser.
+
+        Only the driver named in args (default: sys.argv) is imported, to add
+        its filtering options; the others are listed by description only.
+        """
+        args = sys.argv[1:] if args is None else args
+        command = next((a for a in args if not a.startswith('-')), None)
         subparser = self.add_subparsers(dest='command')
         sources = data_sources()
         if len(sources) == 0:
@@ -184,7 +202,9 @@ class GIPSParser(argparse.ArgumentParser):
         for src, desc in sources.items():
             p = subparser.add_parser(src, help=desc,
                                      parents=self.parent_parsers)
-            utils.import_data_class(src).add_filter_args(p)
+            if src == command:
+                utils.check_repository(src)
+                utils.import_data_class(src).add_filter_args(p)
 
 
 def set_gippy_options(args):
@@ -59,7 +59,8 @@ def main():
         if orm.use_orm():
             for a in archived_assets:
                 dbinv.update_or_add_asset(asset=a.asset, sensor=a.sensor, tile=a.tile, date=a.date,
-                                          name=a.archived_filename, driver=cls.name.lower())
+                                          name=a.archived_filename, driver=cls.name.lower(),
+                                          **a.db_metadata())
 
     utils.gips_exit()
 
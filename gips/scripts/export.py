@@ -38,8 +38,12 @@ def main():
     parser0 = GIPSParser(description=title)
     parser0.add_inventory_parser(site_required=True)
     parser0.add_process_parser()
-    parser0.add_project_parser()
+    parser = parser0.add_project_parser()
     parser0.add_warp_parser()
+    group = parser.add_argument_group('datacube options')
+    group.add_argument('--datacube', default=False, action='store_true',
+                       help='Also write each project directory as a chunked'
+                            ' (time, y, x) NetCDF4 datacube, datacube.nc')
     args = parser0.parse_args()
 
     cls = utils.gips_script_setup(args.command, args.stop_on_error)
@@ -49,7 +53,7 @@ def main():
         extents = SpatialExtent.factory(
             cls, site=args.site, rastermask=args.rastermask,
             key=args.key, where=args.where, tiles=args.tiles,
-            pcov=args.pcov, ptile=args.ptile
+            pcov=args.pcov, ptile=args.ptile, snapshot=args.snapshot
         )
 
         # create tld: SITENAME--KEY_DATATYPE_SUFFIX
@@ -76,6 +80,9 @@ def main():
                     crop=args.crop, alltouch=args.alltouch,
                 )
                 inv = ProjectInventory(datadir)
+                if args.datacube:
+                    with utils.error_handler('Error writing datacube', continuable=True):
+                        inv.write_datacube()
                 inv.pprint()
             else:
                 VerboseOut(
@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+################################################################################
+#    GIPS: Geospatial Image Processing System
+#
+#    AUTHOR: Matthew Hanson
+#    EMAIL:  matt.a.hanson@gmail.com
+#
+#    Copyright (C) 2014-2018 Applied Geosolutions
+#
+#    This program is free software; you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation; either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program. If not, see <http://www.gnu.org/licenses/>
+################################################################################
+
+import os
+import csv
+
+from gips import __version__
+from gips.parsers import GIPSParser
+from gips.utils import Colors, VerboseOut
+from gips import utils
+from gips import extract
+
+
+def main():
+    title = Colors.BOLD + 'GIPS Point Extraction (v%s)' % __version__ + Colors.OFF
+
+    # argument parsing
+    parser0 = GIPSParser(description=title)
+    parser = parser0.add_inventory_parser(site_required=True)
+    group = parser.add_argument_group('extraction options')
+    group.add_argument('-o', '--output', default=None,
+                       help='CSV file for the extracted values (default:'
+                            ' <site>_<driver>_extract.csv)')
+    args = parser0.parse_args()
+
+    cls = utils.gips_script_setup(args.command, args.stop_on_error)
+    print title
+
+    with utils.error_handler():
+        rows = extract.extract(
+            cls, args.site, products=args.products, dates=args.dates,
+            days=args.days, key=args.key, where=args.where, tiles=args.tiles,
+            numprocs=args.numprocs)
+        output = args.output or '{}_{}_extract.csv'.format(
+            os.path.splitext(os.path.basename(args.site))[0], args.command)
+        with open(output, 'w') as f:
+            writer = csv.writer(f, **getattr(utils.settings(), 'STATS_FORMAT', {}))
+            writer.writerow(extract.COLUMNS)
+            writer.writerows((pid, date.strftime('%Y-%m-%d'), product, band, value)
+                             for pid, date, product, band, value in rows)
+        VerboseOut('Wrote {} values to {}'.format(len(rows), output), 1)
+
+    utils.gips_exit() # produce a summary error report then quit with a proper exit status
+
+
+if __name__ == "__main__":
+    main()
@@ -87,7 +87,7 @@ def main():
         extents = SpatialExtent.factory(
             cls, site=args.site, rastermask=args.rastermask,
             key=args.key, where=args.where, tiles=args.tiles,
-            pcov=args.pcov, ptile=args.ptile
+            pcov=args.pcov, ptile=args.ptile, snapshot=args.snapshot
         )
         for extent in extents:
             inv = DataInventory(cls, extent, TemporalExtent(args.dates, args.days), **vars(args))
@@ -22,14 +22,120 @@
 ################################################################################
 
 import os
+import multiprocessing
+import traceback
 
+import numpy
 import gippy
 from gips.parsers import GIPSParser
 from gips.inventory import ProjectInventory
 from gips.utils import Colors, VerboseOut, basename
 from gips import utils
 
-__version__ = '0.1.0'
+__version__ = '0.2.0'
+
+
+class PackedMask(object):
+    """A boolean keep-mask for an image, stored bit-packed by row.
+
+    Masks are read once, chunk by chunk, and combined; pixels are kept
+    only where every mask keeps them.  A mask keeps pixels that are
+    nonzero and not nodata, or, if inverted, pixels that are not 1 (this
+    matches the BXOR(1) inversion gips_mask has always used).
+    """
+    def __init__(self, xsize, ysize):
+        self.xsize = xsize
+        self.ysize = ysize
+        # all kept; bits past xsize are padding, dropped by read()
+        self.bits = numpy.full((ysize, (xsize + 7) // 8), 0xFF, 'uint8')
+
+    @staticmethod
+    def keep(arr, inverted=False, nodata=None):
+        """Return the boolean keep-mask for an array of mask values."""
+        if inverted:
+            return arr != 1
+        keep = arr != 0
+        if nodata is not None:
+            keep &= arr != nodata
+        return keep
+
+    def add(self, band, inverted=False, chunks=None):
+        """AND the given gippy band into this mask; chunks are gippy Rectis."""
+        nodata = None if inverted else band.NoDataValue()
+        for ch in chunks:
+            rows = slice(ch.y0(), ch.y0() + ch.height())
+            cols = slice(ch.x0(), ch.x0() + ch.width())
+            block = self.read(rows)
+            block[:, cols] &= self.keep(band.Read(ch), inverted, nodata)
+            self.bits[rows] = numpy.packbits(block, axis=1)
+
+    def read(self, rows, cols=slice(None)):
+        """Unpack and return the boolean mask for the given slices."""
+        block = numpy.unpackbits(self.bits[rows], axis=1)[:, :self.xsize]
+        return block[:, cols].astype('bool')
+
+
+def mask_date(job):
+    """Mask all of one date's products; returns a list of error reports.
+
+    job is a dict (so it can be sent to worker processes) describing the
+    masks and products for the date, and the user's options.
+    """
+    errors = []
+    VerboseOut('Masking files from %s' % job['date'])
+    mask = None
+    meta = ''
+    try:
+        mask_sources = []
+        if job['filemask'] is not None:
+            mask_sources.append((job['filemask'], False))
+            meta = basename(job['filemask']) + ' '
+        for fname, inverted in job['masks']:
+            mask_sources.append((fname, inverted))
+            meta += ('inverted-' if inverted else '') + basename(fname) + ' '
+        for fname, inverted in mask_sources:
+            img = gippy.GeoImage(fname)
+            if mask is None:
+                mask = PackedMask(img.XSize(), img.YSize())
+            mask.add(img[0], inverted, img.Chunks())
+            img = None
+    except Exception:
+        errors.append(('Error reading masks for %s' % job['date'], traceback.format_exc()))
+        return errors
+    if mask is None:
+        return errors
+
+    for p, fname in sorted(job['products'].items()):
+        try:
+            img = gippy.GeoImage(fname, job['original'])
+            if job['original']:
+                VerboseOut('  %s' % (img.Basename()), 2)
+                imgout = img
+            else:
+                fout = os.path.splitext(fname)[0] + job['suffix'] + '.tif'
+                if os.path.exists(fout) and not job['overwrite']:
+                    continue
+                VerboseOut('  %s -> %s' % (img.Basename(), basename(fout)), 2)
+                imgout = gippy.GeoImage(fout, img)
+                for b in range(img.NumBands()):
+                    imgout[b].CopyMeta(img[b])
+                    imgout[b].SetNoData(img[b].NoDataValue())
+                imgout.CopyColorTable(img)
+            for ch in img.Chunks():
+                rows = slice(ch.y0(), ch.y0() + ch.height())
+                cols = slice(ch.x0(), ch.x0() + ch.width())
+                masked = ~mask.read(rows, cols)
+                for b in range(img.NumBands()):
+                    arr = img[b].Read(ch)
+                    arr[masked] = img[b].NoDataValue()
+                    imgout[b].Write(arr, ch)
+            imgout.SetMeta('MASKS', meta)
+            imgout = None
+            img = None
+        except Exception:
+            errors.append(('Error masking %s' % fname, traceback.format_exc()))
+    return errors
+
 
 def main():
     title = Colors.BOLD + 'GIPS Project Masking (v%s)' % __version__ + Colors.OFF
@@ -46,6 +152,8 @@ def main():
     group.add_argument('--overwrite', help=h, default=False, action='store_true')
     h = 'Suffix to apply to masked file (not compatible with --original)'
     group.add_argument('--suffix', help=h, default='-masked')
+    h = 'Number of processes used to mask dates in parallel'
+    group.add_argument('--numprocs', help=h, default=1, type=int)
     args = parser.parse_args()
 
     # TODO - check that at least 1 of filemask or pmask is supplied
@@ -55,49 +163,35 @@ def main():
     with utils.error_handler('Masking error'):
         VerboseOut(title)
         for projdir in args.projdir:
-
-            if args.filemask is not None:
-                mask_file = gippy.GeoImage(args.filemask)
-
             inv = ProjectInventory(projdir, args.products)
+            jobs = []
             for date in inv.dates:
-                VerboseOut('Masking files from %s' % date)
                 if args.filemask is None and args.pmask == []:
                     available_masks = inv[date].masks()
                 else:
                     available_masks = inv[date].masks(args.pmask)
-                for p in inv.products(date):
+                jobs.append({
+                    'date': date,
+                    'filemask': args.filemask,
+                    'masks': [(inv[date][m], m in args.invert)
+                              for m in available_masks],
                     # don't mask any masks
-                    if p in available_masks:
-                        continue
-                    meta = ''
-                    update = True if args.original else False
-                    img = inv[date].open(p, update=update)
-                    if args.filemask is not None:
-                        img.AddMask(mask_file[0])
-                        meta = basename(args.filemask) + ' '
-                    for mask in available_masks:
-                        mask_img = inv[date].open(mask)[0]
-                        if mask in args.invert:
-                            mask_img.SetNoData(utils.np.nan)
-                            mask_img = mask_img.BXOR(1)
-                            meta += 'inverted-'
-                        img.AddMask(mask_img)
-                        meta = meta + basename(inv[date][mask]) + ' '
-                    if meta != '':
-                        if args.original:
-                            VerboseOut('  %s' % (img.Basename()), 2)
-                            img.Process()
-                            img.SetMeta('MASKS', meta)
-                        else:
-                            fout = os.path.splitext(img.Filename())[0] + args.suffix + '.tif'
-                            if not os.path.exists(fout) or args.overwrite:
-                                VerboseOut('  %s -> %s' % (img.Basename(), basename(fout)), 2)
-                                imgout = img.Process(fout)
-                                imgout.SetMeta('MASKS', meta)
-                                imgout = None
-                    img = None
-            mask_file = None
+                    'products': {p: inv[date][p] for p in inv.products(date)
+                                 if p not in available_masks},
+                    'original': args.original,
+                    'suffix': args.suffix,
+                    'overwrite': args.overwrite,
+                })
+            if args.numprocs > 1:
+                pool = multiprocessing.Pool(args.numprocs)
+                results = pool.map(mask_date, jobs)
+                pool.close()
+                pool.join()
+            else:
+                results = [mask_date(j) for j in jobs]
+            for msg, tb_text in [e for errors in results for e in errors]:
+                with utils.error_handler(msg, continuable=True):
+                    raise RuntimeError(tb_text)
 
     utils.gips_exit()
 
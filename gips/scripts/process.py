@@ -28,6 +28,7 @@ from gips.utils import Colors, VerboseOut, open_vector, import_data_class
 from gips import utils
 from gips.inventory import DataInventory
 from gips.inventory import orm
+from gips.workqueue import WorkQueue
 
 
 def main():
@@ -46,7 +47,7 @@ def main():
         extents = SpatialExtent.factory(
             cls, site=args.site, rastermask=args.rastermask,
             key=args.key, where=args.where, tiles=args.tiles,
-            pcov=args.pcov, ptile=args.ptile
+            pcov=args.pcov, ptile=args.ptile, snapshot=args.snapshot
         )
         batchargs = None
         if args.batchout:
@@ -79,7 +80,13 @@ def main():
                     ),
                     tdl
                 )
-
+            elif args.enqueue:
+                units = [(tile, tiles.date) for tiles in inv.data.values()
+                         for tile in tiles.tiles.keys()]
+                added = WorkQueue(args.enqueue).enqueue(
+                    args.command, units, inv.products.products, args.overwrite)
+                VerboseOut('Added {} of {} units of work to {}'.format(
+                    added, len(units), args.enqueue), 1)
             else:
                 inv.process(overwrite=args.overwrite)
         if args.batchout:
@@ -29,6 +29,7 @@ from gips.parsers import GIPSParser
 from gips.inventory import ProjectInventory
 from gips.utils import Colors, VerboseOut, basename
 from gips import utils
+from gips import trace
 
 __version__ = '0.1.0'
 
@@ -66,15 +67,16 @@ def main():
 
                     # print date, band description, and stats
                     for date in valid_dates:
-                        img = inv[date].open(p_type)
-                        date_str = date.strftime('%Y-%j')
-                        utils.verbose_out('Computing stats for {} {}'.format(
-                                p_type, date_str), 2)
-                        for b in img:
-                            stats = [str(s) for s in b.Stats()]
-                            writer.writerow(
-                                    [date_str, b.Description()] + stats)
-                        img = None
+                        with trace.span('stats', date=date, product=p_type):
+                            img = inv[date].open(p_type)
+                            date_str = date.strftime('%Y-%j')
+                            utils.verbose_out('Computing stats for {} {}'.format(
+                                    p_type, date_str), 2)
+                            for b in img:
+                                stats = [str(s) for s in b.Stats()]
+                                writer.writerow(
+                                        [date_str, b.Description()] + stats)
+                            img = None
 
     utils.gips_exit() # produce a summary error report then quit with a proper exit status
 
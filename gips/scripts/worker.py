@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+################################################################################
+#    GIPS: Geospatial Image Processing System
+#
+#    AUTHOR: Matthew Hanson
+#    EMAIL:  matt.a.hanson@gmail.com
+#
+#    Copyright (C) 2014-2018 Applied Geosolutions
+#
+#    This program is free software; you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation; either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program. If not, see <http://www.gnu.org/licenses/>
+################################################################################
+
+import datetime
+
+from gips import __version__
+from gips.parsers import GIPSParser
+from gips.utils import Colors, VerboseOut
+from gips import utils
+from gips import workqueue
+
+
+def print_status(queue):
+    status = queue.status()
+    counts = status['counts']
+    total = sum(counts.values())
+    VerboseOut('{}: {} units'.format(queue.path, total), 1)
+    for state in (workqueue.PENDING, workqueue.RUNNING, workqueue.DONE, workqueue.FAILED):
+        VerboseOut('  {:8} {:6}'.format(state, counts[state]), 1)
+    if status['rate'] is None:
+        VerboseOut('No units finished in the last hour', 1)
+    else:
+        VerboseOut('{:.1f} units/hour over the last hour, by {} active worker(s)'.format(
+            status['rate'], len(status['workers'])), 1)
+        if status['eta']:
+            VerboseOut('Estimated time remaining: {}'.format(
+                datetime.timedelta(seconds=int(status['eta']))), 1)
+    for f in status['failures']:
+        VerboseOut('Failed after {attempts} attempt(s): {driver} {tile} {date}: {error}'
+                   .format(**f), 2)
+
+
+def main():
+    title = Colors.BOLD + 'GIPS Worker (v%s)' % __version__ + Colors.OFF
+
+    parser0 = GIPSParser(datasources=False, description=title)
+    parser0.add_argument('queue', help='Queue file, as made by gips_process --enqueue')
+    parser0.add_argument('--status', default=False, action='store_true',
+                         help='Report progress & throughput of the queue, then exit')
+    group = parser0.add_argument_group('worker options')
+    group.add_argument('--max-units', default=None, type=int,
+                       help='Exit after processing this many units (default: no limit)')
+    group.add_argument('--lease', default=300.0, type=float,
+                       help='Seconds without a heartbeat after which a unit is'
+                            ' given to another worker')
+    group.add_argument('--max-attempts', default=3, type=int,
+                       help='Times to try a unit before giving up on it')
+    group.add_argument('--retry-delay', default=60.0, type=float,
+                       help='Seconds to wait before the first retry; doubles for each retry')
+    group.add_argument('--poll', default=10.0, type=float,
+                       help='Seconds between checks of the queue while waiting for'
+                            ' other workers\' units')
+    group.add_argument('--chunksize', help='Chunk size in MB', default=128.0, type=float)
+    group.add_argument('--numprocs', help='Desired number of processors (if allowed)',
+                       default=1, type=int)
+    group.add_argument('--format', help='Format for output file', default="GTiff")
+    args = parser0.parse_args()
+
+    utils.gips_script_setup(stop_on_error=args.stop_on_error)
+    print title
+
+    with utils.error_handler():
+        queue = workqueue.WorkQueue(args.queue, args.max_attempts, args.retry_delay)
+        if args.status:
+            print_status(queue)
+        else:
+            count = workqueue.work(queue, max_units=args.max_units, lease=args.lease,
+                                   poll=args.poll)
+            VerboseOut('Processed {} unit(s) of work'.format(count), 1)
+
+    utils.gips_exit() # produce a summary error report then quit with a proper exit status
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+################################################################################
+#    GIPS: Geospatial Image Processing System
+#
+#    AUTHOR: Matthew Hanson
+#    EMAIL:  matt.a.hanson@gmail.com
+#
+#    Copyright (C) 2014-2018 Applied Geosolutions
+#
+#    This program is free software; you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation; either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program. If not, see <http://www.gnu.org/licenses/>
+################################################################################
+
+import os
+import csv
+
+from gips import __version__
+from gips.parsers import GIPSParser
+from gips.utils import Colors, VerboseOut
+from gips import utils
+from gips import zonal
+
+
+def main():
+    title = Colors.BOLD + 'GIPS Zonal Statistics (v%s)' % __version__ + Colors.OFF
+
+    # argument parsing
+    parser0 = GIPSParser(description=title)
+    parser = parser0.add_inventory_parser(site_required=True)
+    group = parser.add_argument_group('zonal statistics options')
+    group.add_argument('--percentiles', nargs='*', type=float, default=[],
+                       help='Percentiles to compute too, eg 10 50 90')
+    group.add_argument('--alltouch', default=False, action='store_true',
+                       help='Count every pixel touching a feature, rather than'
+                            ' only those whose centers are within it')
+    group.add_argument('-o', '--output', default=None,
+                       help='CSV file for the statistics (default:'
+                            ' <site>_<driver>_zonal.csv)')
+    args = parser0.parse_args()
+
+    cls = utils.gips_script_setup(args.command, args.stop_on_error)
+    print title
+
+    with utils.error_handler():
+        rows = zonal.zonal_stats(
+            cls, args.site, products=args.products, dates=args.dates,
+            days=args.days, key=args.key, where=args.where, tiles=args.tiles,
+            percentiles=args.percentiles, all_touched=args.alltouch)
+        output = args.output or '{}_{}_zonal.csv'.format(
+            os.path.splitext(os.path.basename(args.site))[0], args.command)
+        with open(output, 'w') as f:
+            writer = csv.writer(f, **getattr(utils.settings(), 'STATS_FORMAT', {}))
+            writer.writerow(zonal.COLUMNS + tuple('p{:g}'.format(p) for p in args.percentiles))
+            writer.writerows((row[0], row[1].strftime('%Y-%m-%d')) + row[2:] for row in rows)
+        VerboseOut('Wrote {} rows of statistics to {}'.format(len(rows), output), 1)
+
+    utils.gips_exit() # produce a summary error report then quit with a proper exit status
+
+
+if __name__ == "__main__":
+    main()
@@ -44,6 +44,47 @@ DATABASES = {
 
 # STATS_FORMAT = {} # defaults to empty dict
 
+# Cached data, such as inventory snapshots (see --snapshot); defaults to ~/.gips/cache
+# CACHE_DIR = '$TLD/cache'
+
+# Drivers with product graphs (see gips.data.core.Data.run_steps) can run
+# independent processing steps in parallel threads, and spill intermediates
+# to disk when those held in memory exceed a budget in bytes (default: none)
+# STEP_THREADS = 1
+# STEP_MEMORY_BUDGET = 2 * 1024 ** 3
+
+# Number of files to download at once from google cloud storage (default: 4)
+# DOWNLOAD_THREADS = 4
+
+# Number of atmospheric model runs (6S or MODTRAN, one per band) to run at
+# once when correcting a scene (default: 4)
+# ATMOSPHERE_THREADS = 4
+
+# Keep up to this many bytes of cloud storage objects' contents in CACHE_DIR,
+# so metadata & bands needn't be fetched again when reprocessing a scene; the
+# least recently used parts are dropped first (default: 0, meaning no cache)
+# BLOCK_CACHE_SIZE = 20 * 1024 ** 3
+
+# AWS S3 bucket listings are reused, and saved in CACHE_DIR for use by later
+# runs, for this many seconds (0 to not save them, and list each prefix once
+# per process), and are listed this many prefixes at once
+# S3_LISTING_TTL = 3600
+# S3_LIST_THREADS = 8
+
+# How product files, mosaics, and tile exports are laid out as GeoTIFFs; by
+# default they're left as written.  Each driver's REPOS entry may have an
+# 'output-profile' dict overriding keys of this one, with its 'products' key
+# overriding them further for particular products, eg
+# 'output-profile': {'products': {'ndvi': {'cog': True}}}.
+# OUTPUT_PROFILE = {
+#     'blocksize': 512,         # internal tile size, a multiple of 16
+#     'compress': 'DEFLATE',    # or eg 'ZSTD', 'LZW', 'NONE'
+#     'predictor': 'auto',      # 'auto' picks 2 for integers, 3 for floats
+#     'overviews': 'auto',      # eg [2, 4, 8]; 'auto' halves down to a block
+#     'resampling': 'AVERAGE',  # for overviews
+#     'cog': True,              # cloud-optimized layout
+# }
+
 # For NASA EarthData Authentication
 EARTHDATA_USER = ""
 EARTHDATA_PASS = ""
@@ -66,6 +107,10 @@ REPOS = {
         '6S': False,            # atm correction for VIS/NIR/SWIR bands
         'MODTRAN': False,       # atm correction for LWIR
         'extract': False,       # extract files from tar.gz before processing instead of direct access
+        # compute the TOA reflectance & temperature image once per scene:
+        # 'auto' (write to disk if several products need it), 'disk',
+        # 'memory' (GDAL /vsimem/), or 'recompute' (once per product)
+        'toa-intermediate': 'auto',
         'username': USGS_USER,
         'password': USGS_PASS,
         # 'ACOLITE_DIR':  '',   # ACOLITE installation for atm correction over water
@@ -88,6 +133,11 @@ REPOS = {
     },
     'prism': {
         'repository': '$TLD/prism',
+        # products are 'symlink's into the zipped assets (/vsizip/), or are
+        # written out as tiled GeoTIFFs ('materialize') for faster windowed
+        # reads; likewise for chirps.  'vsi-compression' may be eg 'ZSTD'.
+        # 'vsi-products': 'symlink',
+        # 'vsi-compression': 'DEFLATE',
     },
     'sar': {
         'repository': '$TLD/sar',
@@ -0,0 +1,216 @@
+#!/usr/bin/env python
+################################################################################
+#    GIPS: Geospatial Image Processing System
+#
+#    AUTHOR: Matthew Hanson
+#    EMAIL:  matt.a.hanson@gmail.com
+#
+#    Copyright (C) 2014-2018 Applied Geosolutions
+#
+#    This program is free software; you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation; either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program. If not, see <http://www.gnu.org/licenses/>
+################################################################################
+
+"""Temporal engines for products computed over more than one date."""
+
+from datetime import timedelta
+from collections import OrderedDict
+
+import numpy
+
+
+class RollingWindow(object):
+    """Sliding window of daily rasters, with a running sum over the window.
+
+    reader(date) must return a 2-D numpy array for the given date, or None
+    if nothing is available for it.  Each date is read once for as long as it
+    stays in the window:  Advancing the window by a day adds the incoming
+    day to the accumulator and subtracts the outgoing one, instead of
+    re-reading and re-summing every day in the window.  Dates must be
+    visited in increasing order to benefit; moving backwards or jumping
+    past the whole window starts over.
+
+    Pixels equal to `nodata` (or NaN) are tracked per-pixel; any pixel
+    with nodata in a day within the window is nodata in the output.
+
+    If given, stamp(date) must return something identifying the data for
+    the date as it is now, eg its file's path & modification time; days
+    whose stamp has changed since they were read are read again.
+    """
+    def __init__(self, width, reader, nodata=-9999, min_count=None, stamp=None):
+        """width is the window length in days, including the final day.
+
+        The window is considered complete when it holds at least
+        min_count days of data (defaults to width).
+        """
+        self.width = width
+        self.reader = reader
+        self.stamp = stamp
+        self.nodata = nodata
+        self.min_count = width if min_count is None else min_count
+        self.reset()
+
+    def reset(self):
+        """Empty the window."""
+        self.end = None
+        self._days = OrderedDict() # date: (array, nodata mask), or None
+        self._stamps = {}          # date: stamp(date) when it was read
+        self._sum = None           # running sum of valid values, as float64
+        self._invalid = None       # per-pixel count of nodata days
+
+    def _add(self, date):
+        if self.stamp is not None:
+            self._stamps[date] = self.stamp(date)
+        arr = self.reader(date)
+        if arr is None:
+            self._days[date] = None
+            return
+        arr = numpy.asarray(arr, dtype='float64')
+        bad = numpy.isnan(arr) | (arr == self.nodata)
+        arr = numpy.where(bad, 0.0, arr)
+        if self._sum is None:
+            self._sum = numpy.zeros(arr.shape, dtype='float64')
+            self._invalid = numpy.zeros(arr.shape, dtype='int16')
+        self._sum += arr
+        self._invalid += bad
+        self._days[date] = (arr, bad)
+
+    def _drop(self, date):
+        self._stamps.pop(date, None)
+        entry = self._days.pop(date)
+        if entry is not None:
+            arr, bad = entry
+            self._sum -= arr
+            self._invalid -= bad
+
+    def window_dates(self, end):
+        """Return the dates covered by a window ending on `end`."""
+        return [end - timedelta(days=i) for i in range(self.width - 1, -1, -1)]
+
+    def advance(self, end):
+        """Move the window so it ends on `end`; returns self for chaining."""
+        if (self.end is None or end < self.end
+                or (end - self.end).days >= self.width):
+            self.reset()
+        wanted = self.window_dates(end)
+        for d in [d for d in self._days if d < wanted[0]]:
+            self._drop(d)
+        for d in wanted:
+            if (d in self._days and self.stamp is not None
+                    and self._stamps.get(d) != self.stamp(d)):
+                self._drop(d) # changed since it was read
+            if d not in self._days:
+                self._add(d)
+        self.end = end
+        return self
+
+    @property
+    def dates(self):
+        """Dates in the window for which data was found."""
+        return sorted(d for d, e in self._days.items() if e is not None)
+
+    @property
+    def count(self):
+        """Number of days in the window for which data was found."""
+        return len(self.dates)
+
+    def complete(self):
+        """Does the window hold enough days to produce output?"""
+        return self._sum is not None and self.count >= self.min_count
+
+    def sum(self):
+        """Sum over the window, with nodata where any day was nodata."""
+        out = self._sum.copy()
+        out[self._invalid > 0] = self.nodata
+        return out
+
+    def mean(self):
+        """Mean over the window, with nodata where any day was nodata."""
+        out = self._sum / self.count
+        out[self._invalid > 0] = self.nodata
+        return out
+
+
+class StreamingStats(object):
+    """Per-pixel count, mean, variance, min, and max, one image at a time.
+
+    Uses Welford's algorithm, so each image only needs to be seen once and
+    never needs to be held in memory alongside the others.  Accumulated
+    state round-trips through bands() and from_bands(), so a composite can
+    be saved to disk and later updated with new dates without revisiting
+    the old ones.  Variance is the population variance.
+    """
+    band_names = ('mean', 'variance', 'count', 'min', 'max')
+
+    def __init__(self):
+        self.count = None
+        self._mean = None
+        self._m2 = None
+        self._min = None
+        self._max = None
+
+    def _allocate(self, shape):
+        self.count = numpy.zeros(shape, dtype='int32')
+        self._mean = numpy.zeros(shape, dtype='float64')
+        self._m2 = numpy.zeros(shape, dtype='float64')
+        self._min = numpy.full(shape, numpy.inf)
+        self._max = numpy.full(shape, -numpy.inf)
+
+    @classmethod
+    def from_bands(cls, bands, nodata):
+        """Restore accumulated state from arrays as emitted by bands()."""
+        mean, variance, count, vmin, vmax = [
+            numpy.asarray(b, dtype='float64') for b in bands]
+        stats = cls()
+        stats._allocate(mean.shape)
+        has = (count != nodata) & (count > 0)
+        stats.count[has] = count[has].round()
+        stats._mean[has] = mean[has]
+        stats._m2[has] = variance[has] * count[has]
+        stats._min[has] = vmin[has]
+        stats._max[has] = vmax[has]
+        return stats
+
+    def update(self, arr, valid=None):
+        """Add an image to the statistics; valid masks out nodata pixels."""
+        arr = numpy.asarray(arr, dtype='float64')
+        if valid is None:
+            valid = numpy.ones(arr.shape, dtype='bool')
+        valid = valid & ~numpy.isnan(arr)
+        if self.count is None:
+            self._allocate(arr.shape)
+        arr = numpy.where(valid, arr, 0.0)
+        self.count += valid
+        delta = numpy.where(valid, arr - self._mean, 0.0)
+        self._mean += delta / numpy.maximum(self.count, 1)
+        self._m2 += numpy.where(valid, delta * (arr - self._mean), 0.0)
+        self._min = numpy.where(valid, numpy.minimum(self._min, arr), self._min)
+        self._max = numpy.where(valid, numpy.maximum(self._max, arr), self._max)
+
+    @property
+    def mean(self):
+        return self._mean
+
+    @property
+    def variance(self):
+        return self._m2 / numpy.maximum(self.count, 1)
+
+    def bands(self, nodata):
+        """Return arrays ordered as band_names, nodata where count is 0."""
+        empty = self.count == 0
+        out = []
+        for arr in (self.mean, self.variance, self.count, self._min, self._max):
+            arr = arr.astype('float64')
+            arr[empty] = nodata
+            out.append(arr)
+        return out
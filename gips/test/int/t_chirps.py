@@ -3,6 +3,7 @@ import shutil
 import datetime
 
 import pytest
+from osgeo import gdal
 
 from gips.inventory import dbinv
 from gips.inventory import orm
@@ -64,3 +65,30 @@ def t_chirps_product_symlink(mocker, scene_dir_setup):
         and cd.AddFile.call_count == 1
         and cd.AddFile.call_args == mocker.call('chirps', 'precip', target_product_fp)
     )
+
+@pytest.mark.django_db
+def t_chirps_product_materialize(mocker, scene_dir_setup):
+    target_product_fp, link_target = scene_dir_setup
+
+    date = datetime.date(1997, 7, 1)
+    cd = chirps.chirpsData('global', date)
+
+    cd.needed_products = mocker.Mock()
+    m_np = cd.needed_products.return_value
+    m_np.requested = {'precip': ['precip']}
+    m_np.__len__ = lambda self: 1
+    cd.AddFile = mocker.Mock()
+    get_setting = chirps.chirpsRepository.get_setting
+    mocker.patch.object(chirps.chirpsRepository, 'get_setting', side_effect=lambda key:
+        'materialize' if key == 'vsi-products' else get_setting(key))
+
+    cd.process(products='dont-care')
+
+    product = gdal.Open(target_product_fp)
+    assert (
+        not os.path.islink(target_product_fp)
+        and product.GetMetadata('IMAGE_STRUCTURE')['COMPRESSION'] == 'DEFLATE'
+        and product.GetRasterBand(1).GetBlockSize() == [256, 256]
+        and (product.ReadAsArray() == gdal.Open(link_target).ReadAsArray()).all()
+        and cd.AddFile.call_args == mocker.call('chirps', 'precip', target_product_fp)
+    )
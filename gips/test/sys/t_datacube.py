@@ -0,0 +1,58 @@
+from __future__ import print_function
+
+import time
+import datetime
+
+import numpy
+from osgeo import gdal
+
+from gips.inventory import ProjectInventory
+
+from .util import *
+
+pytestmark = sys  # skip everything unless --sys
+
+
+def _write_project(path, ndates=100, size=1024):
+    """Write a project dir of ndates float32 ndvi files, as gips_export would."""
+    rng = numpy.random.RandomState(0)
+    for i in range(ndates):
+        date = datetime.date(2012, 1, 1) + datetime.timedelta(3 * i)
+        fn = path.join('{}_MOD_ndvi.tif'.format(date.strftime('%Y%j')))
+        ds = gdal.GetDriverByName('GTiff').Create(str(fn), size, size, 1,
+                                                  gdal.GDT_Float32)
+        ds.SetGeoTransform((300000, 250, 0, 4500000, 0, -250))
+        ds.GetRasterBand(1).SetNoDataValue(-32768)
+        ds.GetRasterBand(1).WriteArray(rng.uniform(-1, 1, (size, size)).astype('float32'))
+        ds = None
+
+
+@slow
+def t_datacube_benchmark(tmpdir):
+    """Compare reading time series from a datacube vs the per-file stack.
+
+    Reads the full series of 64x64 blocks, and map_reduce's full-width row
+    chunks; run with -s to see the timings.
+    """
+    _write_project(tmpdir)
+    inv = ProjectInventory(str(tmpdir))
+    blocks = [(x, y, 64, 64) for x in (0, 384, 768) for y in (64, 512, 896)]
+    rows = [(0, y, 1024, 32) for y in range(0, 256, 32)]
+
+    def timed(chunks):
+        start = time.time()
+        arrays = [inv.get_data(chunk=c) for c in chunks]
+        return time.time() - start, arrays
+
+    stack_times, stack_arrays = zip(timed(blocks), timed(rows))
+    start = time.time()
+    inv.write_datacube()
+    write_time = time.time() - start
+    cube_times, cube_arrays = zip(timed(blocks), timed(rows))
+
+    print('\nwriting the datacube took {:.2f}s'.format(write_time))
+    for label, s, c in zip(('64x64 blocks', 'row chunks'), stack_times, cube_times):
+        print('{:>14}: per-file {:.3f}s, datacube {:.3f}s'.format(label, s, c))
+    for s, c in zip(stack_arrays, cube_arrays):
+        assert all(numpy.allclose(a, b, equal_nan=True) for a, b in zip(s, c))
+    assert cube_times[0] < stack_times[0]
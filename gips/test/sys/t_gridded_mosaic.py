@@ -0,0 +1,62 @@
+from __future__ import print_function
+
+import time
+import resource
+
+import numpy
+import gippy
+from osgeo import gdal, osr
+
+from gips import utils
+
+from .util import *
+
+pytestmark = sys  # skip everything unless --sys
+
+
+def _write(filename, size, origin, res, value, dtype=gdal.GDT_Int16, nodata=-32768):
+    """Write a one-band UTM 18N image filled with value."""
+    ds = gdal.GetDriverByName('GTiff').Create(filename, size, size, 1, dtype)
+    srs = osr.SpatialReference()
+    srs.ImportFromEPSG(32618)
+    ds.SetProjection(srs.ExportToWkt())
+    ds.SetGeoTransform((origin[0], res, 0, origin[1], 0, -res))
+    band = ds.GetRasterBand(1)
+    if nodata is not None:
+        band.SetNoDataValue(nodata)
+    band.WriteArray(numpy.full((size, size), value))
+    ds = None
+
+
+@slow
+def t_gridded_mosaic_benchmark(tmpdir):
+    """Mosaic two overlapping tiles to a large masked grid.
+
+    Run with -s to see time taken & peak memory; the grid is 8000x8000,
+    so the old in-memory nodata prefill alone took 512 MB.
+    """
+    tiles = [str(tmpdir.join('a.tif')), str(tmpdir.join('b.tif'))]
+    _write(tiles[0], 5000, (300000, 4500000), 30, 1)
+    _write(tiles[1], 5000, (420000, 4500000), 30, 2)
+    # the mask is 1 over its top half only
+    mask_fn = str(tmpdir.join('mask.tif'))
+    _write(mask_fn, 8000, (300000, 4500000), 30, 0, gdal.GDT_Byte, None)
+    ds = gdal.Open(mask_fn, gdal.GA_Update)
+    ds.GetRasterBand(1).WriteArray(numpy.ones((4000, 8000), dtype='uint8'))
+    ds = None
+
+    outfile = str(tmpdir.join('mosaic.tif'))
+    start = time.time()
+    utils.gridded_mosaic(gippy.GeoImages(tiles), outfile, mask_fn)
+    elapsed = time.time() - start
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+    print('\ngridded mosaic: {:.1f}s, peak RSS {:.0f} MB'.format(elapsed, peak))
+
+    out = gdal.Open(outfile)
+    band = out.GetRasterBand(1)
+    assert band.GetNoDataValue() == -32768
+    assert 'a.tif;b.tif' == out.GetMetadataItem('GIPS_GRIDDED_MOSAIC_SOURCES')
+    top, bottom = band.ReadAsArray(0, 0, 8000, 10), band.ReadAsArray(0, 7990, 8000, 10)
+    assert (bottom == -32768).all()
+    assert (top[:, :4000] == 1).all()
+    assert (top[:, 4000:] == 2).all()  # b goes over a where they overlap
@@ -25,3 +25,36 @@ def t_query_service():
     resp = landsat.landsatAsset.query_service('C1', '012030', dt(2017, 8, 1))
     # print(str(resp))
     assert len(resp) == 1
+
+@slow
+def t_toa_intermediate_benchmark(mocker):
+    """Time the typical 6-product TOA request under each TOA policy.
+
+    See settings.REPOS['landsat']['toa-intermediate'].  Outputs must be
+    the same regardless of policy; run with -s to see the timings.
+    """
+    import time
+    import numpy
+    import gippy
+    from datetime import date
+    from gips.utils import settings
+    from gips.data import landsat
+    from . import driver_setup
+
+    driver_setup.setup_repo_data('landsat')
+    products = ['ref-toa', 'temp', 'tcap', 'ndvi-toa', 'evi-toa', 'lswi-toa']
+    timings, outputs = {}, {}
+    for policy in ('recompute', 'disk', 'memory'):
+        mocker.patch.dict(settings().REPOS['landsat'],
+                          {'toa-intermediate': policy})
+        data = landsat.landsatData('012030', date(2017, 8, 1))
+        start = time.time()
+        data.process(products, overwrite=True)
+        timings[policy] = time.time() - start
+        outputs[policy] = {
+            p: gippy.GeoImage(data.filenames[(data.sensor_set[0], p)]).Read()
+            for p in products}
+    print('\n'.join('{:>10}: {:.1f}s'.format(p, t) for p, t in timings.items()))
+    for policy in ('disk', 'memory'):
+        for p in products:
+            assert numpy.allclose(outputs['recompute'][p], outputs[policy][p])
@@ -0,0 +1,79 @@
+from __future__ import print_function
+
+import os
+import time
+import random
+
+import numpy
+from osgeo import gdal, osr
+
+from gips import utils
+
+from .util import *
+
+pytestmark = sys  # skip everything unless --sys
+
+_profiles = [
+    ('as written', None),
+    ('tiled', {'compress': 'NONE', 'predictor': None}),
+    ('deflate', {}),
+    ('zstd', {'compress': 'ZSTD'}),
+    ('cog', {'overviews': 'auto', 'cog': True}),
+]
+
+
+def _write_plain(filename, size=4096):
+    """Write a smooth float32 image in GDAL's default (striped) layout."""
+    y, x = numpy.mgrid[0:size, 0:size].astype('float32')
+    ds = gdal.GetDriverByName('GTiff').Create(filename, size, size, 1,
+                                              gdal.GDT_Float32)
+    srs = osr.SpatialReference()
+    srs.ImportFromEPSG(32618)
+    ds.SetProjection(srs.ExportToWkt())
+    ds.SetGeoTransform((300000, 30, 0, 4500000, 0, -30))
+    ds.GetRasterBand(1).SetNoDataValue(-32768)
+    ds.GetRasterBand(1).WriteArray(numpy.sin(x / 200.0) * numpy.cos(y / 300.0)
+                                   + numpy.random.RandomState(0).normal(0, .01, x.shape))
+    ds = None
+
+
+@slow
+def t_output_profile_benchmark(tmpdir):
+    """Compare product size, write time, & read latency across profiles.
+
+    Reads 200 random 256x256 windows, as small-AOI consumers do, and a
+    512x512 preview of the whole image; run with -s to see the results.
+    """
+    rows = []
+    for name, overrides in _profiles:
+        fn = str(tmpdir.join(name.replace(' ', '-') + '.tif'))
+        _write_plain(fn)
+        profile = None
+        if overrides is not None:
+            profile = dict(utils._output_profile_defaults, **overrides)
+        start = time.time()
+        utils.apply_output_profile(fn, profile)
+        write_time = time.time() - start
+
+        rng = random.Random(0)
+        start = time.time()
+        band = gdal.Open(fn).GetRasterBand(1)
+        for _ in range(200):
+            band.ReadAsArray(rng.randrange(4096 - 256), rng.randrange(4096 - 256),
+                             256, 256)
+        window_time = time.time() - start
+        start = time.time()
+        gdal.Open(fn).GetRasterBand(1).ReadAsArray(buf_xsize=512, buf_ysize=512)
+        preview_time = time.time() - start
+        rows.append((name, os.path.getsize(fn), write_time, window_time, preview_time))
+
+    print('\n{:>12} {:>10} {:>8} {:>10} {:>9}'.format(
+        'profile', 'MB', 'write s', 'windows s', 'preview s'))
+    for name, size, w, r, p in rows:
+        print('{:>12} {:>10.1f} {:>8.2f} {:>10.3f} {:>9.3f}'.format(
+            name, size / 2.0 ** 20, w, r, p))
+
+    sizes = {name: size for name, size, _, _, _ in rows}
+    assert sizes['deflate'] < sizes['as written']
+    previews = {name: p for name, _, _, _, p in rows}
+    assert previews['cog'] < previews['as written']
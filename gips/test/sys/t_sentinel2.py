@@ -0,0 +1,53 @@
+from __future__ import print_function
+
+from .util import *
+
+pytestmark = sys  # skip everything unless --sys
+
+@slow
+def t_standard_product_writer_benchmark(tmpdir):
+    """Time writing standard products band by band vs. in a single pass.
+
+    Both ways must produce the same pixels; run with -s to see the timings.
+    The single pass goes first so it doesn't benefit from a warm OS cache.
+    """
+    import time
+    from datetime import date
+    import numpy
+    import gippy
+    from gips import utils
+    from gips.data.sentinel2 import sentinel2
+    from . import driver_setup
+
+    driver_setup.setup_repo_data('sentinel2')
+    products = ['ref-toa', 'rad-toa']
+    data = sentinel2.sentinel2Data('19TCH', date(2017, 7, 2))
+    data._temp_proc_dir = str(tmpdir)
+    data.run_steps(data.plan_steps(products, overwrite=True), keep=products)
+
+    def outputs(suffix):
+        images = []
+        for p in products:
+            src = data.step_result(p)
+            out = gippy.GeoImage(str(tmpdir.join(p + suffix)), src)
+            out.SetNoData(0)
+            out.SetGain(0.0001)
+            images.append((src, out))
+        return images
+
+    start = time.time()
+    utils.process_images(outputs('-single-pass.tif'))
+    single_pass = time.time() - start
+
+    start = time.time()
+    for src, out in outputs('-by-band.tif'):
+        for i in range(len(src)):
+            src[i].Process(out[i])
+    src = out = None # closes the last file
+    by_band = time.time() - start
+
+    print('\nband by band: {:.1f}s\n single pass: {:.1f}s'.format(by_band, single_pass))
+    for p in products:
+        assert numpy.array_equal(
+            gippy.GeoImage(str(tmpdir.join(p + '-single-pass.tif'))).Read(),
+            gippy.GeoImage(str(tmpdir.join(p + '-by-band.tif'))).Read())
@@ -0,0 +1,50 @@
+from __future__ import print_function
+
+import json
+import subprocess
+from sys import executable as python
+
+from .util import *
+
+pytestmark = sys  # skip everything unless --sys
+
+# run in a fresh interpreter so nothing is imported already; reports the
+# cumulative time spent importing each module, like python3's -X importtime
+_startup_script = r'''
+import json, sys, time, __builtin__
+times, stack = {}, []
+real_import = __builtin__.__import__
+def timed_import(name, *args, **kwargs):
+    if name in sys.modules:
+        return real_import(name, *args, **kwargs)
+    stack.append(name)
+    start = time.time()
+    try:
+        return real_import(name, *args, **kwargs)
+    finally:
+        stack.pop()
+        times.setdefault(name, time.time() - start)
+__builtin__.__import__ = timed_import
+start = time.time()
+from gips.parsers import GIPSParser
+from gips.utils import settings
+parser = GIPSParser()
+parser.add_inventory_parser()
+parser.parse_args(args=sys.argv[1:])
+print(json.dumps({'total': time.time() - start, 'imports': times,
+                  'drivers': sorted(set(sys.modules) & set(settings().REPOS))}))
+'''
+
+@slow
+def t_startup_benchmark():
+    """Time parsing `gips_inventory modis -t h12v04`'s arguments.
+
+    Only the modis driver should be imported to do it; run with -s to see
+    the slowest imports.
+    """
+    report = json.loads(subprocess.check_output(
+        [python, '-c', _startup_script, 'modis', '-t', 'h12v04']))
+    slowest = sorted(report['imports'].items(), key=lambda i: -i[1])[:20]
+    print('\nstartup: {:.2f}s'.format(report['total']))
+    print('\n'.join('{:>8.3f}s  {}'.format(t, m) for m, t in slowest))
+    assert report['drivers'] == ['modis']
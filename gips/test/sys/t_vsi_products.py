@@ -0,0 +1,59 @@
+from __future__ import print_function
+
+import os
+import time
+import random
+
+import numpy
+from osgeo import gdal
+
+from gips import utils
+
+from .util import *
+
+pytestmark = sys  # skip everything unless --sys
+
+_asset_fp = os.path.join(os.path.dirname(__file__), '..', 'int', 'data',
+                         'global-daily-chirps-v2.0.1997.07.01.tif.gz')
+
+
+def _read_windows(path, windows, rows):
+    """Open path and read each window of rows; return the seconds taken."""
+    start = time.time()
+    ds = gdal.Open(path)
+    band = ds.GetRasterBand(1)
+    for y in windows:
+        band.ReadAsArray(0, y, ds.RasterXSize, rows)
+    ds = None
+    return time.time() - start
+
+
+@slow
+def t_vsi_product_windowed_reads(tmpdir):
+    """Compare windowed reads of a CHIRPS product as a symlink vs a GeoTIFF.
+
+    Reads 100-row windows in random order, as mosaicking and chunked
+    project reads do; run with -s to see the timings.
+    """
+    vsi_path = '/vsigzip/' + os.path.abspath(_asset_fp)
+    link_fp = str(tmpdir.join('symlink.tif'))
+    os.symlink(vsi_path, link_fp)
+    start = time.time()
+    tiff_fp = utils.write_tiled_geotiff(vsi_path, str(tmpdir.join('tiled.tif')))
+    write_time = time.time() - start
+
+    rows = 100
+    ysize = gdal.Open(link_fp).RasterYSize
+    windows = list(range(0, ysize - rows, rows))
+    random.Random(0).shuffle(windows)
+    times = {mode: _read_windows(fp, windows, rows)
+             for mode, fp in (('symlink', link_fp), ('materialize', tiff_fp))}
+    print('\n{} windows of {} rows; materializing took {:.2f}s'.format(
+        len(windows), rows, write_time))
+    for mode, t in sorted(times.items()):
+        print('{:>12}: {:.3f}s ({:.1f}ms per window)'.format(
+            mode, t, 1000.0 * t / len(windows)))
+
+    assert numpy.array_equal(gdal.Open(link_fp).ReadAsArray(),
+                             gdal.Open(tiff_fp).ReadAsArray())
+    assert times['materialize'] < times['symlink']
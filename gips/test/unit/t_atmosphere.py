@@ -0,0 +1,69 @@
+"""Unit tests for gips.atmosphere."""
+
+import os
+import sys
+import stat
+import datetime
+
+import pytest
+
+from gips import atmosphere
+
+# stands in for MODTRAN:  writes .chn files for the runs in mod5root.in, and
+# logs where & when it ran
+_fake_modtran = '''#!{python}
+import os, time
+start = time.time()
+time.sleep(0.5)
+for root in open('mod5root.in').read().split():
+    bandnum = int(root[4:].replace('Ld', ''))
+    line = [' '] * 250
+    for col, text in ((59, '{{:13.6E}}'.format(2e-4 if root.endswith('Ld') else 1e-4)),
+                      (85, '{{:9.4f}}'.format(1000.0)), (239, '{{:9.7f}}'.format(0.9))):
+        line[col:col + len(text)] = text
+    with open(root + '.chn', 'w') as f:
+        f.write('\\n' * (4 + bandnum) + ''.join(line) + '\\n')
+with open({log!r}, 'a') as f:
+    f.write('{{}} {{}} {{}}\\n'.format(os.getcwd(), start, time.time()))
+'''
+
+
+@pytest.fixture
+def fake_modtran(mocker, tmpdir):
+    log = str(tmpdir.join('log'))
+    exe = tmpdir.join('modtran')
+    exe.write(_fake_modtran.format(python=sys.executable, log=log))
+    os.chmod(str(exe), stat.S_IRWXU)
+    mocker.patch.object(atmosphere.MODTRAN, '_executable', str(exe))
+    mocker.patch.object(atmosphere.MODTRAN, '_datadir', str(tmpdir))
+    m_settings = mocker.patch.object(atmosphere, 'settings')
+    m_settings.return_value.ATMOSPHERE_THREADS = 3
+    return log
+
+
+def t_modtran_run_bands(fake_modtran):
+    """Bands should be run at once, each in a directory of its own."""
+    dt = datetime.datetime(2018, 7, 1, 15, 30)
+    runs = atmosphere.MODTRAN.run_bands(
+        [(6, 10.4, 12.5), (10, 10.6, 11.2), (11, 11.5, 12.5)], dt, 40.0, -72.0)
+
+    assert {b: m.output for b, m in runs.items()} == {
+        b: [0.9, 1.0, 2.0] for b in (6, 10, 11)}
+    with open(fake_modtran) as f:
+        log = [line.split() for line in f]
+    workdirs = set(cwd for cwd, _, _ in log)
+    assert len(log) == 3 and len(workdirs) == 3
+    assert not any(os.path.exists(d) for d in workdirs)
+    # they overlapped in time
+    assert max(float(s) for _, s, _ in log) < min(float(e) for _, _, e in log)
+
+
+def t_run_models_raises(mocker):
+    """A failed run should raise its error once the others are done."""
+    m_settings = mocker.patch.object(atmosphere, 'settings')
+    m_settings.return_value.ATMOSPHERE_THREADS = 2
+    def fail():
+        raise RuntimeError('no sixs here')
+    with pytest.raises(RuntimeError):
+        atmosphere.run_models([('a', lambda: 1, ()), ('b', fail, ())])
+    assert atmosphere.run_models([('a', lambda x: x + 1, (1,))]) == {'a': 2}
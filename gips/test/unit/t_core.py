@@ -6,7 +6,15 @@ import pkgutil
 import imp
 import datetime
 from datetime import datetime as dt
-
+import base64
+import hashlib
+import threading
+import multiprocessing
+import time
+import BaseHTTPServer
+import SocketServer
+
+import numpy
 import pytest
 import mock
 
@@ -239,6 +247,403 @@ def t_query_service_caching(mpo):
     assert (m_available.call_count == 1 # should use the cache 2nd time
             and actual_first == actual_second == None)
 
+class StepData(data_core.Data):
+    """Data with a toy product graph:  d needs b & c, which both need a."""
+    _product_steps = {
+        'a': data_core.ProductStep('make', args=['a']),
+        'b': data_core.ProductStep('make', ['a'], ['b']),
+        'c': data_core.ProductStep('make', ['a'], ['c']),
+        'd': data_core.ProductStep('make', ['b', 'c'], ['d']),
+        'cd': data_core.ProductStep(inputs=['c', 'd']),
+        'loop': data_core.ProductStep('make', ['loop'], ['loop']),
+    }
+
+    sizes = {'a': 500, 'b': 1000, 'c': 500, 'd': 500}
+
+    def make(self, name):
+        """Return an array of 1 + the sum of the input steps' values."""
+        if name == 'fail':
+            raise IOError('step failed')
+        inputs = [self.step_result(i) for i in self._product_steps[name].inputs]
+        return numpy.full(self.sizes[name], 1 + sum(int(i[0]) for i in inputs),
+                          dtype='int64')
+
+@pytest.fixture
+def step_data(mocker, tmpdir):
+    m_settings = mocker.patch.object(data_core, 'settings')
+    m_settings.return_value = mock.Mock(spec=['STEP_THREADS', 'STEP_MEMORY_BUDGET'],
+                                        STEP_THREADS=1, STEP_MEMORY_BUDGET=None)
+    data = StepData()
+    data._temp_proc_dir = str(tmpdir)
+    return data, m_settings.return_value
+
+def t_plan_steps(step_data):
+    """Steps should be ordered by dependency, skipping outputs already on hand."""
+    data, _ = step_data
+    assert data.plan_steps(['d']) == ['a', 'b', 'c', 'd']
+    data.filenames[('sensor', 'b')] = 'b.tif'
+    assert data.plan_steps(['cd']) == ['a', 'c', 'd', 'cd']
+    assert data.plan_steps(['d', 'b'], overwrite=True) == ['a', 'b', 'c', 'd']
+    with pytest.raises(ValueError):
+        data.plan_steps(['loop'])
+    with pytest.raises(ValueError):
+        data.plan_steps(['e'])
+
+@pytest.mark.parametrize('threads', [1, 3])
+def t_run_steps(step_data, threads):
+    """Outputs should be made in order & let go of once no longer needed."""
+    data, config = step_data
+    config.STEP_THREADS = threads
+    data.run_steps(data.plan_steps(['cd']), keep=['cd'])
+    assert set(data._step_results) == {'c', 'd', 'cd'}
+    assert (data.step_result('d') == 5).all()
+    assert sorted(data.step_timings) == ['a', 'b', 'c', 'cd', 'd']
+
+class ImageStepData(StepData):
+    """StepData whose 'a' is an object that mustn't be used by two threads at once."""
+    def make(self, name):
+        if name == 'a':
+            return [1]
+        start = time.time()
+        time.sleep(0.05)
+        self.spans[name] = (start, time.time())
+        return super(ImageStepData, self).make(name)
+
+def t_run_steps_exclusive_inputs(step_data):
+    """Steps sharing an input that isn't an array shouldn't run at once."""
+    _, config = step_data
+    config.STEP_THREADS = 3
+    data = ImageStepData()
+    data.spans = {}
+    data.run_steps(['a', 'b', 'c', 'd'], keep=['d'])
+    (b0, b1), (c0, c1) = data.spans['b'], data.spans['c']
+    assert b1 <= c0 or c1 <= b0
+    assert (data.step_result('d') == 5).all()
+
+def t_run_steps_budget(step_data):
+    """Outputs still needed should be spilled to disk when over budget."""
+    data, config = step_data
+    config.STEP_MEMORY_BUDGET = 10000 # a & b together are 12000 bytes
+    real_spill = data._spill_step_result
+    spilled = []
+    def spy(name, value):
+        spilled.append(name)
+        return real_spill(name, value)
+    data._spill_step_result = spy
+    data.run_steps(['a', 'b', 'c', 'd'], keep=['d'])
+    assert spilled == ['b'] and list(data._step_results) == ['d']
+    assert (data.step_result('d') == 5).all()
+
+def t_run_steps_error(step_data):
+    """A failing step should raise, and steps needing its output shouldn't run."""
+    data, _ = step_data
+    data._product_steps = dict(data._product_steps,
+                               b=data_core.ProductStep('make', ['a'], ['fail']))
+    with pytest.raises(IOError):
+        data.run_steps(data.plan_steps(['d']))
+    assert data.step_timings.keys() == ['a', 'b']
+
+@pytest.fixture
+def sidecar_asset(mocker, tmpdir):
+    """An Asset for an archived file, with a compute function for its metadata."""
+    mocker.patch.object(data_core.Repository, 'data_path', return_value=str(tmpdir))
+    fn = tmpdir.join('asset.tar.gz')
+    fn.write('asset contents')
+    compute = mock.Mock(return_value={
+        'clouds': 12.5, 'filenames': [u'B1.TIF', u'B2.TIF'],
+        'datetime': dt(2012, 12, 1, 15, 30, 1, 250), 'date': datetime.date(2012, 12, 1)})
+    return data_core.Asset(str(fn)), compute
+
+def t_cached_metadata_sidecar(sidecar_asset):
+    """Metadata should be computed once, then read from the sidecar."""
+    asset, compute = sidecar_asset
+    first = asset.cached_metadata('md', compute)
+    second = data_core.Asset(asset.filename).cached_metadata('md', compute)
+    assert compute.call_count == 1 and os.path.exists(asset.metadata_filename)
+    assert first == second
+    assert all(type(fn) is str for fn in second['filenames'])
+
+def t_cached_metadata_sidecar_invalidation(sidecar_asset):
+    """Sidecars shouldn't be trusted after the asset or the sidecar changes."""
+    asset, compute = sidecar_asset
+    asset.cached_metadata('md', compute)
+    with open(asset.filename, 'a') as fo:
+        fo.write('new asset contents')
+    data_core.Asset(asset.filename).cached_metadata('md', compute)
+    assert compute.call_count == 2
+    with open(asset.metadata_filename) as fo:
+        tampered = fo.read().replace('12.5', '99.5')
+    with open(asset.metadata_filename, 'w') as fo:
+        fo.write(tampered)
+    assert data_core.Asset(asset.filename).cached_metadata('md', compute)['clouds'] == 12.5
+    assert compute.call_count == 3
+
+def t_db_metadata_local_only(sidecar_asset):
+    """DB metadata shouldn't be computed for assets whose data is remote."""
+    asset, _ = sidecar_asset
+    class CCAsset(data_core.CloudCoverAsset):
+        cloud_storage_a_types = ('C1GS',)
+        cloud_cover = mock.Mock(return_value=12.5)
+    local = CCAsset(asset.filename)
+    local.asset = 'C1'
+    assert local.db_metadata() == {'cloud_cover': 12.5}
+    remote = CCAsset(asset.filename)
+    remote.asset = 'C1GS'
+    assert remote.db_metadata() == {}
+    assert CCAsset.cloud_cover.call_count == 1
+
+class RangeServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    """Local HTTP server for one payload, supporting Range requests.
+
+    Set drop_after to cut off the next response after that many bytes.
+    """
+    daemon_threads = True
+    payload = ''.join(chr(i % 251) for i in range(100000))
+    drop_after = None
+    delay = 0
+
+    class Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+        def do_GET(self):
+            server = self.server
+            server.ranges.append(self.headers.get('Range'))
+            threading.Event().wait(server.delay)
+            size = len(server.payload)
+            start, end = 0, size - 1
+            if 'Range' in self.headers:
+                first, _, last = self.headers['Range'][6:].partition('-')
+                start, end = int(first), min(int(last or end), end)
+            body = server.payload[start:end + 1]
+            self.send_response(206 if 'Range' in self.headers else 200)
+            if 'Range' in self.headers:
+                self.send_header('Content-Range',
+                                 'bytes {}-{}/{}'.format(start, end, size))
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            if server.drop_after is not None:
+                body, server.drop_after = body[:server.drop_after], None
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+@pytest.fixture
+def range_server():
+    server = RangeServer(('127.0.0.1', 0), RangeServer.Handler)
+    server.ranges = []
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    yield server, 'http://127.0.0.1:{}/object'.format(server.server_address[1])
+    server.shutdown()
+    server.server_close()
+
+def t_resumable_downloader_resumes(range_server, tmpdir):
+    """An interrupted download should resume where it left off."""
+    server, url = range_server
+    server.drop_after = 30000
+    md5 = base64.b64encode(hashlib.md5(server.payload).digest())
+    dst = str(tmpdir.join('object'))
+    data_core.ResumableDownloader(max_time=10).fetch(
+        url, dst, len(server.payload), md5)
+    assert open(dst, 'rb').read() == server.payload
+    assert server.ranges == [None, 'bytes=30000-']
+    assert not os.path.exists(dst + '.part')
+
+def t_resumable_downloader_verification(range_server, tmpdir):
+    """A download that doesn't match its checksum shouldn't be kept."""
+    server, url = range_server
+    dst = str(tmpdir.join('object'))
+    with pytest.raises(IOError):
+        data_core.ResumableDownloader().fetch(url, dst, md5='bogus')
+    assert os.listdir(str(tmpdir)) == []
+
+def t_resumable_downloader_closes_unsatisfiable(mocker, tmpdir):
+    """A 416 response to a resume should still release its connection."""
+    part = tmpdir.join('object.part')
+    part.write('x' * 10)
+    response = mocker.Mock(status_code=416)
+    mocker.patch.object(data_core.requests, 'get', return_value=response)
+    data_core.ResumableDownloader()._transfer('http://example.com/o', str(part), 20)
+    response.close.assert_called_once_with()
+    response.raise_for_status.assert_not_called()
+
+def t_resumable_downloader_dedup(range_server, tmpdir):
+    """Concurrent requests for the same object should download it once."""
+    server, url = range_server
+    server.delay = 0.2
+    items = [(url, str(tmpdir.join('object-' + str(i)))) for i in range(3)]
+    paths = data_core.ResumableDownloader(workers=3).fetch_all(items)
+    assert paths == [dst for (_, dst) in items]
+    assert all(open(p, 'rb').read() == server.payload for p in paths)
+    assert len(server.ranges) == 1
+
+@pytest.fixture
+def block_cache(tmpdir, mocker):
+    mocker.patch.dict(data_core.BlockCache.stats,
+                      {k: 0 for k in data_core.BlockCache.stats})
+    return data_core.BlockCache(str(tmpdir.join('blocks')), 10 ** 6,
+                                block_size=10000, max_time=10)
+
+def t_block_cache_reads(range_server, block_cache):
+    """Repeated & overlapping reads should come from the cache."""
+    server, url = range_server
+    assert block_cache.read(url, 25000, 100) == server.payload[25000:25100]
+    assert server.ranges == ['bytes=0-9999', 'bytes=20000-29999']
+    assert block_cache.read(url, 5000, 30000) == server.payload[5000:35000]
+    assert server.ranges[2:] == ['bytes=10000-19999', 'bytes=30000-39999']
+    del server.ranges[:]
+    assert block_cache.read(url, 0, 40000) == server.payload[:40000]
+    assert server.ranges == []
+    assert block_cache.stats == {'hits': 6, 'misses': 4,
+                                 'bytes-saved': 60000, 'bytes-fetched': 40000}
+
+def t_block_cache_resumes(range_server, block_cache, tmpdir):
+    """An interrupted run should resume from the first block not yet stored."""
+    server, url = range_server
+    block_cache.size(url)
+    server.drop_after = 25000
+    assert block_cache.read(url, 10000, 50000) == server.payload[10000:60000]
+    assert server.ranges == ['bytes=0-9999', 'bytes=10000-59999', 'bytes=30000-59999']
+
+def t_block_cache_discarded_on_bad_download(range_server, block_cache, tmpdir):
+    """Cached blocks of a download that fails verification should be dropped."""
+    server, url = range_server
+    dst = str(tmpdir.join('object'))
+    downloader = data_core.ResumableDownloader(max_time=10, cache=block_cache)
+    with pytest.raises(IOError):
+        downloader.fetch(url, dst, md5='bogus')
+    assert os.listdir(block_cache.directory) == []
+    del server.ranges[:]
+    downloader.fetch(url, dst, len(server.payload))
+    assert open(dst, 'rb').read() == server.payload
+    assert len(server.ranges) == 2 # the size, then the rest
+
+def t_block_cache_eviction(range_server, block_cache, tmpdir):
+    """Least recently used blocks should be dropped to keep under max_bytes."""
+    server, url = range_server
+    block_cache.max_bytes = 35000
+    dst = str(tmpdir.join('object'))
+    block_cache.copy(url, dst)
+    assert open(dst, 'rb').read() == server.payload
+    cached = [fn for fn in os.listdir(block_cache.directory) if not fn.endswith('.size')]
+    assert sorted(int(fn.split('.')[1]) for fn in cached) == [7, 8, 9]
+
+
+class lockRepository(data_core.Repository):
+    root = None # set by the test
+
+    @classmethod
+    def path(cls, subdir=''):
+        return os.path.join(cls.root, subdir)
+
+class lockAsset(data_core.Asset):
+    Repository = lockRepository
+
+class lockData(data_core.Data):
+    """Makes empty products, slowly, logging each one it makes."""
+    Asset = lockAsset
+    _products = {'a': {}, 'b': {}, 'c': {}}
+
+    @data_core.Data.proc_temp_dir_manager
+    def process(self, products, overwrite=False):
+        for p in self.needed_products(products, overwrite).products:
+            with open(os.path.join(self.Repository.root, 'log'), 'a') as log:
+                log.write('{} {} {}\n'.format(self.basename, p, os.getpid()))
+            temp_fp = self.temp_product_filename('sen', p)
+            open(temp_fp, 'w').close()
+            time.sleep(0.01)
+            self.AddFile('sen', p, self.archive_temp_path(temp_fp), add_to_db=False)
+
+def t_data_lock_stress(tmpdir, mocker):
+    """Processes making overlapping products should make each just once."""
+    mocker.patch.object(data_core.utils, 'output_profile', return_value=None)
+    lockRepository.root = str(tmpdir)
+    dates = [datetime.date(2018, 1, d) for d in range(1, 4)]
+    for d in dates:
+        os.makedirs(lockRepository.data_path('t1', d))
+    os.makedirs(lockRepository.path('stage'))
+
+    def run(products):
+        # each process's Data objects are made before any products exist
+        data = [lockData('t1', d, search=False) for d in dates]
+        for d in (data if os.getpid() % 2 else data[::-1]):
+            with d.lock():
+                d.process(products)
+
+    workers = [multiprocessing.Process(target=run, args=(products,))
+               for products in [['a', 'b'], ['b', 'c'], ['a', 'c'], ['a', 'b', 'c']] * 2]
+    [w.start() for w in workers]
+    [w.join(60) for w in workers]
+    assert [w.exitcode for w in workers] == [0] * len(workers)
+
+    made = [line.split()[:2] for line in open(str(tmpdir.join('log')))]
+    assert sorted(made) == sorted([bn, p] for bn in
+                                  ['t1_2018001', 't1_2018002', 't1_2018003']
+                                  for p in 'abc')
+    assert os.listdir(lockRepository.path('stage')) == []
+    assert sorted(os.listdir(lockRepository.path('locks/t1'))) == [
+        '2018001.lock', '2018002.lock', '2018003.lock']
+
+def t_archive_temp_path_applies_profile(tmpdir, mocker):
+    """Products should be rewritten to the output profile before being archived."""
+    lockRepository.root = str(tmpdir)
+    d = datetime.date(2018, 1, 1)
+    os.makedirs(lockRepository.data_path('t1', d))
+    m_profile = mocker.patch.object(data_core.utils, 'output_profile')
+    m_apply = mocker.patch.object(data_core.utils, 'apply_output_profile')
+    data = lockData('t1', d, search=False)
+    temp_fp = str(tmpdir.join('t1_2018001_sen_ref-toa.tif'))
+    open(temp_fp, 'w').close()
+    m_apply.side_effect = lambda fn, profile: os.path.exists(fn) or pytest.fail(
+        'profile applied after archiving')
+    archive_fp = data.archive_temp_path(temp_fp)
+    assert archive_fp == os.path.join(data.path, 't1_2018001_sen_ref-toa.tif')
+    m_profile.assert_called_once_with(data.name, 'ref-toa')
+    m_apply.assert_called_once_with(temp_fp, m_profile.return_value)
+
+@pytest.fixture
+def s3_asset(mocker, tmpdir):
+    """An S3Mixin class for a stand-in bucket holding two scenes' keys."""
+    moto = pytest.importorskip('moto')
+    import boto3
+    mocker.patch.dict(os.environ, {'AWS_SECRET_ACCESS_KEY': 'fake-secret-key',
+                                   'AWS_ACCESS_KEY_ID': 'fake-key-id',
+                                   'AWS_DEFAULT_REGION': 'us-east-1'})
+    mocker.patch.object(data_core, 'settings').return_value = mocker.Mock(
+        spec=['S3_LISTING_TTL'], S3_LISTING_TTL=3600)
+    mocker.patch.object(data_core.utils, 'cache_path', side_effect=lambda *d:
+                        data_core.utils.mkdir(os.path.join(str(tmpdir), *d)))
+
+    class S3Asset(data_core.S3Mixin):
+        _s3_bucket_name = 'fake-bucket'
+        _s3_listings = {}
+
+    with moto.mock_s3():
+        client = boto3.client('s3')
+        client.create_bucket(Bucket='fake-bucket')
+        # enough keys in one scene that listing it takes several pages
+        keys = (['c1/027/033/A/{:04}.TIF'.format(i) for i in range(1100)]
+                + ['c1/027/033/B/B1.TIF', 'c1/027/033/index.html', 'c1/027/034/C/B1.TIF'])
+        for k in keys:
+            client.put_object(Bucket='fake-bucket', Key=k, Body='')
+        yield S3Asset, client, keys
+
+def t_s3_prefix_search(s3_asset, mocker):
+    """Listings should be reused from memory, then disk, until they expire.
+
+    In-memory listings expire too, so long-running processes see new keys.
+    """
+    S3Asset, client, keys = s3_asset
+    expected = sorted(k for k in keys if k.startswith('c1/027/033/'))
+    assert sorted(S3Asset.s3_prefix_search('c1/027/033/')) == expected
+    for k in keys:
+        client.delete_object(Bucket='fake-bucket', Key=k)
+    assert sorted(S3Asset.s3_prefix_search('c1/027/033/')) == expected
+    S3Asset._s3_listings.clear() # as in a new process
+    assert sorted(S3Asset.s3_prefix_search('c1/027/033/')) == expected
+    mocker.patch.object(data_core.time, 'time', return_value=time.time() + 7200)
+    assert S3Asset.s3_prefix_search('c1/027/033/') == []
+
 class GipsDriverModules(object):
     """Introspect the GIPS codebase and load all the driver modules."""
     def __init__(self):
@@ -119,7 +119,8 @@ def basic_asset_db(db):
             'date':   datetime.date(2012, 12, 1),
             'driver': u'modis',
             'sensor': u'MCD',
-            'tile':   u'h12v04'
+            'tile':   u'h12v04',
+            'cloud_cover': None,
         },
         { # duplicate tile string to confirm nonrepetition in outcome
             'name':   path_prefix + '/h12v04/2012336/MCD43A2.A2012336.h12v04.006.2016112010833.hdf',
@@ -127,7 +128,8 @@ def basic_asset_db(db):
             'date':   datetime.date(2012, 12, 2),
             'driver': u'modis',
             'sensor': u'MCD',
-            'tile':   u'h12v04'
+            'tile':   u'h12v04',
+            'cloud_cover': None,
         },
         { # second tile to confirm multiple tiles will be returned
             'name':   path_prefix + '/h12v04/2012336/MCD43A2.A2012336.h12v04.006.2016112010833.hdf',
@@ -135,7 +137,8 @@ def basic_asset_db(db):
             'date':   datetime.date(2012, 12, 2),
             'driver': u'modis',
             'sensor': u'MCD',
-            'tile':   u'h13v05'
+            'tile':   u'h13v05',
+            'cloud_cover': None,
         },
         { # different driver to confirm no cross-driver pollution of results
             'name':   path_prefix + '/h12v04/2012336/MCD43A2.A2012336.h12v04.006.2016112010833.hdf',
@@ -143,7 +146,8 @@ def basic_asset_db(db):
             'date':   datetime.date(2012, 12, 1),
             'driver': u'landsat',
             'sensor': u'MCD',
-            'tile':   u'trolololo'
+            'tile':   u'trolololo',
+            'cloud_cover': None,
         },
     ]
     [models.Asset(**f).save() for f in assets]
@@ -217,7 +221,7 @@ def t_insert_new_model(mtype, call):
         'name':   u'/some/file/name.xtn',
         'driver': u'some-driver',
     }
-    expected = dict(values)
+    expected = dict(values, **({'cloud_cover': None} if mtype == 'asset' else {}))
     a = call(**values)
     returned_actual = model_to_dict(a)
     model = {'asset': models.Asset, 'product': models.Product}[mtype]
@@ -252,5 +256,23 @@ def t_update_existing_model(mtype, call):
 
     # perform assertions
     expected = dict(values) # now carries replaced filename
+    if mtype == 'asset':
+        expected['cloud_cover'] = None
     expected['id'] = queried_actual['id'] # intentional small deviation from ideal test practice
     assert expected == returned_actual == queried_actual and model.objects.count() == 1
+
+
+@pytest.mark.django_db
+def t_update_or_add_asset_quality_metadata():
+    """update_or_add_asset should save quality metadata such as cloud cover."""
+    values = {
+        'asset':  u'C1',
+        'sensor': u'LC8',
+        'tile':   u'012030',
+        'date':   datetime.date(2015, 12, 18),
+        'name':   u'/some/file/name.tar.gz',
+        'driver': u'landsat',
+    }
+    dbinv.update_or_add_asset(cloud_cover=12.5, **values)
+    dbinv.update_or_add_asset(cloud_cover=87.5, **dict(values, asset=u'C1S3'))
+    assert [a.asset for a in asset_search(driver='landsat', cloud_cover__lte=20)] == [u'C1']
@@ -0,0 +1,73 @@
+"""Unit tests for gips.extract."""
+
+import numpy as np
+from shapely.geometry import box
+
+from gips import extract
+
+
+class FakeBand(object):
+    def __init__(self, array, block_size, nodata):
+        self.array, self.block_size, self.nodata = array, block_size, nodata
+        self.reads = []
+
+    def GetDescription(self):
+        return 'red'
+
+    def GetBlockSize(self):
+        return self.block_size
+
+    def GetNoDataValue(self):
+        return self.nodata
+
+    def ReadAsArray(self, xoff, yoff, xsize, ysize):
+        self.reads.append((xoff, yoff, xsize, ysize))
+        return self.array[yoff:yoff + ysize, xoff:xoff + xsize]
+
+
+class FakeDataset(object):
+    RasterCount = 1
+
+    def __init__(self, band):
+        self.band = band
+        self.RasterYSize, self.RasterXSize = band.array.shape
+
+    def GetRasterBand(self, b):
+        return self.band
+
+    def GetGeoTransform(self):
+        return (1000.0, 10.0, 0.0, 2000.0, 0.0, -10.0)
+
+
+def t_world_to_pixel():
+    """Coordinates should map to the pixels holding them."""
+    cols, rows = extract.world_to_pixel((1000.0, 10.0, 0.0, 2000.0, 0.0, -10.0),
+                                        np.array([1000.0, 1055.0, 999.0]),
+                                        np.array([2000.0, 1901.0, 1995.0]))
+    assert cols.tolist() == [0, 5, -1] and rows.tolist() == [0, 9, 0]
+
+
+def t_sample_raster_reads_only_needed_blocks():
+    """Each block holding points should be read once, and no others."""
+    band = FakeBand(np.arange(100 * 90, dtype='int16').reshape(100, 90), (32, 32), 5)
+    ds = FakeDataset(band)
+    #            block (0, 0)   (0, 0)   (2, 3), clipped  outside   nodata
+    xs = np.array([1005.0,      1315.0,  1895.0,          2000.0,   1055.0])
+    ys = np.array([1995.0,      1795.0,  1005.0,          1995.0,   1995.0])
+    inside, names, values = extract.sample_raster(ds, xs, ys)
+    assert inside.tolist() == [0, 1, 2, 4] and names == ['red']
+    assert values[0, :3].tolist() == [0, 20 * 90 + 31, 99 * 90 + 89]
+    assert np.isnan(values[0, 3])
+    assert sorted(band.reads) == [(0, 0, 32, 32), (64, 96, 26, 4)]
+
+
+def t_points_by_tile(mocker):
+    """Points should be grouped by the tiles containing them."""
+    repo = mocker.Mock()
+    repo.tile_geometries.return_value = ('srs', {'a': box(0, 0, 10, 10),
+                                                 'b': box(8, 0, 20, 10),
+                                                 'c': box(50, 50, 60, 60)})
+    mocker.patch.object(extract, 'transform_points', side_effect=lambda x, y, s, d: (x, y))
+    groups = extract.points_by_tile(repo, np.array([1.0, 9.0, 15.0, 30.0]),
+                                    np.array([1.0, 5.0, 5.0, 5.0]), 'srs')
+    assert {t: g.tolist() for t, g in groups.items()} == {'a': [0, 1], 'b': [1, 2]}
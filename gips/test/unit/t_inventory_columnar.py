@@ -0,0 +1,83 @@
+"""Unit tests for gips.inventory.columnar."""
+
+import datetime
+
+from gips.inventory.columnar import InventoryTable, InventoryData
+
+A, P = InventoryTable.ASSET, InventoryTable.PRODUCT
+d1, d2, d3 = [datetime.date(2012, 12, d) for d in (1, 2, 3)]
+
+rows = [
+    (d2, 'h12v04', A, 'MOD', 'MOD09Q1', 'MOD09Q1.A2012337.h12v04.hdf', 12.5),
+    (d1, 'h12v04', A, 'MYD', 'MYD11A1', 'MYD11A1.A2012336.h12v04.hdf'),
+    (d1, 'h12v04', P, 'MYD', 'temp', 'h12v04_2012336_MYD_temp.tif'),
+    (d1, u'h13v05', A, 'MOD', 'MOD09Q1', 'MOD09Q1.A2012336.h13v05.hdf'),
+    (d3, 'h13v05', P, 'MCD', 'ndvi', 'h13v05_2012338_MCD_ndvi.tif'),
+]
+
+
+def t_table_views():
+    """dates, numfiles, and sensor_set should come straight from the columns."""
+    table = InventoryTable.from_rows(rows)
+    assert len(table) == 5
+    assert table.levels['tile'] == ['h12v04', 'h13v05']
+    assert table.dates == [d1, d2, d3]
+    assert table.numfiles == 4
+    assert table.sensor_set == ['MCD', 'MOD', 'MYD']
+    sub = table.select([d1, d3])
+    assert (sub.dates, sub.numfiles, len(sub)) == ([d1, d3], 3, 4)
+    assert sub.levels is table.levels
+
+
+def t_table_rows_and_drop():
+    """rows() should group a date's files by tile; drop() should remove tile-dates."""
+    table = InventoryTable.from_rows(rows)
+    assert table.rows(d1) == {
+        'h12v04': [(A, 'MYD', 'MYD11A1', 'MYD11A1.A2012336.h12v04.hdf', None),
+                   (P, 'MYD', 'temp', 'h12v04_2012336_MYD_temp.tif', None)],
+        'h13v05': [(A, 'MOD', 'MOD09Q1', 'MOD09Q1.A2012336.h13v05.hdf', None)],
+    }
+    assert table.rows(datetime.date(2000, 1, 1)) == {}
+    dropped = table.drop([(d1, 'h12v04'), (d3, 'h13v05')])
+    assert (dropped.dates, dropped.numfiles) == ([d1, d2], 2)
+    assert dropped.rows(d1).keys() == ['h13v05']
+    assert dropped.rows(d2) == {
+        'h12v04': [(A, 'MOD', 'MOD09Q1', 'MOD09Q1.A2012337.h12v04.hdf', 12.5)]}
+
+
+def t_inventory_data_lazy():
+    """Dates should be materialized only when accessed, and only once."""
+    calls = []
+    def materialize(date, by_tile):
+        calls.append(date)
+        return sorted(by_tile)
+    data = InventoryData(InventoryTable.from_rows(rows), materialize)
+    assert data.keys() == [d1, d2, d3] and len(data) == 3 and calls == []
+    assert data[d1] == ['h12v04', 'h13v05']
+    assert data[d1] is data[d1] and calls == [d1]
+    sub = data.subset([d1, d2])
+    assert sub.keys() == [d1, d2] and d3 not in sub
+    assert sub[d1] is data[d1] and calls == [d1]
+    del data[d2]
+    assert data.keys() == [d1, d3]
+
+
+class FakeTiles(object):
+    def __init__(self, tiles):
+        self.tiles = dict.fromkeys(tiles)
+
+
+def t_inventory_data_drop_keeps_tiles():
+    """drop() should keep Tiles already built, less the dropped tiles."""
+    calls = []
+    def materialize(date, by_tile):
+        calls.append(date)
+        return FakeTiles(by_tile)
+    seeded = FakeTiles(['h13v05'])
+    data = InventoryData(InventoryTable.from_rows(rows), materialize, {d3: seeded})
+    built = data[d1]
+    assert data[d3] is seeded and calls == [d1]
+    data.drop([(d1, 'h12v04'), (d3, 'h13v05')])
+    assert data.keys() == [d1, d2]
+    assert data[d1] is built and built.tiles.keys() == ['h13v05']
+    assert calls == [d1]
@@ -0,0 +1,74 @@
+"""Unit tests for gips.inventory.datacube."""
+
+import datetime
+from collections import OrderedDict
+
+import numpy as np
+import pytest
+
+pytest.importorskip('netCDF4')
+from gips.inventory import datacube
+
+dates = [datetime.date(2012, 12, d) for d in (1, 2, 5)]
+
+
+@pytest.fixture
+def cube(tmpdir):
+    """A 3-date, 10x12 datacube of a 1-band and a 2-band product."""
+    products = OrderedDict([('ndvi', [('ndvi', 'int16', -32768)]),
+                            ('ref', [('red', 'float32', -1.0), ('nir', 'float32', -1.0)])])
+    path = str(tmpdir.join(datacube.FILENAME))
+    cube = datacube.Datacube.create(path, dates, products, (10, 12),
+                                    (300000.0, 30.0, 0.0, 4500000.0, 0.0, -30.0),
+                                    chunks=(4, 4))
+    values = np.arange(3 * 10 * 12).reshape(3, 10, 12)
+    for y in (0, 4, 8):
+        rows = values[:, y:y + 4]
+        cube.write('ndvi', y, rows.astype('int16'))
+        cube.write('ref_red', y, rows.astype('float32'))
+        cube.write('ref_nir', y, -rows.astype('float32'))
+    cube.close()
+    return datacube.Datacube(path), values
+
+
+def t_datacube_layout(cube):
+    """Coordinates & chunking should be written so a chunk spans all dates."""
+    cube, _ = cube
+    assert cube.dates == dates
+    assert cube.shape == (10, 12)
+    assert cube.bands == {'ndvi': ['ndvi'], 'ref': ['ref_red', 'ref_nir']}
+    ds = cube.dataset
+    assert ds.variables['ref_red'].chunking() == [3, 4, 4]
+    assert ds.variables['ref_nir'].band_name == 'nir'
+    assert ds.variables['x'][0] == 300015.0 and ds.variables['y'][-1] == 4499715.0
+    assert ds.variables['time'][:].tolist() == [15675, 15676, 15679]
+
+
+def t_datacube_read(cube):
+    """read() should stack products' bands by date, with nodata as NaN."""
+    cube, values = cube
+    data = cube.read(['ndvi', 'ref'], chunk=(2, 3, 5, 4))
+    window = values[:, 3:7, 2:7]
+    assert data.dtype == np.float32 and data.shape == (9, 4, 5)
+    assert (data[:3] == window).all() and (data[6:] == -window).all()
+    data = cube.read(['ref'], dates=[dates[2], dates[0]], chunk=(0, 0, 2, 1))
+    assert (data[:2] == values[[2, 0], :1, :2]).all()
+    assert np.isnan(data[2:]).sum() == 1 # -1.0 is nodata for ref
+
+
+def t_datacube_is_current(tmpdir):
+    """A product should be current only while its files are as they were."""
+    fns = [str(tmpdir.join('{}_ndvi.tif'.format(d.strftime('%Y%j')))) for d in dates[:2]]
+    for fn in fns:
+        open(fn, 'w').write('data')
+    files = fns + [None]
+    path = str(tmpdir.join(datacube.FILENAME))
+    datacube.Datacube.create(
+        path, dates, OrderedDict([('ndvi', [('ndvi', 'int16', -32768)])]), (2, 2),
+        sources={'ndvi': [datacube.file_stamp(fn) for fn in files]}).close()
+    cube = datacube.Datacube(path)
+    assert cube.sources['ndvi'][2] is None
+    assert cube.is_current('ndvi', files)
+    assert not cube.is_current('ndvi', fns + [fns[0]])
+    open(fns[1], 'a').write('more')
+    assert not cube.is_current('ndvi', files)
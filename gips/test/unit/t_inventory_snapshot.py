@@ -0,0 +1,49 @@
+"""Unit tests for gips.inventory.snapshot."""
+
+import os
+
+import pytest
+
+from gips.inventory import snapshot
+
+
+class FakeData(object):
+    name = 'Fake'
+    version = '1.0.0'
+
+
+@pytest.fixture
+def cache(mocker, tmpdir):
+    """Send the snapshot cache to a temp dir & bypass the inventory DB."""
+    mocker.patch.object(snapshot.utils, 'cache_path', return_value=str(tmpdir))
+    mocker.patch.object(snapshot.orm, 'use_orm', return_value=False)
+    return tmpdir
+
+
+def t_snapshot_round_trip(cache):
+    """A saved snapshot should be loaded as long as its stamps match."""
+    watched = cache.join('watched')
+    watched.write('x')
+    stamps = snapshot.stamps([str(watched)], 'fake')
+    value = {('2012-01-01', 'h12v04'): {'a': ['a.hdf'], 'p': ['p.tif']}}
+    snapshot.save(FakeData, 'inventory', ('key',), value, stamps)
+    assert snapshot.load(FakeData, 'inventory', ('key',)) == value
+    assert snapshot.load(FakeData, 'inventory', ('other-key',)) is None
+
+
+def t_snapshot_stale(cache):
+    """A snapshot should not be used once anything it was derived from changes."""
+    watched = cache.join('watched')
+    watched.write('x')
+    stamps = snapshot.stamps([str(watched)])
+    snapshot.save(FakeData, 'inventory', ('key',), 'value', stamps)
+    os.utime(str(watched), (0, 0))
+    assert snapshot.load(FakeData, 'inventory', ('key',)) is None
+
+
+def t_snapshot_unreadable(cache):
+    """A corrupt snapshot file should be ignored rather than raising."""
+    snapshot.save(FakeData, 'inventory', ('key',), 'value', {})
+    [fn] = cache.listdir()
+    fn.write('not a pickle')
+    assert snapshot.load(FakeData, 'inventory', ('key',)) is None
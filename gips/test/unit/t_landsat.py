@@ -1,3 +1,4 @@
+import os
 import datetime
 import sys
 
@@ -131,17 +132,21 @@ def m_query_s3(mocker):
     mocker.patch.dict(landsat.os.environ, {
         'AWS_SECRET_ACCESS_KEY': 'fake-secret-key',
         'AWS_ACCESS_KEY_ID': 'fake-key-id'})
+    # don't reuse listings from other tests or runs
+    mocker.patch.object(landsat.landsatAsset, '_s3_listings', {})
+    mocker.patch.object(landsat.landsatAsset, '_s3_load_listing', return_value=None)
+    mocker.patch.object(landsat.landsatAsset, '_s3_save_listing')
+    mocker.patch.object(landsat.gips.data.core, 'settings', return_value=object())
     # have to mock around a local import
     m_boto3 = sys.modules['boto3'] = mocker.MagicMock()
-    m_s3 = m_boto3.resource.return_value
     flattened_keys = sample_c1s3_keys['_30m_tifs'] + [
         sample_c1s3_keys[k] for k in ('qa_tif', '_15m_tif', 'mtl_txt')]
-    filter_output = []
-    for key in flattened_keys:
-        mm = mocker.MagicMock()
-        mm.key = key
-        filter_output.append(mm)
-    m_s3.Bucket.return_value.objects.filter.return_value = filter_output
+    scene_prefix = os.path.dirname(flattened_keys[0]) + '/'
+    def paginate(Bucket, Prefix, Delimiter=None):
+        if Delimiter is not None:
+            return [{'CommonPrefixes': [{'Prefix': scene_prefix}]}]
+        return [{'Contents': [{'Key': k} for k in flattened_keys]}]
+    m_boto3.client.return_value.get_paginator.return_value.paginate = paginate
 
     return mocker.patch.object(landsat.requests, 'get')
 
@@ -178,3 +183,27 @@ def t_landsatAsset_query_service_s3(
     actual = landsat.landsatAsset.query_service(
             'C1S3', '027033', datetime.date(2017, 5, 6), pclouds)
     assert expected == actual
+
+@pytest.mark.parametrize('policy, products, expected', [
+    (None, ['ref-toa'], False),
+    (None, ['ndvi-toa', 'evi-toa', 'lswi-toa'], False), # one Indices pass
+    (None, ['ref-toa', 'ndvi-toa'], True),
+    (None, ['ref', 'dn', 'rad-toa', 'ndvi'], False),
+    ('auto', ['temp', 'tcap'], True),
+    ('disk', ['ref-toa'], True),
+    ('memory', ['ref-toa'], True),
+    ('recompute', ['ref-toa', 'temp', 'tcap', 'acca', 'ndvi-toa', 'evi-toa'], False),
+    ('bogus', ['ref-toa'], ValueError),
+])
+def t_landsatData_materialize_toa(mocker, policy, products, expected):
+    """Confirm the TOA intermediate is written only when it's worth it."""
+    from gips.core import RequestedProducts
+    repo_settings = {} if policy is None else {'toa-intermediate': policy}
+    m_settings = mocker.patch.object(landsat.gips.data.core, 'settings')
+    m_settings.return_value.REPOS = {'landsat': repo_settings}
+    groups = RequestedProducts(landsat.landsatData, products).groups()
+    if expected is ValueError:
+        with pytest.raises(ValueError):
+            landsat.landsatData()._materialize_toa(groups)
+    else:
+        assert expected == landsat.landsatData()._materialize_toa(groups)
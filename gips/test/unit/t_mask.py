@@ -0,0 +1,43 @@
+"""Unit tests for gips_mask's mask handling in gips.scripts.mask."""
+
+import numpy
+
+from gips.scripts import mask
+
+
+class FakeChunk(object):
+    def __init__(self, x0, y0, width, height):
+        self._rect = (x0, y0, width, height)
+    def x0(self): return self._rect[0]
+    def y0(self): return self._rect[1]
+    def width(self): return self._rect[2]
+    def height(self): return self._rect[3]
+
+
+class FakeBand(object):
+    def __init__(self, arr, nodata=255):
+        self.arr = arr
+        self.nodata = nodata
+    def NoDataValue(self):
+        return self.nodata
+    def Read(self, ch):
+        return self.arr[ch.y0():ch.y0() + ch.height(),
+                        ch.x0():ch.x0() + ch.width()]
+
+
+def t_packed_mask_combines_masks():
+    """Masks should AND together, honoring inversion and nodata."""
+    ysize, xsize = 5, 11 # xsize not a multiple of 8, to exercise packing
+    rs = numpy.random.RandomState(0)
+    m1 = rs.randint(0, 2, (ysize, xsize))
+    m1[0, 0] = 255 # nodata
+    m2 = rs.randint(0, 2, (ysize, xsize))
+    chunks = [FakeChunk(0, 0, xsize, 2), FakeChunk(0, 2, xsize, 3)]
+    pm = mask.PackedMask(xsize, ysize)
+    pm.add(FakeBand(m1), chunks=chunks)
+    pm.add(FakeBand(m2), inverted=True, chunks=chunks)
+
+    expected = (m1 != 0) & (m1 != 255) & (m2 != 1)
+    assert (pm.read(slice(None)) == expected).all()
+    assert (pm.read(slice(1, 4), slice(3, 9)) == expected[1:4, 3:9]).all()
+    assert pm.bits.nbytes == ysize * 2
@@ -0,0 +1,28 @@
+"""Unit tests for gips.parsers."""
+
+from collections import OrderedDict
+
+from gips import parsers
+
+
+def t_add_data_sources(mocker):
+    """Only the driver named on the command line should be imported."""
+    mocker.patch.object(parsers, 'data_sources', return_value=OrderedDict(
+        [('landsat', 'Landsat'), ('modis', 'MODIS')]))
+    m_check = mocker.patch.object(parsers.utils, 'check_repository')
+    m_idc = mocker.patch.object(parsers.utils, 'import_data_class')
+    mocker.patch.object(parsers, 'set_gippy_options')
+    parser = parsers.GIPSParser()
+    parser.add_inventory_parser()
+    args = parser.parse_args(args=['modis', '-v', '2', '-t', 'h12v04'])
+    assert (args.command, args.tiles, args.verbose) == ('modis', ['h12v04'], 2)
+    m_check.assert_called_once_with('modis')
+    m_idc.assert_called_once_with('modis')
+
+
+def t_profile(mocker):
+    """--profile should turn on tracing."""
+    m_enable = mocker.patch.object(parsers.trace, 'enable')
+    mocker.patch.object(parsers, 'set_gippy_options')
+    parsers.GIPSParser(datasources=False).parse_args(args=['--profile', 'trace.json'])
+    m_enable.assert_called_once_with('trace.json')
@@ -0,0 +1,131 @@
+"""Unit tests for temporal engines found in gips.temporal."""
+
+from datetime import date, timedelta
+
+import numpy
+
+from gips import temporal
+
+
+class CountingReader(object):
+    """Return a constant array per date, equal to its day of month."""
+    def __init__(self, missing=(), nodata_days=()):
+        self.calls = []
+        self.missing = missing
+        self.nodata_days = nodata_days
+
+    def __call__(self, d):
+        self.calls.append(d)
+        if d in self.missing:
+            return None
+        arr = numpy.full((2, 3), float(d.day))
+        if d in self.nodata_days:
+            arr[0, 0] = -9999
+        return arr
+
+
+def t_rolling_window_sum():
+    """Window sums should match a from-scratch sum over the window's dates."""
+    reader = CountingReader()
+    window = temporal.RollingWindow(3, reader)
+    for day in range(3, 10):
+        window.advance(date(2018, 1, day))
+        assert window.complete()
+        expected = sum(range(day - 2, day + 1))
+        assert (window.sum() == expected).all()
+        assert (window.mean() == expected / 3.0).all()
+
+
+def t_rolling_window_reads_each_day_once():
+    """Advancing day by day should read each day exactly once."""
+    reader = CountingReader()
+    window = temporal.RollingWindow(4, reader)
+    dates = [date(2018, 1, 10) + timedelta(days=i) for i in range(20)]
+    [window.advance(d) for d in dates]
+    assert len(reader.calls) == len(set(reader.calls)) == 23
+
+
+def t_rolling_window_reset():
+    """Going backwards or skipping past the window should start over."""
+    reader = CountingReader()
+    window = temporal.RollingWindow(2, reader)
+    window.advance(date(2018, 1, 10))
+    window.advance(date(2018, 1, 5))
+    assert window.dates == [date(2018, 1, 4), date(2018, 1, 5)]
+    assert (window.sum() == 9).all()
+    window.advance(date(2018, 1, 20))
+    assert window.dates == [date(2018, 1, 19), date(2018, 1, 20)]
+    assert (window.sum() == 39).all()
+
+
+def t_rolling_window_missing_and_nodata():
+    """Missing days count against completeness; nodata pixels propagate."""
+    reader = CountingReader(missing=(date(2018, 1, 2),),
+                            nodata_days=(date(2018, 1, 4),))
+    window = temporal.RollingWindow(3, reader)
+    window.advance(date(2018, 1, 3))
+    assert not window.complete() and window.count == 2
+    window.min_count = 2
+    assert window.complete()
+    assert (window.sum() == 4).all()
+    window.advance(date(2018, 1, 5))
+    out = window.sum()
+    assert out[0, 0] == -9999
+    assert out[1, 1] == 12
+    # nodata day leaves the window, so the pixel recovers
+    window.advance(date(2018, 1, 7))
+    assert (window.sum() == 18).all()
+
+
+def t_rolling_window_rereads_changed_days():
+    """Days whose stamps change should be read again."""
+    reader = CountingReader(missing=(date(2018, 1, 3),))
+    stamps = {}
+    window = temporal.RollingWindow(3, reader, min_count=2,
+                                    stamp=lambda d: stamps.get(d))
+    window.advance(date(2018, 1, 3))
+    assert window.dates == [date(2018, 1, 1), date(2018, 1, 2)]
+    # the missing day turns up, and another day's asset is replaced
+    reader.missing = ()
+    stamps[date(2018, 1, 2)] = stamps[date(2018, 1, 3)] = 'new'
+    del reader.calls[:]
+    window.advance(date(2018, 1, 4))
+    assert sorted(reader.calls) == [date(2018, 1, d) for d in (2, 3, 4)]
+    assert window.dates == [date(2018, 1, d) for d in (2, 3, 4)]
+    assert (window.sum() == 9).all()
+
+
+def t_streaming_stats_matches_numpy():
+    """Streaming stats should match numpy's over the stack, honoring nodata."""
+    rs = numpy.random.RandomState(0)
+    stack = rs.uniform(0, 10, (12, 4, 5))
+    valid = rs.uniform(size=stack.shape) > 0.2
+    valid[:, 0, 0] = False # a pixel that is never valid
+    stats = temporal.StreamingStats()
+    [stats.update(a, v) for a, v in zip(stack, valid)]
+
+    masked = numpy.ma.masked_array(stack, ~valid)
+    mean, variance, count, vmin, vmax = stats.bands(-32768)
+    assert numpy.allclose(mean[1:, 1:], masked.mean(axis=0)[1:, 1:])
+    assert numpy.allclose(variance[1:, 1:], masked.var(axis=0)[1:, 1:])
+    assert (count[1:, 1:] == valid.sum(axis=0)[1:, 1:]).all()
+    assert numpy.allclose(vmin[1:, 1:], masked.min(axis=0)[1:, 1:])
+    assert numpy.allclose(vmax[1:, 1:], masked.max(axis=0)[1:, 1:])
+    assert mean[0, 0] == count[0, 0] == -32768
+
+
+def t_streaming_stats_incremental_update():
+    """Restoring saved state then adding dates should equal one long pass."""
+    rs = numpy.random.RandomState(1)
+    stack = rs.uniform(0, 1, (10, 3, 3))
+    full = temporal.StreamingStats()
+    [full.update(a) for a in stack]
+
+    first = temporal.StreamingStats()
+    [first.update(a) for a in stack[:6]]
+    saved = [b.astype('float32') for b in first.bands(-32768)]
+    resumed = temporal.StreamingStats.from_bands(saved, -32768)
+    [resumed.update(a) for a in stack[6:]]
+
+    for expected, actual in zip(full.bands(-32768), resumed.bands(-32768)):
+        assert numpy.allclose(expected, actual, atol=1e-6)
@@ -0,0 +1,61 @@
+"""Unit tests for gips.trace."""
+
+import json
+import datetime
+
+import pytest
+
+from gips import trace
+
+
+@pytest.fixture
+def tracing(tmpdir):
+    """Yield a function that enables tracing to a file in tmpdir."""
+    def enable(fn):
+        path = str(tmpdir.join(fn))
+        trace.enable(path)
+        return path
+    yield enable
+    trace.disable()
+
+@trace.traced('work', kind='test')
+def work(n):
+    trace.annotate(n=n)
+    return n * 2
+
+def t_trace_disabled():
+    """With tracing off, spans should be a shared do-nothing object."""
+    assert not trace.enabled()
+    assert trace.span('a', tile='h12v04') is trace.span('b')
+    assert work(2) == 4
+
+def t_trace_chrome(tracing):
+    """Spans should be written as Chrome trace events, nested in time."""
+    path = tracing('trace.json')
+    with trace.span('process', tile='h12v04', date=datetime.date(2012, 12, 1)):
+        assert work(3) == 6
+        trace.event('halfway')
+    trace.disable()
+    with open(path) as f:
+        events = {e['name']: e for e in json.load(f)['traceEvents']}
+    process, inner = events['process'], events['work']
+    assert process['args'] == {'tile': 'h12v04', 'date': '2012-12-01'}
+    assert inner['args'] == {'kind': 'test', 'n': 3}
+    assert process['ph'] == inner['ph'] == 'X' and events['halfway']['ph'] == 'i'
+    assert process['ts'] <= inner['ts']
+    assert inner['ts'] + inner['dur'] <= process['ts'] + process['dur']
+    assert len(events) == 4 # the three above, plus one for the whole script
+
+def t_trace_jsonl(tracing):
+    """Spans should be written as JSON lines, with errors noted."""
+    path = tracing('trace.jsonl')
+    with pytest.raises(ValueError):
+        with trace.span('outer'):
+            with trace.span('inner', product='ndvi'):
+                raise ValueError()
+    trace.disable()
+    with open(path) as f:
+        spans = [json.loads(l) for l in f]
+    assert [(s['name'], s['depth']) for s in spans] == [('inner', 2), ('outer', 1),
+                                                       (spans[2]['name'], 0)]
+    assert spans[0]['attrs'] == {'product': 'ndvi', 'error': 'ValueError'}
@@ -1,8 +1,12 @@
 """Unit tests for code found in gips.utils."""
 
+import os
 import sys
+import fcntl
 import datetime
+import multiprocessing
 
+import numpy as np
 import pytest
 
 from gips import utils
@@ -23,6 +27,31 @@ def t_remove_files(mocker):
     assert m_os_remove.call_count == 6
 
 
+def t_file_lock(tmpdir):
+    """file_lock should be reentrant, and exclude other processes until released."""
+    path = str(tmpdir.join('locks', 'x.lock'))
+    def try_lock(results):
+        # any close of the file in the holding process would drop its lock, so
+        # the lock's contents are checked from here instead
+        fd = os.open(path, os.O_RDWR)
+        try:
+            fcntl.lockf(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            results.put((True, None))
+        except IOError:
+            results.put((False, os.read(fd, 256)))
+        finally:
+            os.close(fd)
+    results = multiprocessing.Queue()
+    with utils.file_lock(path):
+        with utils.file_lock(path):
+            pass
+        multiprocessing.Process(target=try_lock, args=(results,)).start()
+        locked, holder = results.get(timeout=10)
+        assert not locked and holder.endswith(':{}\n'.format(os.getpid()))
+    multiprocessing.Process(target=try_lock, args=(results,)).start()
+    assert results.get(timeout=10) == (True, None)
+
+
 def t_remove_files_no_ext(mocker):
     """remove_files should work correctly when `extensions` is defaulted."""
     filenames = ['a.hdf', 'b.hdf']
@@ -171,6 +200,64 @@ def t_gips_script_setup(mocker, driver_string, stop_on_error, setup_orm):
             m_gips_inv.orm.setup.call_count == {False: 0, True: 1}[setup_orm])
 
 
+@pytest.fixture
+def driver_settings(mocker, tmpdir):
+    """Settings for the modis & landsat drivers, with the cache in a temp dir."""
+    m_settings = mocker.patch.object(utils, 'settings')
+    m_settings.return_value.REPOS = {'modis': {'repository': str(tmpdir)},
+                                     'landsat': {'repository': str(tmpdir)}}
+    mocker.patch.object(utils, 'cache_path', return_value=str(tmpdir))
+    return m_settings
+
+def t_data_sources(mocker, driver_settings):
+    """Descriptions should be read without importing drivers, then cached."""
+    m_irc = mocker.patch.object(utils, 'import_repository_class')
+    expected = {'landsat': 'Landsat 5 (TM), 7 (ETM+), 8 (OLI)',
+                'modis': 'NASA Moderate Resolution Imaging Spectroradiometer (MODIS)'}
+    assert utils.data_sources() == expected
+    m_parse = mocker.patch.object(utils, '_parse_description')
+    assert utils.data_sources() == expected
+    m_irc.assert_not_called()
+    m_parse.assert_not_called()
+
+
+def t_rastermask_footprint(mocker, tmpdir):
+    """Footprints should be made once per version of the mask, in the cache."""
+    cache = tmpdir.mkdir('cache')
+    mocker.patch.object(utils, 'cache_path', return_value=str(cache))
+    m_polygonize = mocker.patch.object(utils, 'polygonize_footprint',
+                                       side_effect=lambda img, vec: open(vec, 'w').close())
+    mask = tmpdir.join('mask.tif')
+    mask.write('pixels')
+    path = utils.rastermask_footprint(str(mask))
+    assert os.path.basename(path) == 'mask.shp' and path.startswith(str(cache))
+    assert os.path.exists(path)
+    assert utils.rastermask_footprint(str(mask)) == path
+    assert m_polygonize.call_count == 1
+    mask.write('new pixels')
+    assert utils.rastermask_footprint(str(mask)) != path
+    assert m_polygonize.call_count == 2
+    assert sorted(os.listdir(str(cache))) == sorted(
+        os.path.basename(os.path.dirname(p)) for p in
+        [path, utils.rastermask_footprint(str(mask))])
+
+
+def t_output_profile(driver_settings):
+    """Profiles should layer global, driver, & product settings over defaults."""
+    assert utils.output_profile('Modis', 'ndvi') is None
+    driver_settings.return_value.OUTPUT_PROFILE = {'compress': 'zstd'}
+    driver_settings.return_value.REPOS['landsat']['output-profile'] = {
+        'overviews': 'auto', 'products': {'ref': {'cog': True}}}
+    profile = utils.output_profile('Landsat', 'ref-toa')
+    assert profile == dict(utils._output_profile_defaults, compress='ZSTD',
+                           overviews='auto', cog=True)
+    assert not utils.output_profile('Landsat', 'ndvi-toa')['cog']
+    assert utils.output_profile('Modis', 'ndvi')['overviews'] is None
+    driver_settings.return_value.OUTPUT_PROFILE = {'blocksize': 500}
+    with pytest.raises(ValueError):
+        utils.output_profile()
+
+
 def t_lib_error_handler_base_case(mocker):
     """Test error handler for GIPS' library mode:  non-entry into except."""
     m_report_error = mocker.patch.object(utils, 'report_error')
@@ -251,3 +338,47 @@ def t_cli_error_handler_continuable_case(mocker):
 def t_prune_unhashable(mocker, input, expected):
     actual = utils.prune_unhashable(input)
     assert expected == actual
+
+
+class FakeBand(object):
+    """Just enough of a gippy GeoRaster for process_images; chunks are row ranges."""
+    def __init__(self, data, nodata, reads=None):
+        self.data, self.nodata, self.reads = data, nodata, reads
+
+    def NoDataValue(self):
+        return self.nodata
+
+    def Read(self, chunk):
+        self.reads.append(chunk)
+        return self.data[chunk[0]:chunk[1]].copy()
+
+    def Write(self, arr, chunk):
+        self.data[chunk[0]:chunk[1]] = arr
+
+
+class FakeImage(list):
+    def NumBands(self):
+        return len(self)
+
+    def XSize(self):
+        return self[0].data.shape[1]
+
+    def YSize(self):
+        return self[0].data.shape[0]
+
+    def Chunks(self):
+        return [(0, 2), (2, 4)]
+
+
+def t_process_images():
+    """process_images should write all images chunk by chunk, mapping nodata."""
+    reads = []
+    src = FakeImage(FakeBand(np.arange(8.0).reshape(4, 2) + b, 0.0, reads)
+                    for b in range(2))
+    outs = [FakeImage(FakeBand(np.zeros((4, 2)), nd) for b in range(2))
+            for nd in (0.0, -32768.0)]
+    utils.process_images([(src, outs[0]), (src, outs[1])])
+    assert reads == [(0, 2)] * 4 + [(2, 4)] * 4
+    assert (outs[0][1].data == src[1].data).all()
+    assert outs[1][0].data[0, 0] == -32768.0
+    assert (outs[1][0].data.flat[1:] == src[0].data.flat[1:]).all()
@@ -0,0 +1,99 @@
+"""Unit tests for gips.workqueue."""
+
+import os
+import time
+import datetime
+import multiprocessing
+
+from gips import workqueue
+from gips.workqueue import WorkQueue
+
+
+def units(n):
+    return [('h{:02d}v05'.format(i), datetime.date(2018, 1, 1)) for i in range(n)]
+
+
+def t_enqueue_is_idempotent(tmpdir):
+    queue = WorkQueue(str(tmpdir.join('queue.db')))
+    assert queue.enqueue('modis', units(3), ['ndvi', 'lst']) == 3
+    assert queue.enqueue('modis', units(4), ['lst', 'ndvi']) == 1
+    assert queue.status()['counts'][workqueue.PENDING] == 4
+    unit = queue.claim('w1')
+    assert (unit['tile'], unit['date'], unit['products']) == (
+        'h00v05', datetime.date(2018, 1, 1), ['lst', 'ndvi'])
+
+
+def t_failures_are_retried_with_backoff(tmpdir):
+    queue = WorkQueue(str(tmpdir.join('queue.db')), max_attempts=2, retry_delay=1000)
+    queue.enqueue('modis', units(1), ['ndvi'])
+    unit = queue.claim('w1')
+    queue.fail(unit, 'boom')
+    assert queue.claim('w1') is None                # still backing off
+    assert queue.outstanding() == 1
+    queue.retry_delay = 0
+    queue.fail(unit, 'boom')                        # w1 no longer holds it
+    assert queue.status()['counts'][workqueue.PENDING] == 1
+
+    queue = WorkQueue(queue.path, max_attempts=2, retry_delay=0)
+    queue.enqueue('modis', units(2)[1:], ['ndvi'])
+    unit = queue.claim('w1')
+    queue.fail(unit, 'boom')
+    unit = queue.claim('w2')
+    assert unit['attempts'] == 2
+    queue.fail(unit, 'boom again')
+    status = queue.status()
+    assert status['counts'][workqueue.FAILED] == 1
+    assert status['failures'][0]['error'] == 'boom again'
+
+
+def t_stale_units_are_reclaimed(tmpdir):
+    queue = WorkQueue(str(tmpdir.join('queue.db')), retry_delay=0)
+    queue.enqueue('modis', units(1), ['ndvi'])
+    lost = queue.claim('w1', lease=0.1)
+    assert queue.claim('w2', lease=60) is None
+    time.sleep(0.2)
+    unit = queue.claim('w2', lease=0.1)
+    assert (unit['id'], unit['attempts']) == (lost['id'], 2)
+    assert not queue.heartbeat(lost)
+    queue.complete(lost)                            # too late; w2 has it now
+    assert queue.status()['counts'][workqueue.RUNNING] == 1
+    queue.complete(unit)
+    assert queue.status()['counts'][workqueue.DONE] == 1
+
+
+def fake_process(log):
+    """Log each unit processed, failing on the first try at every third."""
+    def process(unit):
+        with open(log, 'a') as f:
+            f.write('{} {} {}\n'.format(unit['id'], unit['attempts'], unit['worker']))
+        if unit['id'] % 3 == 0 and unit['attempts'] == 1:
+            raise RuntimeError('transient failure')
+        time.sleep(0.01)
+    return process
+
+
+def t_workers_share_the_queue(tmpdir):
+    """Run a few worker processes on one queue; each unit should be done once."""
+    path, log = str(tmpdir.join('queue.db')), str(tmpdir.join('log'))
+    WorkQueue(path).enqueue('modis', units(30), ['ndvi'])
+
+    def run(name):
+        queue = WorkQueue(path, max_attempts=3, retry_delay=0.05)
+        workqueue.work(queue, worker=name, poll=0.05, process=fake_process(log))
+
+    workers = [multiprocessing.Process(target=run, args=('w{}'.format(i),))
+               for i in range(4)]
+    [w.start() for w in workers]
+    [w.join(60) for w in workers]
+    assert [w.exitcode for w in workers] == [0] * 4
+
+    with open(log) as f:
+        attempts = [line.split() for line in f]
+    succeeded = sorted(int(i) for i, n, _ in attempts
+                       if int(i) % 3 != 0 or n == '2')
+    assert succeeded == range(1, 31)
+    assert len(attempts) == 40
+    assert len(set(w for _, _, w in attempts)) > 1
+    status = WorkQueue(path).status()
+    assert status['counts'][workqueue.DONE] == 30
+    assert status['rate'] > 0
@@ -0,0 +1,57 @@
+"""Unit tests for gips.zonal."""
+
+from collections import OrderedDict
+
+import numpy as np
+from shapely.geometry import box
+
+from gips import zonal
+
+
+def t_partition():
+    """Overlapping shapes should be split up; touching ones needn't be."""
+    shapes = [box(0, 0, 2, 2), box(2, 0, 4, 2), box(1, 1, 3, 3), box(5, 5, 6, 6),
+              box(1.5, 1.5, 2.5, 2.5)]
+    assert zonal.partition(shapes) == [[0, 1, 3], [2], [4]]
+
+
+def t_zonal_stats_accumulate():
+    """Stats should be reduced by label and accumulate across calls."""
+    stats = zonal.ZonalStats(3, percentiles=[50])
+    key = ('2012-12-01', 'ndvi', 'ndvi')
+    stats.add(key, np.array([1, 3, 1, 1]), np.array([1.0, 10.0, 3.0, 2.0]))
+    stats.add(key, np.array([3, 1]), np.array([20.0, 6.0]))
+    stats.add(key, np.array([], dtype=int), np.array([]))
+    rows = stats.rows(['a', 'b', 'c'])
+    assert [r[:5] for r in rows] == [('a',) + key + (4,), ('c',) + key + (2,)]
+    a, c = rows
+    assert a[5:] == (3.0, np.std([1, 3, 2, 6]), 1.0, 6.0, 2.5)
+    assert c[5:] == (15.0, 5.0, 10.0, 20.0, 15.0)
+
+
+def t_features_by_tile():
+    """Where tiles overlap, each part of a feature should go to one tile."""
+    class Repository(object):
+        @classmethod
+        def tile_geometries(cls):
+            return '', OrderedDict([('a', box(0, 0, 10, 10)), ('b', box(8, 0, 18, 10)),
+                                    ('c', box(20, 0, 30, 10))])
+    shapes = [box(1, 1, 3, 3), box(7, 1, 12, 3), box(12, 1, 14, 3), box(9, 5, 9.5, 6)]
+    groups = zonal.features_by_tile(Repository, shapes)
+    assert sorted(groups) == ['a', 'b']
+    assert groups['a'][0].tolist() == [0, 1, 3]
+    assert groups['b'][0].tolist() == [1, 2]
+    assert groups['a'][1][1].equals(box(7, 1, 10, 3))
+    assert groups['b'][1][0].equals(box(10, 1, 12, 3))
+    assert sum(s.area for _, g in groups.values() for s in g) == 18.5
+    # without 'a', 'b' takes all that's in it
+    groups = zonal.features_by_tile(Repository, shapes, tiles=['b', 'c'])
+    assert groups['b'][0].tolist() == [1, 2, 3]
+
+
+def t_grid_window():
+    """Windows should cover bounds, clipped to the grid."""
+    gt = (100.0, 10.0, 0.0, 500.0, 0.0, -10.0)
+    assert zonal.grid_window((115, 455, 141, 481), gt, 20, 20) == (1, 1, 4, 4)
+    assert zonal.grid_window((50, 300, 150, 495), gt, 20, 20) == (0, 0, 5, 20)
+    assert zonal.grid_window((400, 0, 500, 100), gt, 20, 20)[2:] == (0, 0)
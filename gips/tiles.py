@@ -31,6 +31,7 @@ import gippy
 from gippy.algorithms import CookieCutter
 from gips.utils import VerboseOut, Colors, mosaic, gridded_mosaic, mkdir
 from gips import utils
+from gips import trace
 
 
 class Tiles(object):
@@ -71,7 +72,10 @@ class Tiles(object):
 
     def process(self, *args, **kwargs):
         """ Calls process for each tile """
-        [t.process(*args, products=self.products.products, **kwargs) for t in self.tiles.values()]
+        for tile, data in self.tiles.items():
+            with trace.span('process', tile=tile, date=self.date,
+                            products=' '.join(self.products.products)), data.lock():
+                data.process(*args, products=self.products.products, **kwargs)
 
     def mosaic(self, datadir, res=None, interpolation=0, crop=False,
                overwrite=False, alltouch=False):
@@ -97,6 +101,8 @@ class Tiles(object):
                 err_msg = ("Error mosaicking " + final_fp + ". Did you forget"
                            " to specify a resolution (`--res x x`)?")
                 with utils.error_handler(err_msg, continuable=True), \
+                        trace.span('mosaic', date=self.date, sensor=sensor,
+                                   product=product, tiles=len(self.tiles)), \
                         utils.make_temp_dir(dir=datadir,
                                             prefix='mosaic') as tmp_dir:
                     tmp_fp = os.path.join(tmp_dir, fn) # for safety
@@ -115,6 +121,8 @@ class Tiles(object):
                         )
                     else:
                         mosaic(images, tmp_fp, self.spatial.site)
+                    utils.apply_output_profile(tmp_fp, utils.output_profile(
+                        self.dataclass.name, product))
                     os.rename(tmp_fp, final_fp)
         t = datetime.now() - start
         VerboseOut('%s: created project files for %s tiles in %s' % (self.date, len(self.tiles), t), 2)
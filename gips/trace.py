@@ -0,0 +1,205 @@
+#!/usr/bin/env python
+################################################################################
+#    GIPS: Geospatial Image Processing System
+#
+#    AUTHOR: Matthew Hanson
+#    EMAIL:  matt.a.hanson@gmail.com
+#
+#    Copyright (C) 2014-2018 Applied Geosolutions
+#
+#    This program is free software; you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation; either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program. If not, see <http://www.gnu.org/licenses/>
+################################################################################
+
+"""Tracing of where GIPS spends its time.
+
+Wrap work in spans, which may nest and carry attributes such as tile, date,
+and product:
+
+    with trace.span('process', tile=tile, date=date, product=product):
+        ...
+
+Tracing is off unless enable() is called (see --profile), in which case span()
+returns a shared do-nothing object.  When on, each span is recorded with its
+start time, duration, thread, and attributes.  A trace file ending in .jsonl
+gets one JSON object per span as spans finish; otherwise it's written in the
+Chrome trace event format when the process exits, for viewing in
+chrome://tracing or similar tools.
+"""
+
+import os
+import sys
+import json
+import time
+import atexit
+import functools
+import threading
+
+_tracer = None
+
+
+class _NullSpan(object):
+    """Stand-in for a span when tracing is off."""
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def set(self, **attrs):
+        pass
+
+_null_span = _NullSpan()
+
+
+class Span(object):
+    """A timed region of work; use as a context manager."""
+    def __init__(self, tracer, name, attrs):
+        self.tracer = tracer
+        self.name = name
+        self.attrs = attrs
+
+    def set(self, **attrs):
+        """Add attributes to the span, eg once a result is known."""
+        self.attrs.update(attrs)
+
+    def __enter__(self):
+        stack = self.tracer.stack()
+        self.depth = len(stack)
+        stack.append(self)
+        self.start = time.time()
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        duration = time.time() - self.start
+        self.tracer.stack().pop()
+        if exc_type is not None:
+            self.attrs['error'] = exc_type.__name__
+        self.tracer.record(self.name, self.start, duration, self.depth, self.attrs)
+        return False
+
+
+class Tracer(object):
+    """Collects spans & events and writes them to a file."""
+    def __init__(self, filename):
+        self.filename = filename
+        self.jsonl = filename.endswith('.jsonl')
+        self.pid = os.getpid()
+        self.events = []
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        if self.jsonl:
+            self._file = open(filename, 'w')
+
+    def stack(self):
+        """Return the open spans of the calling thread."""
+        try:
+            return self._local.stack
+        except AttributeError:
+            self._local.stack = []
+            return self._local.stack
+
+    def record(self, name, start, duration, depth, attrs, instant=False):
+        tid = threading.current_thread().ident
+        if self.jsonl:
+            line = json.dumps({'name': name, 'start': start, 'duration': duration,
+                               'depth': depth, 'thread': tid, 'attrs': attrs},
+                              default=str)
+            with self._lock:
+                self._file.write(line + '\n')
+                self._file.flush()
+            return
+        event = {'name': name, 'cat': 'gips', 'pid': self.pid, 'tid': tid,
+                 'ts': int(start * 1e6), 'args': attrs}
+        if instant:
+            event.update(ph='i', s='t')
+        else:
+            event.update(ph='X', dur=int(duration * 1e6))
+        with self._lock:
+            self.events.append(event)
+
+    def close(self):
+        """Finish the trace file."""
+        if self.jsonl:
+            self._file.close()
+            return
+        with open(self.filename, 'w') as f:
+            json.dump({'traceEvents': self.events, 'displayTimeUnit': 'ms'},
+                      f, default=str)
+
+
+def enabled():
+    """Return True if spans are being recorded by this process."""
+    # forked child processes don't record, so as not to garble the file
+    return _tracer is not None and _tracer.pid == os.getpid()
+
+
+def span(name, **attrs):
+    """Return a context manager that records the work done within it."""
+    if _tracer is None or not enabled():
+        return _null_span
+    return Span(_tracer, name, attrs)
+
+
+def annotate(**attrs):
+    """Add attributes to the calling thread's innermost open span."""
+    if _tracer is None or not enabled():
+        return
+    stack = _tracer.stack()
+    if stack:
+        stack[-1].set(**attrs)
+
+
+def traced(name, **attrs):
+    """Decorate a function so that each call is recorded as a span."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if _tracer is None:
+                return func(*args, **kwargs)
+            with span(name, **dict(attrs)):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def event(name, **attrs):
+    """Record a moment, eg a progress message, in the trace."""
+    if _tracer is None or not enabled():
+        return
+    _tracer.record(name, time.time(), 0, len(_tracer.stack()), attrs, instant=True)
+
+
+def enable(filename):
+    """Start recording spans to filename, until disable() or exit.
+
+    Everything until then is recorded within a span named for the script.
+    """
+    global _tracer
+    disable()
+    _tracer = Tracer(filename)
+    _tracer.root = span(os.path.basename(sys.argv[0]), argv=' '.join(sys.argv[1:]))
+    _tracer.root.__enter__()
+
+
+def disable():
+    """Stop recording spans, and write out any that were recorded."""
+    global _tracer
+    tracer, _tracer = _tracer, None
+    if tracer is None or tracer.pid != os.getpid():
+        return
+    root = tracer.root
+    tracer.record(root.name, root.start, time.time() - root.start, 0, root.attrs)
+    tracer.close()
+
+atexit.register(disable)
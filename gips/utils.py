@@ -27,6 +27,9 @@ import sys
 import os
 import re
 import errno
+import fcntl
+import socket
+import threading
 from contextlib import contextmanager
 import tempfile
 import commands
@@ -35,9 +38,12 @@ import traceback
 import datetime
 import time
 import json
+import hashlib
+from collections import OrderedDict
 
 import numpy as np
 import requests
+from osgeo import gdal, ogr, osr
 
 import gippy
 from gippy import GeoVector
@@ -221,6 +227,54 @@ def find_files(regex, path='.'):
     return ret
 
 
+_file_locks = {}    # lock file path: [RLock, fd, depth]; see file_lock
+_file_locks_lock = threading.Lock()
+
+@contextmanager
+def file_lock(path):
+    """Hold an exclusive advisory lock on the named file, creating it if need be.
+
+    Uses POSIX record locks (fcntl.lockf), which work across nodes on
+    filesystems that support them (NFS included), and which the OS drops
+    when the holding process dies, so a crashed process can't leave a
+    stale lock behind.  The holder's host & PID are written to the file
+    for reporting.  Locks are reentrant within a thread; other threads of
+    the process wait their turn like other processes.  Don't otherwise open
+    the lock file while it's held; closing any descriptor of it drops the lock.
+    """
+    path = os.path.abspath(path)
+    with _file_locks_lock:
+        lock = _file_locks.setdefault(path, [threading.RLock(), None, 0])
+    with lock[0]:
+        if lock[2] == 0:
+            mkdir(os.path.dirname(path))
+            fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o666)
+            try:
+                try:
+                    fcntl.lockf(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except IOError as e:
+                    if e.errno not in (errno.EACCES, errno.EAGAIN):
+                        raise
+                    verbose_out('Waiting for {}, held by {}'.format(
+                        path, os.read(fd, 256).strip() or 'unknown'), 2)
+                    fcntl.lockf(fd, fcntl.LOCK_EX)
+                os.ftruncate(fd, 0)
+                os.lseek(fd, 0, os.SEEK_SET)
+                os.write(fd, '{}:{}\n'.format(socket.gethostname(), os.getpid()))
+            except:
+                os.close(fd)
+                raise
+            lock[1] = fd
+        lock[2] += 1
+        try:
+            yield
+        finally:
+            lock[2] -= 1
+            if lock[2] == 0:
+                os.close(lock[1]) # closing the file releases the lock
+                lock[1] = None
+
+
 ##############################################################################
 # Settings functions
 ##############################################################################
@@ -239,6 +293,18 @@ def settings():
         return gips.settings
 
 
+def cache_path(*subdirs):
+    """Return (creating if needed) a directory in GIPS' on-disk cache.
+
+    The cache lives in settings().CACHE_DIR, defaulting to ~/.gips/cache.
+    Point it at shared storage to share cached data between users & nodes.
+    """
+    cache_dir = getattr(settings(), 'CACHE_DIR', None)
+    if cache_dir is None:
+        cache_dir = os.path.expanduser('~/.gips/cache')
+    return mkdir(os.path.join(cache_dir, *subdirs))
+
+
 def create_environment_settings(repos_path, email=''):
     """ Create settings file and data directory """
     from gips.settings_template import __file__ as src
@@ -282,23 +348,80 @@ def create_repos():
             mkdir(os.path.join(repos[key]['repository'], d))
 
 def data_sources():
-    """ Get enabled data sources (and verify) from settings """
-    sources = {}
-    repos = settings().REPOS
-    for key in sorted(repos.keys()):
-        if not os.path.isdir(repos[key]['repository']):
-            raise Exception('ERROR: archive %s is not a directory or is not available' % key)
-        repo = import_repository_class(key)
-        sources[key] = repo.description
-    return sources
+    """Get enabled data sources from settings, with their descriptions.
 
+    Drivers aren't imported to do this; see driver_description.
+    """
+    return OrderedDict((key, driver_description(key))
+                       for key in sorted(settings().REPOS.keys()))
 
-def import_data_module(clsname):
-    """ Import a data driver by name and return as module """
-    import imp
+
+def check_repository(key):
+    """Raise an exception if the driver's repository directory is missing."""
+    if not os.path.isdir(settings().REPOS[key]['repository']):
+        raise Exception('ERROR: archive %s is not a directory or is not available' % key)
+
+
+def driver_path(clsname):
+    """Return the directory holding the given driver's module."""
     path = settings().REPOS[clsname].get('driver', '')
     if path == '':
         path = os.path.join( os.path.dirname(__file__), 'data', clsname)
+    return path
+
+
+def driver_description(clsname):
+    """Return the driver's description without importing the driver.
+
+    It's read from the driver's source, and cached in CACHE_DIR until the
+    source changes.  Drivers whose description isn't a string literal are
+    imported as a last resort.
+    """
+    source = os.path.join(driver_path(clsname), clsname + '.py')
+    try:
+        stamp = os.stat(source).st_mtime
+    except OSError:
+        return import_repository_class(clsname).description
+    cache_fn = os.path.join(cache_path('drivers'), 'descriptions.json')
+    try:
+        with open(cache_fn) as f:
+            cached = json.load(f)
+    except (IOError, ValueError):
+        cached = {}
+    entry = cached.get(clsname)
+    if entry is not None and entry[:2] == [source, stamp]:
+        return str(entry[2])
+    description = _parse_description(clsname, source)
+    if description is None:
+        description = import_repository_class(clsname).description
+    cached[clsname] = [source, stamp, description]
+    temp_fn = '{}.{}.tmp'.format(cache_fn, os.getpid())
+    with open(temp_fn, 'w') as f:
+        json.dump(cached, f)
+    os.rename(temp_fn, cache_fn)
+    return description
+
+
+def _parse_description(clsname, source):
+    """Return clsnameRepository.description if it's a literal in source."""
+    import ast
+    with open(source) as f:
+        tree = ast.parse(f.read(), source)
+    for node in tree.body:
+        if not (isinstance(node, ast.ClassDef) and node.name == clsname + 'Repository'):
+            continue
+        for stmt in node.body:
+            if (isinstance(stmt, ast.Assign) and isinstance(stmt.value, ast.Str)
+                    and any(getattr(t, 'id', None) == 'description'
+                            for t in stmt.targets)):
+                return stmt.value.s
+    return None
+
+
+def import_data_module(clsname):
+    """ Import a data driver by name and return as module """
+    import imp
+    path = driver_path(clsname)
     with error_handler('Error loading driver ' + clsname):
         fmtup = imp.find_module(clsname, [path])
         mod = imp.load_module(clsname, *fmtup)
@@ -457,6 +580,235 @@ def vectorize(img, vector, oformat=None):
     return vector
 
 
+def polygonize_footprint(img, vector, tolerance=None):
+    """Write the footprint of img's pixels equal to 1 to the shapefile vector.
+
+    A quick in-process alternative to vectorize, for when the footprint is
+    only used to find the tiles a mask covers:  The 8-connected regions of
+    1s are polygonized, unioned into one DN=1 feature, and simplified to
+    within tolerance (default one pixel) of their exact outline.
+    """
+    ds = gdal.Open(img)
+    band = ds.GetRasterBand(1)
+    if tolerance is None:
+        tolerance = abs(ds.GetGeoTransform()[1])
+    srs = osr.SpatialReference(ds.GetProjection())
+    mem = ogr.GetDriverByName('Memory').CreateDataSource('')
+    regions = mem.CreateLayer('regions', srs, ogr.wkbPolygon)
+    regions.CreateField(ogr.FieldDefn('DN', ogr.OFTInteger))
+    # the band is its own mask, so zeros aren't polygonized at all
+    gdal.Polygonize(band, band, regions, 0, ['8CONNECTED=8'])
+    footprint = ogr.Geometry(ogr.wkbMultiPolygon)
+    for feature in regions:
+        if feature.GetField('DN') == 1:
+            footprint.AddGeometry(feature.GetGeometryRef())
+    footprint = footprint.UnionCascaded().SimplifyPreserveTopology(tolerance)
+
+    out = ogr.GetDriverByName('ESRI Shapefile').CreateDataSource(vector)
+    layer = out.CreateLayer(os.path.splitext(os.path.basename(vector))[0],
+                            srs, ogr.wkbMultiPolygon)
+    layer.CreateField(ogr.FieldDefn('DN', ogr.OFTInteger))
+    feature = ogr.Feature(layer.GetLayerDefn())
+    feature.SetField('DN', 1)
+    feature.SetGeometry(ogr.ForceToMultiPolygon(footprint))
+    layer.CreateFeature(feature)
+    out = None # closing it writes it out
+    return vector
+
+
+def rastermask_footprint(rastermask, exact=False):
+    """Return the path to a shapefile of the given raster mask's footprint.
+
+    Footprints are cached under CACHE_DIR, keyed on the mask's path, size,
+    and modification time, so they're only made once per version of the
+    mask.  exact chooses vectorize's dissolved polygons over the quicker
+    polygonize_footprint.  The shapefile has the mask's basename.
+    """
+    rastermask = os.path.abspath(rastermask)
+    st = os.stat(rastermask)
+    key = hashlib.sha1(repr((rastermask, st.st_size, st.st_mtime, exact))).hexdigest()
+    base = os.path.splitext(os.path.basename(rastermask))[0] + '.shp'
+    cache_dir = cache_path('footprints')
+    final_dir = os.path.join(cache_dir, key)
+    if os.path.exists(final_dir):
+        return os.path.join(final_dir, base)
+    verbose_out('Vectorizing {}'.format(rastermask), 2)
+    with make_temp_dir(dir=cache_dir, prefix='footprint') as tmp_dir:
+        build_dir = mkdir(os.path.join(tmp_dir, key))
+        vectorize_fn = vectorize if exact else polygonize_footprint
+        vectorize_fn(rastermask, os.path.join(build_dir, base))
+        try:
+            os.rename(build_dir, final_dir) # shapefiles are several files
+        except OSError as e:
+            # fine if another process got there first
+            if e.errno not in (errno.EEXIST, errno.ENOTEMPTY):
+                raise
+    return os.path.join(final_dir, base)
+
+
+def build_vrt(filename, paths, resolution=None, separate=False, nodata=None):
+    """Build a VRT of the given rasters in-process, as gdalbuildvrt would.
+
+    resolution is an (x, y) pair of pixel sizes; otherwise the sources'
+    highest resolution is used.  separate puts each source in its own band.
+    nodata is used as both the sources' and the VRT's nodata value.
+    """
+    options = {'separate': separate}
+    if resolution is not None:
+        options.update(resolution='user', xRes=resolution[0], yRes=resolution[1])
+    if nodata is not None:
+        options.update(srcNodata=nodata, VRTNodata=nodata)
+    vrt = gdal.BuildVRT(filename, list(paths),
+                        options=gdal.BuildVRTOptions(**options))
+    if vrt is None:
+        raise IOError('Could not build VRT {} from {}'.format(filename, paths))
+    vrt = None # closing it writes it out
+    return filename
+
+
+def write_tiled_geotiff(src, filename, compress='DEFLATE', blocksize=256):
+    """Copy the raster at path src to a tiled, compressed GeoTIFF.
+
+    Georeferencing, nodata, band descriptions, and metadata are carried
+    over, as gdal_translate does.  Tiling lets windowed reads decode only
+    the blocks they touch, which matters most for sources without random
+    access, such as '/vsigzip/' paths.
+    """
+    options = gdal.TranslateOptions(format='GTiff', creationOptions=[
+        'TILED=YES', 'BLOCKXSIZE={}'.format(blocksize),
+        'BLOCKYSIZE={}'.format(blocksize), 'COMPRESS=' + compress,
+        'BIGTIFF=IF_SAFER'])
+    ds = gdal.Translate(filename, src, options=options)
+    if ds is None:
+        raise IOError('Could not write {} to {}'.format(src, filename))
+    ds = None # closing it writes it out
+    return filename
+
+
+_output_profile_defaults = {
+    'blocksize': 512,
+    'compress': 'DEFLATE',
+    'predictor': 'auto', # 2 for integers, 3 for floats; or None, 1, 2, 3
+    'overviews': None,   # eg [2, 4, 8], or 'auto'
+    'resampling': 'AVERAGE',
+    'cog': False,        # cloud-optimized layout:  overviews & IFDs first
+}
+
+
+def output_profile(driver=None, product=None):
+    """Return the GeoTIFF output profile for the driver's product.
+
+    The profile is settings.OUTPUT_PROFILE, updated key by key from
+    REPOS[driver]['output-profile'], and then from that dict's 'products'
+    entry for the product (or for its name up to the first '-', eg 'ref'
+    for 'ref-toa').  Unset keys get defaults.  Returns None if no profile
+    is configured, meaning files are kept as written.
+    """
+    profile = dict(getattr(settings(), 'OUTPUT_PROFILE', None) or {})
+    if driver is not None:
+        repo = settings().REPOS.get(driver.lower(), {})
+        driver_profile = dict(repo.get('output-profile', None) or {})
+        by_product = driver_profile.pop('products', {})
+        profile.update(driver_profile)
+        if product is not None:
+            profile.update(by_product.get(product,
+                           by_product.get(product.split('-')[0], {})))
+    if not profile:
+        return None
+    unknown = set(profile) - set(_output_profile_defaults)
+    if unknown:
+        raise ValueError('Unknown output profile settings: '
+                         + ', '.join(sorted(unknown)))
+    full_profile = dict(_output_profile_defaults)
+    full_profile.update(profile)
+    if full_profile['blocksize'] % 16:
+        raise ValueError('Output profile blocksize must be a multiple of 16,'
+                         ' not {}'.format(full_profile['blocksize']))
+    full_profile['compress'] = str(full_profile['compress']).upper()
+    return full_profile
+
+
+def apply_output_profile(filename, profile):
+    """Rewrite the GeoTIFF at filename in place to match the given profile.
+
+    profile is as returned by output_profile(); if it's None, or filename
+    is a symlink (eg into an asset) or not a GeoTIFF, the file is left as
+    is.  Georeferencing, nodata, and metadata are carried over.
+    """
+    if (profile is None or os.path.islink(filename)
+            or not filename.lower().endswith(('.tif', '.tiff'))):
+        return filename
+    src = gdal.Open(filename)
+    if src is None:
+        raise IOError('Could not open {} to apply output profile'.format(filename))
+    if src.GetDriver().ShortName != 'GTiff':
+        return filename
+    options = ['TILED=YES', 'BIGTIFF=IF_SAFER',
+               'BLOCKXSIZE={}'.format(profile['blocksize']),
+               'BLOCKYSIZE={}'.format(profile['blocksize']),
+               'COMPRESS=' + profile['compress']]
+    predictor = profile['predictor']
+    if predictor == 'auto':
+        floating = src.GetRasterBand(1).DataType in (
+            gdal.GDT_Float32, gdal.GDT_Float64)
+        predictor = (None if profile['compress'] not in ('DEFLATE', 'LZW', 'ZSTD', 'LZMA')
+                     else 3 if floating else 2)
+    if predictor:
+        options.append('PREDICTOR={}'.format(predictor))
+    levels = profile['overviews']
+    if levels == 'auto':
+        # halve until the whole image fits in a block or so
+        levels, size = [], max(src.RasterXSize, src.RasterYSize)
+        while size > profile['blocksize']:
+            size //= 2
+            levels.append(2 ** (len(levels) + 1))
+
+    with make_temp_dir(dir=os.path.dirname(os.path.abspath(filename)),
+                       prefix='profile') as tmp_dir:
+        tmp_fp = os.path.join(tmp_dir, 'tiled.tif')
+        dst = gdal.Translate(tmp_fp, src, options=gdal.TranslateOptions(
+            format='GTiff', creationOptions=options))
+        src = None
+        if dst is None:
+            raise IOError('Could not apply output profile to ' + filename)
+        if levels:
+            # internal overviews, compressed as the full-resolution image is
+            dst.BuildOverviews(profile['resampling'], list(levels))
+        dst = None
+        if profile['cog']:
+            # copy again so the overviews & IFDs precede the image data
+            cog_fp = os.path.join(tmp_dir, 'cog.tif')
+            dst = gdal.Translate(cog_fp, tmp_fp, options=gdal.TranslateOptions(
+                format='GTiff', creationOptions=options + ['COPY_SRC_OVERVIEWS=YES']))
+            if dst is None:
+                raise IOError('Could not write {} in COG layout'.format(filename))
+            dst, tmp_fp = None, cog_fp
+        os.rename(tmp_fp, filename)
+    return filename
+
+
+def process_images(pairs):
+    """Write each source GeoImage to its output GeoImage, band for band.
+
+    pairs is a sequence of (source, output) GeoImages.  Rather than one
+    pass per band per image, as source[b].Process(output[b]) would make,
+    images of the same size are written chunk by chunk, all bands of all
+    images at once, so source blocks shared between them, such as decoded
+    JPEG2000 tiles underlying a VRT, are still in GDAL's block cache when
+    read again.  Nodata, gain, and offset are handled as Process does.
+    """
+    by_size = OrderedDict()
+    for src, out in pairs:
+        by_size.setdefault((out.XSize(), out.YSize()), []).append((src, out))
+    for group in by_size.values():
+        for chunk in group[0][1].Chunks():
+            for src, out in group:
+                for b in range(out.NumBands()):
+                    arr = src[b].Read(chunk)
+                    arr[arr == src[b].NoDataValue()] = out[b].NoDataValue()
+                    out[b].Write(arr, chunk)
+
+
 def mosaic(images, outfile, vector):
     """ Mosaic multiple files together, but do not warp """
     nd = images[0][0].NoDataValue()
@@ -490,48 +842,83 @@ def mosaic(images, outfile, vector):
 
 
 def gridded_mosaic(images, outfile, rastermask, interpolation=0):
-    """ Mosaic multiple files to grid and mask specified in rastermask """
-    nd = images[0][0].NoDataValue()
-    mask_img = gippy.GeoImage(rastermask)
-    srs = mask_img.Projection()
-    filenames = [images[0].Filename()]
-    for f in range(1, images.NumImages()):
-        filenames.append(images[f].Filename())
+    """Mosaic multiple files to the grid of rastermask, masked by it.
 
-    imgout = gippy.GeoImage(outfile, mask_img,
-                            images[0].DataType(), images[0].NumBands())
-
-    imgout.SetNoData(nd)
-    #imgout.ColorTable(images[0])
-    nddata = np.empty((images[0].NumBands(),
-                       mask_img.YSize(), mask_img.XSize()))
-    nddata[:] = nd
-    imgout.Write(nddata)
-    imgout = None
-
-    # run warp command
-    resampler = ['near', 'bilinear', 'cubic']
-    cmd = "gdalwarp -t_srs '{}' -r {} {} {}".format(
-        srs,
-        resampler[interpolation],
-        " ".join(filenames),
-        outfile
-    )
-    status, output = commands.getstatusoutput(cmd)
-    verbose_out(' COMMAND: {}\n exit_status: {}\n output: {}'
-                .format(cmd, status, output ), 4)
+    Each source is warped in-process to the mask's grid as a virtual
+    raster, with multithreaded warping.  The output is then written in
+    strips of blocks, each warped, masked, and written once, so memory use
+    is bounded by gippy's chunk size and the output needs no nodata prefill.
+    """
+    nd = images[0][0].NoDataValue()
+    filenames = [images[i].Filename() for i in range(images.NumImages())]
+    mask_ds = gdal.Open(rastermask)
+    mask_band = mask_ds.GetRasterBand(1)
+    mask_nd = mask_band.GetNoDataValue()
+    xsize, ysize = mask_ds.RasterXSize, mask_ds.RasterYSize
+    x0, dx, _, y0, _, dy = mask_ds.GetGeoTransform()
+    bounds = (min(x0, x0 + dx * xsize), min(y0, y0 + dy * ysize),
+              max(x0, x0 + dx * xsize), max(y0, y0 + dy * ysize))
+    first = gdal.Open(filenames[0])
+    nbands = first.RasterCount
+    resampler = ['near', 'bilinear', 'cubic'][interpolation]
+    warp_options = gdal.WarpOptions(
+        format='VRT', dstSRS=mask_ds.GetProjection(), outputBounds=bounds,
+        width=xsize, height=ysize, resampleAlg=resampler, dstNodata=nd,
+        multithread=True, warpOptions=['NUM_THREADS=ALL_CPUS', 'INIT_DEST=NO_DATA'])
+
+    with make_temp_dir(dir=os.path.dirname(os.path.abspath(outfile)),
+                       prefix='gridded') as tmp_dir:
+        # one warped VRT per source, since a warped VRT can't have several;
+        # later sources go over earlier ones where they have data, as in gdalwarp
+        warped = []
+        for i, fn in enumerate(filenames):
+            vrt_fn = os.path.join(tmp_dir, '{}.vrt'.format(i))
+            vrt = gdal.Warp(vrt_fn, fn, options=warp_options)
+            if vrt is None:
+                raise IOError('Could not warp {} to the grid of {}'.format(fn, rastermask))
+            vrt = None # closing it writes it out
+            warped.append(vrt_fn)
+        src = gdal.Open(build_vrt(os.path.join(tmp_dir, 'mosaic.vrt'), warped, nodata=nd))
+
+        out = gdal.GetDriverByName('GTiff').Create(
+            outfile, xsize, ysize, nbands, first.GetRasterBand(1).DataType,
+            ['TILED=YES', 'BIGTIFF=IF_SAFER'])
+        if out is None:
+            raise IOError('Could not create ' + outfile)
+        out.SetGeoTransform(mask_ds.GetGeoTransform())
+        out.SetProjection(mask_ds.GetProjection())
+        out.SetMetadataItem('GIPS_GRIDDED_MOSAIC_SOURCES',
+                            ';'.join(os.path.basename(f) for f in filenames))
+        for b in range(1, nbands + 1):
+            src_band, out_band = first.GetRasterBand(b), out.GetRasterBand(b)
+            out_band.SetNoDataValue(nd)
+            out_band.SetDescription(src_band.GetDescription())
+            out_band.SetScale(src_band.GetScale() or 1.0)
+            out_band.SetOffset(src_band.GetOffset() or 0.0)
+            out_band.SetMetadata(src_band.GetMetadata())
+
+        # strips of whole blocks, about a chunk in size
+        block_rows = out.GetRasterBand(1).GetBlockSize()[1]
+        itemsize = gdal.GetDataTypeSize(first.GetRasterBand(1).DataType) // 8
+        chunk_rows = int(gippy.Options.ChunkSize() * 1024 ** 2
+                         // (xsize * nbands * max(itemsize, 1)))
+        chunk_rows = max(block_rows, chunk_rows // block_rows * block_rows)
+        for yoff in range(0, ysize, chunk_rows):
+            rows = min(chunk_rows, ysize - yoff)
+            data = src.ReadAsArray(0, yoff, xsize, rows)
+            if data.ndim == 2:
+                data = data[np.newaxis]
+            mask = mask_band.ReadAsArray(0, yoff, xsize, rows)
+            masked = mask == 0
+            if mask_nd is not None:
+                masked |= mask == mask_nd
+            for b in range(nbands):
+                data[b][masked] = nd
+                out.GetRasterBand(b + 1).WriteArray(data[b], 0, yoff)
+        src = out = None # closing the output writes it out
+    return outfile
 
-    imgout = gippy.GeoImage(outfile, True)
-    imgout.SetMeta(
-        'GIPS_GRIDDED_MOSAIC_SOURCES',
-        ';'.join([os.path.basename(f) for f in filenames])
-    )
-    for b in range(0, images[0].NumBands()):
-        imgout[b].CopyMeta(images[0][b])
-    imgout.AddMask(mask_img[0])
-    imgout.Process()
 
-    
 def julian_date(date_and_time, variant=None):
     """Returns the julian date for the given datetime object.
 
@@ -627,6 +1014,22 @@ def cli_error_handler(msg_prefix='Error', continuable=False):
             gips_exit()
 
 
+@contextmanager
+def collect_errors():
+    """Yield a list of the errors cli_error_handler accumulates in the context.
+
+    They're removed from the accumulated errors, so they don't count
+    toward gips_exit's report; this is for code that handles them itself.
+    """
+    start = len(_accumulated_errors)
+    errors = []
+    try:
+        yield errors
+    finally:
+        errors.extend(_accumulated_errors[start:])
+        del _accumulated_errors[start:]
+
+
 def gips_script_setup(driver_string=None, stop_on_error=False, setup_orm=True):
     """Run this at the beginning of a GIPS CLI program to do setup."""
     global _stop_on_error
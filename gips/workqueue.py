@@ -0,0 +1,305 @@
+#!/usr/bin/env python
+################################################################################
+#    GIPS: Geospatial Image Processing System
+#
+#    AUTHOR: Matthew Hanson
+#    EMAIL:  matt.a.hanson@gmail.com
+#
+#    Copyright (C) 2014-2018 Applied Geosolutions
+#
+#    This program is free software; you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation; either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program. If not, see <http://www.gnu.org/licenses/>
+################################################################################
+
+"""A queue of processing work in an SQLite file, for workers on many nodes.
+
+`gips_process --enqueue QUEUE` adds one unit of work per (tile, date), and
+`gips_worker QUEUE` processes units until none are left; run as many
+workers as wanted, on any nodes that can reach the file.  Units are claimed
+in a transaction, so each goes to one worker at a time.  Workers heartbeat
+while processing; a unit whose worker stops heartbeating for longer than
+the lease is given to another worker.  Failed units are retried after an
+exponentially growing delay, up to a limit.  `gips_worker QUEUE --status`
+reports progress & throughput.
+
+The file's directory must be on a filesystem with working POSIX locks for
+SQLite's sake; most local and NFSv4 filesystems qualify.
+"""
+
+import os
+import json
+import time
+import socket
+import sqlite3
+import datetime
+import threading
+import traceback
+from contextlib import contextmanager
+
+from gips import utils
+from gips import trace
+
+PENDING, RUNNING, DONE, FAILED = 'pending', 'running', 'done', 'failed'
+
+_schema = '''
+CREATE TABLE IF NOT EXISTS units (
+    id INTEGER PRIMARY KEY,
+    driver TEXT NOT NULL,
+    tile TEXT NOT NULL,
+    date TEXT NOT NULL,
+    products TEXT NOT NULL,
+    overwrite INTEGER NOT NULL DEFAULT 0,
+    state TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    worker TEXT,
+    not_before REAL NOT NULL DEFAULT 0,
+    claimed REAL,
+    heartbeat REAL,
+    finished REAL,
+    error TEXT,
+    UNIQUE (driver, tile, date, products)
+);
+CREATE INDEX IF NOT EXISTS units_state ON units (state, not_before);
+'''
+
+
+def worker_name():
+    """Identify this process across nodes, eg 'node7:1234'."""
+    return '{}:{}'.format(socket.gethostname(), os.getpid())
+
+
+class WorkQueue(object):
+    """A queue of (driver, tile, date, products) units of work in an SQLite file.
+
+    Each call uses its own connection, so a queue may be shared between
+    threads and forked processes.
+    """
+    def __init__(self, path, max_attempts=3, retry_delay=60.0):
+        self.path = os.path.abspath(path)
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        db = self._connect()
+        try:
+            db.executescript(_schema)
+        finally:
+            db.close()
+
+    def _connect(self):
+        db = sqlite3.connect(self.path, timeout=300, isolation_level=None)
+        db.row_factory = sqlite3.Row
+        return db
+
+    @contextmanager
+    def _transaction(self):
+        """Run statements on the yielded connection in one write transaction."""
+        db = self._connect()
+        try:
+            # take the write lock up front so claims can't interleave
+            db.execute('BEGIN IMMEDIATE')
+            try:
+                yield db
+            except BaseException:
+                db.execute('ROLLBACK')
+                raise
+            db.execute('COMMIT')
+        finally:
+            db.close()
+
+    def enqueue(self, driver, units, products, overwrite=False):
+        """Add units of work, given as (tile, date) pairs; return how many were new.
+
+        Units already in the queue are left as they are.
+        """
+        products = json.dumps(sorted(products))
+        with self._transaction() as db:
+            before = db.total_changes
+            db.executemany(
+                'INSERT OR IGNORE INTO units (driver, tile, date, products, overwrite)'
+                ' VALUES (?, ?, ?, ?, ?)',
+                [(driver, str(tile), date.strftime('%Y-%m-%d'), products, int(overwrite))
+                 for tile, date in units])
+            return db.total_changes - before
+
+    def _expire(self, db, now, lease):
+        """Requeue (or fail) units whose workers stopped heartbeating."""
+        for row in db.execute('SELECT id, attempts, worker FROM units WHERE state = ?'
+                              ' AND heartbeat < ?', (RUNNING, now - lease)).fetchall():
+            self._retry(db, row['id'], row['attempts'], now,
+                        'worker {} stopped heartbeating'.format(row['worker']))
+
+    def _retry(self, db, unit_id, attempts, now, error):
+        if attempts >= self.max_attempts:
+            db.execute('UPDATE units SET state = ?, finished = ?, error = ? WHERE id = ?',
+                       (FAILED, now, error, unit_id))
+        else:
+            delay = self.retry_delay * 2 ** (attempts - 1)
+            db.execute('UPDATE units SET state = ?, not_before = ?, error = ?, worker = NULL'
+                       ' WHERE id = ?', (PENDING, now + delay, error, unit_id))
+
+    def claim(self, worker, lease=300.0):
+        """Claim the next unit that's ready, returning it as a dict, or None."""
+        now = time.time()
+        with self._transaction() as db:
+            self._expire(db, now, lease)
+            row = db.execute('SELECT * FROM units WHERE state = ? AND not_before <= ?'
+                             ' ORDER BY id LIMIT 1', (PENDING, now)).fetchone()
+            if row is None:
+                return None
+            db.execute('UPDATE units SET state = ?, worker = ?, attempts = attempts + 1,'
+                       ' claimed = ?, heartbeat = ? WHERE id = ?',
+                       (RUNNING, worker, now, now, row['id']))
+        unit = dict(row)
+        unit.update(products=json.loads(unit['products']), worker=worker,
+                    attempts=unit['attempts'] + 1, overwrite=bool(unit['overwrite']),
+                    date=datetime.datetime.strptime(unit['date'], '%Y-%m-%d').date())
+        return unit
+
+    def heartbeat(self, unit):
+        """Note that the unit's worker is still at it; False if it lost the unit."""
+        with self._transaction() as db:
+            return db.execute('UPDATE units SET heartbeat = ? WHERE id = ? AND worker = ?'
+                              ' AND state = ?', (time.time(), unit['id'], unit['worker'],
+                                                 RUNNING)).rowcount == 1
+
+    def complete(self, unit):
+        with self._transaction() as db:
+            db.execute('UPDATE units SET state = ?, finished = ?, error = NULL'
+                       ' WHERE id = ? AND worker = ?',
+                       (DONE, time.time(), unit['id'], unit['worker']))
+
+    def fail(self, unit, error):
+        """Record a failed attempt; the unit is retried later unless out of attempts."""
+        with self._transaction() as db:
+            if db.execute('SELECT 1 FROM units WHERE id = ? AND worker = ? AND state = ?',
+                          (unit['id'], unit['worker'], RUNNING)).fetchone():
+                self._retry(db, unit['id'], unit['attempts'], time.time(), error)
+
+    def outstanding(self):
+        """Number of units that are pending or running."""
+        db = self._connect()
+        try:
+            return db.execute('SELECT COUNT(*) FROM units WHERE state IN (?, ?)',
+                              (PENDING, RUNNING)).fetchone()[0]
+        finally:
+            db.close()
+
+    def status(self, window=3600.0):
+        """Return a dict of counts by state, throughput, and failures.
+
+        'rate' is units finished per hour over the last window seconds,
+        and 'eta' the seconds until outstanding units are done at that rate.
+        """
+        now = time.time()
+        db = self._connect()
+        try:
+            counts = dict.fromkeys((PENDING, RUNNING, DONE, FAILED), 0)
+            counts.update(db.execute('SELECT state, COUNT(*) FROM units GROUP BY state'))
+            recent = db.execute('SELECT COUNT(*), MIN(claimed) FROM units WHERE state = ?'
+                                ' AND finished >= ?', (DONE, now - window)).fetchone()
+            workers = [r[0] for r in db.execute(
+                'SELECT DISTINCT worker FROM units WHERE state = ?', (RUNNING,))]
+            failures = [dict(r) for r in db.execute(
+                'SELECT driver, tile, date, attempts, error FROM units WHERE state = ?'
+                ' ORDER BY id', (FAILED,))]
+        finally:
+            db.close()
+        rate = None
+        if recent[0]:
+            elapsed = max(now - max(recent[1], now - window), 1.0)
+            rate = recent[0] / elapsed * 3600
+        outstanding = counts[PENDING] + counts[RUNNING]
+        return {'counts': counts, 'rate': rate, 'workers': workers, 'failures': failures,
+                'eta': outstanding / rate * 3600 if rate else None}
+
+
+class _Heartbeat(threading.Thread):
+    """Heartbeats for a unit in the background while it's processed."""
+    def __init__(self, queue, unit, interval):
+        super(_Heartbeat, self).__init__()
+        self.daemon = True
+        self.queue, self.unit, self.interval = queue, unit, interval
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            try:
+                if not self.queue.heartbeat(self.unit):
+                    utils.verbose_out('Lost the claim on unit {}'.format(self.unit['id']), 2)
+            except Exception as e:
+                # a missed heartbeat isn't fatal; the lease allows for a few
+                utils.report_error(e, 'Heartbeat failed', show_tb=False)
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stopped.set()
+        self.join()
+        return False
+
+
+_data_classes = {}
+
+def process_unit(unit):
+    """Process a unit of work as `gips_process <driver> -t <tile> -d <date>` would."""
+    driver = unit['driver']
+    if driver not in _data_classes:
+        _data_classes[driver] = utils.import_data_class(driver)
+    data = _data_classes[driver](unit['tile'], unit['date'])
+    with data.lock():
+        data.process(products=unit['products'], overwrite=unit['overwrite'])
+
+
+def work(queue, worker=None, max_units=None, lease=300.0, poll=10.0,
+         process=process_unit):
+    """Process units from the queue until it's exhausted or max_units are done.
+
+    While other workers' units are outstanding, waits for them, polling
+    every poll seconds, in case they fail and are retried.  A unit fails
+    if process raises, or if errors are reported to the CLI error handler
+    while it runs.  Returns the number of units processed, successfully
+    or not.
+    """
+    worker = worker or worker_name()
+    count = 0
+    while max_units is None or count < max_units:
+        unit = queue.claim(worker, lease)
+        if unit is None:
+            if queue.outstanding() == 0:
+                break
+            time.sleep(poll)
+            continue
+        desc = '{driver} {tile} {date}'.format(**unit)
+        utils.verbose_out('{}: processing {} (attempt {})'.format(
+            worker, desc, unit['attempts']), 2)
+        start = time.time()
+        with utils.collect_errors() as errors, _Heartbeat(queue, unit, lease / 3.0), \
+                trace.span('unit', driver=unit['driver'], tile=unit['tile'],
+                           date=unit['date'], attempt=unit['attempts']):
+            try:
+                process(unit)
+            except Exception as e:
+                # failures are recorded in the queue for retrying, whatever the error handler
+                e.msg_prefix = 'Error processing ' + desc
+                e.tb_text = traceback.format_exc()
+                utils.report_error(e, e.msg_prefix)
+                errors.append(e)
+        if errors:
+            queue.fail(unit, '; '.join('{}: {}'.format(e.msg_prefix, e) for e in errors))
+        else:
+            queue.complete(unit)
+        utils.verbose_out('{}: {} {} in {:.1f}s'.format(
+            worker, 'failed' if errors else 'finished', desc, time.time() - start), 2)
+        count += 1
+    return count
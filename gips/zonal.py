@@ -0,0 +1,363 @@
+#!/usr/bin/env python
+################################################################################
+#    GIPS: Geospatial Image Processing System
+#
+#    AUTHOR: Matthew Hanson
+#    EMAIL:  matt.a.hanson@gmail.com
+#
+#    Copyright (C) 2014-2018 Applied Geosolutions
+#
+#    This program is free software; you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation; either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program. If not, see <http://www.gnu.org/licenses/>
+################################################################################
+
+"""Statistics of product values within features, read straight from the archive.
+
+Rather than writing a mosaic per feature per date and computing stats of
+each, features are rasterized once per tile grid into label images, each
+pixel labeled with the feature covering it; features that overlap go in
+separate label images.  Each product file is then read once, in chunks of
+rows spanning the features, and the values of all features are reduced at
+once by label (numpy.bincount & friends).  Label images are cached under
+CACHE_DIR, keyed by the features & grid, for reuse by later runs.  Where
+tiles overlap, each feature is clipped so the overlap is read from one
+tile only.
+"""
+
+import os
+import json
+import math
+import hashlib
+
+import numpy
+from osgeo import gdal, ogr, osr
+from shapely.wkt import loads
+
+from gips import utils
+from gips import trace
+from gips.core import SpatialExtent, TemporalExtent
+from gips.inventory import DataInventory
+
+COLUMNS = ('id', 'date', 'product', 'band', 'count', 'mean', 'std', 'min', 'max')
+
+
+def read_features(fname, key='', where=''):
+    """Read a polygon layer; return (ids, OGR geometries, SRS as WKT).
+
+    ids are the values of the key attribute, or the feature IDs if key
+    is empty.
+    """
+    v = utils.open_vector(fname)
+    shp = ogr.Open(v.Filename())
+    layer = shp.GetLayer(v.LayerName()) if v.LayerName() else shp.GetLayer(0)
+    if where:
+        layer.SetAttributeFilter(where)
+    ids, geometries = [], []
+    layer.ResetReading()
+    feat = layer.GetNextFeature()
+    while feat is not None:
+        ids.append(feat.GetField(key) if key else feat.GetFID())
+        geometries.append(feat.GetGeometryRef().Clone())
+        feat = layer.GetNextFeature()
+    return ids, geometries, layer.GetSpatialRef().ExportToWkt()
+
+
+def transform_geometries(geometries, src_wkt, dst_wkt):
+    """Return shapely copies of OGR geometries, transformed to dst_wkt."""
+    trans = osr.CoordinateTransformation(osr.SpatialReference(src_wkt),
+                                         osr.SpatialReference(dst_wkt))
+    shapes = []
+    for g in geometries:
+        g = g.Clone()
+        g.Transform(trans)
+        shapes.append(loads(g.ExportToWkt()))
+    return shapes
+
+
+def features_by_tile(repository, shapes, tiles=None):
+    """Assign the parts of shapes to the driver's tiles (or the given ones).
+
+    Returns {tile: (indices of shapes, the shapes clipped to the tile)}.
+    Each shape is clipped to its tile's footprint less those of the tiles
+    before it, so where tiles overlap, each part of a shape goes to just
+    one of them.  shapes must be in the SRS of the driver's tiles vector.
+    """
+    _, geometries = repository.tile_geometries()
+    bounds = numpy.array([s.bounds for s in shapes]).reshape(-1, 4)
+    groups = {}
+    assigned = None # union of the footprints of tiles so far
+    for tile, geom in geometries.items():
+        if tiles is not None and tile not in tiles:
+            continue
+        xmin, ymin, xmax, ymax = geom.bounds
+        candidates = numpy.flatnonzero(
+            (bounds[:, 0] <= xmax) & (bounds[:, 2] >= xmin)
+            & (bounds[:, 1] <= ymax) & (bounds[:, 3] >= ymin))
+        footprint = geom if assigned is None else geom.difference(assigned)
+        assigned = geom if assigned is None else assigned.union(geom)
+        inside, clipped = [], []
+        for i in candidates:
+            if not footprint.intersects(shapes[i]):
+                continue
+            part = shapes[i].intersection(footprint)
+            if part.geom_type not in ('Polygon', 'MultiPolygon'):
+                part = part.buffer(0) # drop slivers of lines & points left by clipping
+            if part.area > 0:
+                inside.append(i)
+                clipped.append(part)
+        if inside:
+            groups[tile] = (numpy.array(inside), clipped)
+    return groups
+
+
+def partition(shapes):
+    """Split shapes into groups in which no two overlap; return lists of indices.
+
+    Shapes that merely touch may share a group, as they share no pixels.
+    """
+    groups, group_bounds = [], []
+    for i, shape in enumerate(shapes):
+        b = shape.bounds
+        for group, gb in zip(groups, group_bounds):
+            overlapping = [j for j, o in zip(group, gb)
+                           if o[0] < b[2] and o[2] > b[0] and o[1] < b[3] and o[3] > b[1]]
+            if not any(shape.intersection(shapes[j]).area > 0 for j in overlapping):
+                group.append(i)
+                gb.append(b)
+                break
+        else:
+            groups.append([i])
+            group_bounds.append([b])
+    return groups
+
+
+def grid_window(bounds, geotransform, xsize, ysize):
+    """Return the (x, y, columns, rows) window of a grid covering bounds.
+
+    bounds is (xmin, ymin, xmax, ymax) in the grid's SRS; rotated grids
+    get the whole grid.
+    """
+    x0, dx, rx, y0, ry, dy = geotransform
+    if rx or ry:
+        return (0, 0, xsize, ysize)
+    cols = sorted([(bounds[0] - x0) / dx, (bounds[2] - x0) / dx])
+    rows = sorted([(bounds[1] - y0) / dy, (bounds[3] - y0) / dy])
+    c0, c1 = max(int(math.floor(cols[0])), 0), min(int(math.ceil(cols[1])), xsize)
+    r0, r1 = max(int(math.floor(rows[0])), 0), min(int(math.ceil(rows[1])), ysize)
+    return (c0, r0, max(c1 - c0, 0), max(r1 - r0, 0))
+
+
+class LabelImages(object):
+    """Label images of features, one set per tile & raster grid, cached on disk.
+
+    groups is as returned by features_by_tile, with shapes in the SRS
+    srs.  Labels are the features' indices plus one; 0 is unlabeled.
+    """
+    def __init__(self, site, key, where, groups, srs, all_touched=False):
+        self.groups = groups
+        self.srs = srs
+        self.all_touched = all_touched
+        self._source = [os.path.abspath(site) if os.path.exists(site) else site,
+                        os.path.getmtime(site) if os.path.exists(site) else None,
+                        key, where, all_touched]
+        self._grids = {}
+
+    def _cache_file(self, grid, tile):
+        indices, shapes = self.groups[tile]
+        clipped = hashlib.sha1('\n'.join(s.wkt for s in shapes)).hexdigest()
+        key = json.dumps(self._source + [grid, tile, indices.tolist(), clipped], default=str)
+        return os.path.join(utils.cache_path('zonal'),
+                            hashlib.sha1(key).hexdigest() + '.npz')
+
+    def get(self, ds, tile):
+        """Return (label images, window) for the tile's features on ds's grid.
+
+        window is (x, y, columns, rows), the part of the grid the features
+        cover; the label images are of that window.
+        """
+        grid = (ds.GetGeoTransform(), ds.RasterXSize, ds.RasterYSize, ds.GetProjection())
+        cache_key = (grid, tile)
+        if cache_key not in self._grids:
+            cache_fn = self._cache_file(grid, tile)
+            if os.path.exists(cache_fn):
+                with numpy.load(cache_fn) as npz:
+                    self._grids[cache_key] = (list(npz['labels']),
+                                              tuple(int(v) for v in npz['window']))
+            else:
+                indices, shapes = self.groups[tile]
+                with trace.span('rasterize', features=len(indices)):
+                    labels, window = self._rasterize(grid, indices, shapes)
+                tmp_fn = cache_fn + '.{}.tmp.npz'.format(os.getpid())
+                numpy.savez_compressed(tmp_fn, labels=numpy.array(labels, dtype='int32'),
+                                       window=numpy.array(window))
+                os.rename(tmp_fn, cache_fn)
+                self._grids[cache_key] = (labels, window)
+        return self._grids[cache_key]
+
+    def _rasterize(self, grid, indices, shapes):
+        geotransform, xsize, ysize, wkt = grid
+        shapes = transform_geometries([ogr.CreateGeometryFromWkt(s.wkt) for s in shapes],
+                                      self.srs, wkt)
+        # only the window the features cover is rasterized
+        bounds = numpy.array([s.bounds for s in shapes])
+        x, y, cols, rows = grid_window(
+            (bounds[:, 0].min(), bounds[:, 1].min(), bounds[:, 2].max(), bounds[:, 3].max()),
+            geotransform, xsize, ysize)
+        if cols == 0 or rows == 0:
+            return [], (0, 0, 0, 0)
+        x0, dx, rx, y0, ry, dy = geotransform
+        srs = osr.SpatialReference(wkt)
+        images = []
+        labeled = numpy.zeros((rows, cols), bool)
+        for group in partition(shapes):
+            mem = ogr.GetDriverByName('Memory').CreateDataSource('labels')
+            layer = mem.CreateLayer('labels', srs, ogr.wkbUnknown)
+            layer.CreateField(ogr.FieldDefn('label', ogr.OFTInteger))
+            for i in group:
+                feat = ogr.Feature(layer.GetLayerDefn())
+                feat.SetField('label', int(indices[i]) + 1)
+                feat.SetGeometry(ogr.CreateGeometryFromWkt(shapes[i].wkt))
+                layer.CreateFeature(feat)
+            img = gdal.GetDriverByName('MEM').Create('', cols, rows, 1, gdal.GDT_Int32)
+            img.SetGeoTransform((x0 + x * dx + y * rx, dx, rx, y0 + x * ry + y * dy, ry, dy))
+            img.SetProjection(wkt)
+            options = ['ATTRIBUTE=label']
+            if self.all_touched:
+                options.append('ALL_TOUCHED=TRUE')
+            gdal.RasterizeLayer(img, [1], layer, options=options)
+            images.append(img.ReadAsArray())
+            labeled |= images[-1] > 0
+        # crop to the labeled pixels, so only those rows & columns are read
+        ys, xs = numpy.flatnonzero(labeled.any(1)), numpy.flatnonzero(labeled.any(0))
+        if len(ys) == 0:
+            return [], (0, 0, 0, 0)
+        r0, r1, c0, c1 = ys[0], ys[-1] + 1, xs[0], xs[-1] + 1
+        return ([img[r0:r1, c0:c1] for img in images],
+                (int(x + c0), int(y + r0), int(c1 - c0), int(r1 - r0)))
+
+
+class ZonalStats(object):
+    """Accumulates per-feature statistics, keyed by (date, product, band).
+
+    Sums, sums of squares, counts, minima, & maxima are kept per label;
+    values themselves are kept only if percentiles are wanted.
+    """
+    def __init__(self, nfeatures, percentiles=()):
+        self.size = nfeatures + 1 # label 0 is unlabeled
+        self.percentiles = list(percentiles)
+        self.stats = {}
+
+    def add(self, key, labels, values):
+        """Add values, labeled by feature, to the statistics under key."""
+        if key not in self.stats:
+            n = self.size
+            self.stats[key] = {
+                'count': numpy.zeros(n, 'int64'), 'sum': numpy.zeros(n),
+                'sumsq': numpy.zeros(n), 'min': numpy.full(n, numpy.inf),
+                'max': numpy.full(n, -numpy.inf), 'values': {}}
+        s = self.stats[key]
+        if len(labels) == 0:
+            return
+        s['count'] += numpy.bincount(labels, minlength=self.size)
+        s['sum'] += numpy.bincount(labels, values, minlength=self.size)
+        s['sumsq'] += numpy.bincount(labels, values * values, minlength=self.size)
+        order = numpy.argsort(labels, kind='mergesort')
+        labels, values = labels[order], values[order]
+        present, starts = numpy.unique(labels, return_index=True)
+        s['min'][present] = numpy.minimum(s['min'][present],
+                                          numpy.minimum.reduceat(values, starts))
+        s['max'][present] = numpy.maximum(s['max'][present],
+                                          numpy.maximum.reduceat(values, starts))
+        if self.percentiles:
+            for label, part in zip(present, numpy.split(values, starts[1:])):
+                s['values'].setdefault(label, []).append(part)
+
+    def rows(self, ids):
+        """Return a row of COLUMNS, then percentiles, per feature & key with values."""
+        rows = []
+        for key in sorted(self.stats):
+            s = self.stats[key]
+            for label in numpy.flatnonzero(s['count']):
+                n = s['count'][label]
+                mean = s['sum'][label] / n
+                std = numpy.sqrt(max(s['sumsq'][label] / n - mean * mean, 0.0))
+                row = [ids[label - 1]] + list(key) + [
+                    int(n), mean, std, s['min'][label], s['max'][label]]
+                if self.percentiles:
+                    row.extend(numpy.percentile(numpy.concatenate(s['values'][label]),
+                                                self.percentiles))
+                rows.append(tuple(row))
+        return rows
+
+
+def accumulate(stats, ds, labels, window, key_prefix, chunk_rows=256):
+    """Add the values of each band of ds within window to stats, a chunk of rows at a time."""
+    x, y, xsize, ysize = window
+    for b in range(ds.RasterCount):
+        band = ds.GetRasterBand(b + 1)
+        key = key_prefix + (band.GetDescription() or str(b + 1),)
+        nodata = band.GetNoDataValue()
+        for r in range(0, ysize, chunk_rows):
+            nrows = min(chunk_rows, ysize - r)
+            arr = band.ReadAsArray(x, y + r, xsize, nrows).astype('float64')
+            valid = ~numpy.isnan(arr)
+            if nodata is not None:
+                valid &= arr != nodata
+            for label_img in labels:
+                lab = label_img[r:r + nrows]
+                sel = valid & (lab > 0)
+                stats.add(key, lab[sel], arr[sel])
+
+
+def zonal_stats(dataclass, site, products=None, dates=None, days=None, key='',
+                where='', tiles=None, percentiles=(), all_touched=False):
+    """Compute statistics of products within each feature of site.
+
+    site is a polygon layer (file or db, as for --site), with key naming
+    its ID attribute and where filtering its features; dates & days are
+    as for TemporalExtent, and tiles optionally limits which tiles are
+    read.  Products must already be processed.  Returns rows of COLUMNS
+    followed by the given percentiles, one per feature, date, product, &
+    band.  Where tiles overlap, their shared pixels are counted from one
+    tile only.
+    """
+    ids, geometries, srs = read_features(site, key, where)
+    tiles_srs, _ = dataclass.Asset.Repository.tile_geometries()
+    if tiles is not None:
+        tiles = [dataclass.normalize_tile_string(t) for t in tiles]
+    groups = features_by_tile(dataclass.Asset.Repository,
+                              transform_geometries(geometries, srs, tiles_srs), tiles)
+    utils.verbose_out('{} of {} features intersect {} tiles'.format(
+        len(set(i for g, _ in groups.values() for i in g)), len(ids), len(groups)), 2)
+    stats = ZonalStats(len(ids), percentiles)
+    if not groups:
+        return []
+    inv = DataInventory(dataclass, SpatialExtent(dataclass, tiles=groups.keys()),
+                        TemporalExtent(dates, days), products)
+    wanted = set(inv.products.products)
+    label_images = LabelImages(site, key, where, groups, tiles_srs, all_touched)
+    for date in inv.dates:
+        for tile, data in inv[date].tiles.items():
+            if tile not in groups:
+                continue
+            for (sensor, product), fn in sorted(data.filenames.items()):
+                if product not in wanted:
+                    continue
+                with utils.error_handler('Error computing zonal stats for ' + fn, continuable=True), \
+                        trace.span('zonal', date=date, tile=tile, product=product):
+                    ds = gdal.Open(fn)
+                    if ds is None:
+                        raise IOError('Could not open ' + fn)
+                    labels, window = label_images.get(ds, tile)
+                    accumulate(stats, ds, labels, window, (date, product))
+    return stats.rows(ids)